@@ -1,62 +1,149 @@
-import datetime
+import io
 import numpy as np
 import pandas as pd
 import hvplot.pandas
 import statsmodels.api as sm
 import panel as pn
+from ols_grid import fit_subset, grid_residuals, stack_models, grid_statistics, compact_result, compact_html
+from range_index import get_index, window_bounds, index_gram
+from rolling_ols import rolling_ols
+from panel_plots import zoomable_plot, rasterized_plot
+from dataset_version import dataset_version
+from result_cache import fit_cache, summary_cache, query_key, cached
+from resample_cache import get_pyramid, frequency_column
+from column_store import dataset_exists, write_dataset, load_dataset, dataset_frame, active_dataset, set_active
+from ingest import ingest_file
+from timing import stage, start_request, finish_request
+from metrics import serve_metrics
 
 pn.extension()
 
-# Sample time series dataset (dummy data)
-np.random.seed(0)
-dates = pd.date_range('2020-01-01', periods=100, freq='D')
-data = pd.DataFrame({
-   'date': dates,
-   'JXX1': np.random.randn(100).cumsum(),
-   'JXX2': np.random.randn(100).cumsum(),
-   'BXX1': np.random.randn(100).cumsum(),
-   'BXX2': np.random.randn(100).cumsum()
-})
+# Expose timings of the runs for Prometheus if METRICS_PORT is set
+serve_metrics()
 
-# Function to perform regression and plot errors
-def perform_regression(dependent_var, predictors, start_date, end_date, frequency, string_param):
-    df = data.set_index('date')
-    df = df.loc[start_date:end_date]
+# Slot of the columnar store holding this app's data; uploads repoint it
+DATASET = 'proxy_sample'
+
+# Sample time series dataset (dummy data), mapped from the columnar store
+if not dataset_exists('proxy_sample'):
+    np.random.seed(0)
+    dates = pd.date_range('2020-01-01', periods=100, freq='D')
+    sample = pd.DataFrame({
+       'date': dates,
+       'JXX1': np.random.randn(100).cumsum(),
+       'JXX2': np.random.randn(100).cumsum(),
+       'BXX1': np.random.randn(100).cumsum(),
+       'BXX2': np.random.randn(100).cumsum()
+    })
+    write_dataset('proxy_sample', sample, date_column='date')
+data_source = load_dataset(active_dataset(DATASET))
+data = dataset_frame(data_source)
+version = dataset_version(data_source)
+
+# Daily regressions use the raw data, coarser ones the cached pyramid level where
+# every predictor is already resampled and as-of joined onto the daily dates. Either comes with
+# the prefix sums of the query's columns, shared by every session, so any date window is fitted
+# without rescanning its rows
+def frequency_frame(dependent_var, columns, frequency):
+    if frequency == 'daily':
+        return get_index(data, data_source['name'], version, [dependent_var] + columns)
+    level = get_pyramid(data, version)['levels'][frequency]
+    return get_index(level, f"{data_source['name']}@{frequency}", version, [dependent_var] + columns)
 
-    y = df[dependent_var]
-    X = df[predictors]
-    X = sm.add_constant(X)
+# Function to fit the regression of one query
+def fit_regression(dependent_var, predictors, start_date, end_date, frequency):
+    columns = [frequency_column(column, frequency) for column in predictors]
+    frame, frame_index = frequency_frame(dependent_var, columns, frequency)
 
-    model = sm.OLS(y, X).fit()
-    predictions = model.predict(X)
+    # Window cross-products come from two lookups into the prefix-sum index
+    df_start, df_stop = window_bounds(frame_index, start_date, end_date)
+    gram = index_gram(frame_index, df_start, df_stop)
+    grid = stack_models([fit_subset(gram, dependent_var, columns)])
 
-    residuals = y - predictions
+    # Residuals still need the rows of the window
+    df = frame.iloc[df_start:df_stop].set_index('date')
+    grid = grid_statistics(df, grid)
+    terms = ['const'] + columns
+    residuals = pd.Series(grid_residuals(df, grid)[:, 0], index=df.index)
 
     # Prepare results
     results = {
-        'R-squared': model.rsquared,
-        'Coefficients': model.params,
-        'P-values': model.pvalues,
+        'R-squared': grid['rsquared'][0],
+        'Coefficients': pd.Series(grid['params'][0], index=terms),
+        'P-values': pd.Series(grid['pvalues'][0], index=terms),
         'Residuals': residuals,
-        'Summary': model.summary().as_html()
+        'Summary': compact_html(compact_result(grid, 0))
     }
 
-    # Plot errors
-    error_plot = residuals.hvplot(title="Residuals Plot", ylabel="Residuals")
+    return results
+
+# Function to perform regression and plot errors
+def perform_regression(dependent_var, predictors, start_date, end_date, frequency, string_param, rasterize=False):
+    # Repeated queries on the same data reuse the fit; the plot is rebuilt so every session gets its own streams
+    key = query_key('regression', dependent_var, predictors, start_date, end_date, frequency)
+    results = cached(fit_cache, version, key, lambda: fit_regression(dependent_var, predictors, start_date, end_date, frequency))
+    residuals = results['Residuals']
+
+    # Plot errors, downsampled or rasterized on the server so long series stay light in the browser
+    with stage('plot'):
+        if rasterize:
+            error_plot = rasterized_plot(residuals, title="Residuals Plot", ylabel="Residuals")
+        else:
+            error_plot = zoomable_plot(residuals, title="Residuals Plot", ylabel="Residuals")
 
     return results, error_plot
 
+# Full statsmodels summary of one query, fitted only on request since it costs far more than the compact table
+def full_summary(dependent_var, predictors, start_date, end_date, frequency):
+    def fit_summary():
+        columns = [frequency_column(column, frequency) for column in predictors]
+        frame, frame_index = frequency_frame(dependent_var, columns, frequency)
+        df_start, df_stop = window_bounds(frame_index, start_date, end_date)
+        df = frame.iloc[df_start:df_stop].set_index('date')
+        model = sm.OLS(df[dependent_var], sm.add_constant(df[columns])).fit()
+        return model.summary().as_html()
+
+    key = query_key('full_summary', dependent_var, predictors, start_date, end_date, frequency)
+    return cached(summary_cache, version, key, fit_summary)
+
+# Function to track coefficients, t-stats and R-squared over rolling or expanding windows
+def perform_rolling_regression(dependent_var, predictors, start_date, end_date, frequency, window):
+    def fit_rolling():
+        columns = [frequency_column(column, frequency) for column in predictors]
+        frame, frame_index = frequency_frame(dependent_var, columns, frequency)
+        df_start, df_stop = window_bounds(frame_index, start_date, end_date)
+        df = frame.iloc[df_start:df_stop].set_index('date')
+
+        # Each window is reached from the previous one by adding and removing single rows
+        return rolling_ols(df, dependent_var, columns, window=window)
+
+    key = query_key('rolling', dependent_var, predictors, start_date, end_date, frequency, window)
+    rolling = cached(fit_cache, version, key, fit_rolling)
+
+    # One row per window, so long ranges are downsampled like the residuals before reaching the browser
+    return (
+        zoomable_plot(rolling['params'], title="Rolling Coefficients", ylabel="Coefficient")
+        + zoomable_plot(rolling['tvalues'], title="Rolling t-stats", ylabel="t-stat")
+        + zoomable_plot(rolling['rsquared'], title="Rolling R-squared", ylabel="R-squared")
+    ).cols(1)
+
 # Widgets for user inputs
-dependent_var = pn.widgets.Select(name='Dependent Variable', options=['JXX1', 'JXX2', 'BXX1', 'BXX2'], sizing_mode='stretch_width')
-start_date = pn.widgets.DatePicker(name='Start Date', value=datetime.date(2020, 1, 1), sizing_mode='stretch_width')
-end_date = pn.widgets.DatePicker(name='End Date', value=datetime.date(2020, 4, 9), sizing_mode='stretch_width')
+columns = [column for column in data.columns if column != 'date']
+upload = pn.widgets.FileInput(accept='.csv,.parquet', sizing_mode='stretch_width')
+dependent_var = pn.widgets.Select(name='Dependent Variable', options=columns, sizing_mode='stretch_width')
+start_date = pn.widgets.DatePicker(name='Start Date', value=data['date'].iloc[0].date(), sizing_mode='stretch_width')
+end_date = pn.widgets.DatePicker(name='End Date', value=data['date'].iloc[-1].date(), sizing_mode='stretch_width')
+regression_mode = pn.widgets.Select(name='Mode', options=['Full Window', 'Rolling', 'Expanding'], sizing_mode='stretch_width')
+rolling_window = pn.widgets.IntInput(name='Rolling Window (rows)', value=20, start=5, sizing_mode='stretch_width')
+rasterize_plots = pn.widgets.Checkbox(name='Rasterize Plots on Server')
+show_full_summary = pn.widgets.Checkbox(name='Full statsmodels Summary')
 
 # Independent variable specific parameters
 independent_vars = []
 
 def add_independent_variable(event=None):
     new_variable = {
-        'predictors': pn.widgets.MultiChoice(name='Predictors', options=['JXX1', 'JXX2', 'BXX1', 'BXX2'], sizing_mode='stretch_width'),
+        'predictors': pn.widgets.MultiChoice(name='Predictors', options=columns, sizing_mode='stretch_width'),
         'frequency': pn.widgets.Select(name='Frequency', options=['Daily', 'Weekly', 'Monthly'], sizing_mode='stretch_width'),
         'string_param': pn.widgets.TextInput(name='String Parameter', sizing_mode='stretch_width'),
         'delete_button': pn.widgets.Button(name='Delete', button_type='danger', sizing_mode='stretch_width')
@@ -76,10 +163,17 @@ def update_input_page():
     # Input widgets
     input_widgets = [
         pn.pane.Markdown("## Time Series Regression Input", sizing_mode='stretch_width'),
+        upload,
         pn.Row(
             dependent_var,
             start_date,
             end_date
+        ),
+        pn.Row(
+            regression_mode,
+            rolling_window,
+            rasterize_plots,
+            show_full_summary
         )
     ]
 
@@ -108,7 +202,11 @@ def update_input_page():
 def run_regression(event):
     global output_stats, output_figure
 
+    start_request()
     try:
+        with stage('refresh'):
+            refresh_data()
+
         # Perform regression for each independent variable
         all_results = {}
         all_plots = []
@@ -117,9 +215,20 @@ def run_regression(event):
             frequency = var['frequency'].value.lower()
             string_param = var['string_param'].value
 
-            results, plot = perform_regression(dependent_var.value, predictors, start_date.value, end_date.value,
-                                               frequency, string_param)
-            all_results[var['predictors'].value[0]] = results['Summary']
+            with stage('regression'):
+                results, plot = perform_regression(dependent_var.value, predictors, start_date.value, end_date.value,
+                                                   frequency, string_param, rasterize_plots.value)
+            if show_full_summary.value:
+                with stage('summary_html'):
+                    all_results[var['predictors'].value[0]] = full_summary(dependent_var.value, predictors, start_date.value, end_date.value, frequency)
+            else:
+                all_results[var['predictors'].value[0]] = results['Summary']
+
+            # Add the coefficient paths below the residuals in the rolling and expanding modes
+            if regression_mode.value != 'Full Window':
+                window = rolling_window.value if regression_mode.value == 'Rolling' else None
+                with stage('rolling'):
+                    plot = (plot + perform_rolling_regression(dependent_var.value, predictors, start_date.value, end_date.value, frequency, window)).cols(1)
             all_plots.append(plot)
 
         # Update outputs
@@ -131,6 +240,45 @@ def run_regression(event):
     except Exception as e:
         output_stats.object = f"Error: {str(e)}"
         output_figure.object = None
+    finish_request('proxy')
+
+# Swap in an uploaded CSV or Parquet file; every predictor selector is refilled with its columns
+def use_dataset(dataset):
+    global data, data_source, version, columns
+    data_source = dataset
+    data = dataset_frame(dataset)
+    version = dataset_version(dataset)
+
+    columns = [column for column in data.columns if column != 'date']
+    dependent_var.options = columns
+    for var in independent_vars:
+        var['predictors'].value = []
+        var['predictors'].options = columns
+    start_date.value = data['date'].iloc[0].date()
+    end_date.value = data['date'].iloc[-1].date()
+
+def load_upload(event):
+    try:
+        name = ingest_file(io.BytesIO(upload.value), upload.filename, DATASET, as_column=True)
+    except ValueError as e:
+        output_stats.object = f"Error: {str(e)}"
+        return
+    set_active(DATASET, name)
+    use_dataset(load_dataset(name))
+
+# Follow the stored dataset between runs: new rows are folded into the prefix sums by
+# sync_index, and the pyramid is rebuilt for the new version on first use
+def refresh_data():
+    global data, data_source, version
+    dataset = load_dataset(active_dataset(DATASET))
+    if dataset['name'] != data_source['name']:
+        use_dataset(dataset)
+    elif dataset is not data_source:
+        data_source = dataset
+        data = dataset_frame(dataset)
+        version = dataset_version(dataset)
+
+upload.param.watch(load_upload, 'value')
 
 update_input_page()
 
@@ -0,0 +1,84 @@
+import numpy as np
+from statsmodels.tsa.adfvalues import mackinnonp
+
+
+def default_maxlag(nobs):
+    """Schwert's rule, capped the same way adfuller caps it for a constant-only regression"""
+    return min(nobs // 2 - 2, int(np.ceil(12.0 * np.power(nobs / 100.0, 1 / 4.0))))
+
+
+def lagged_design(series, lag, nobs):
+    """Stacked ADF regressions [const, level, lagged differences] over the last nobs differences"""
+    diff = np.diff(series, axis=1)
+    columns = [np.ones((series.shape[0], nobs)), series[:, -nobs - 1:-1]]
+    columns += [diff[:, -nobs - j:-j] for j in range(1, lag + 1)]
+    return np.stack(columns, axis=2), diff[:, -nobs:]
+
+
+def stacked_ols(exog, endog):
+    """Solve one least-squares problem per series through a batched QR factorization"""
+    q, r = np.linalg.qr(exog)
+    params = np.linalg.solve(r, np.einsum('mtk,mt->mk', q, endog)[..., None])[..., 0]
+    ssr = np.sum((endog - np.einsum('mtk,mk->mt', exog, params)) ** 2, axis=1)
+    r_inv = np.linalg.inv(r)
+    cov_diag = np.sum(r_inv ** 2, axis=2)
+    return params, ssr, cov_diag
+
+
+def adf_rows(series, maxlag=None, autolag='AIC'):
+    """ADF statistic, MacKinnon p-value and used lag for every row of series"""
+    length = series.shape[1]
+    if maxlag is None:
+        maxlag = default_maxlag(length)
+    usedlag = np.full(series.shape[0], maxlag)
+
+    if autolag is not None:
+        # Compare every lag order on the same sample, as adfuller does, so the criteria are comparable.
+        # The regressors of lag p are the first p + 2 columns of the maxlag design, so every
+        # candidate is solved from leading sub-blocks of one cross-product matrix per series
+        nobs = length - 1 - maxlag
+        exog, endog = lagged_design(series, maxlag, nobs)
+        xtx = np.einsum('mti,mtj->mij', exog, exog)
+        xty = np.einsum('mti,mt->mi', exog, endog)
+        yty = np.einsum('mt,mt->m', endog, endog)
+        criteria = []
+        for lag in range(maxlag + 1):
+            k = lag + 2
+            params = np.linalg.solve(xtx[:, :k, :k], xty[:, :k, None])[..., 0]
+            ssr = yty - np.einsum('mk,mk->m', params, xty[:, :k])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                llf = -nobs / 2.0 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+            penalty = 2 * k if autolag.lower() == 'aic' else np.log(nobs) * k
+            criteria.append(-2 * llf + penalty)
+        usedlag = np.argmin(np.array(criteria), axis=0)
+
+    # Refit each group of series sharing a lag order on its full available sample
+    statistics = np.empty(series.shape[0])
+    for lag in np.unique(usedlag):
+        rows = usedlag == lag
+        nobs = length - 1 - lag
+        exog, endog = lagged_design(series[rows], lag, nobs)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            params, ssr, cov_diag = stacked_ols(exog, endog)
+            scale = ssr / (nobs - exog.shape[2])
+            statistics[rows] = params[:, 1] / np.sqrt(scale * cov_diag[:, 1])
+
+    pvalues = np.array([mackinnonp(statistic, regression='c', N=1) for statistic in statistics])
+    return statistics, pvalues, usedlag
+
+
+def adf_batch(series, maxlag=None, autolag='AIC'):
+    """ADF statistic, MacKinnon p-value and used lag for every column of series"""
+    series = np.asarray(series, dtype=float).T
+    statistics = np.full(series.shape[0], np.nan)
+    pvalues = np.full(series.shape[0], np.nan)
+    usedlag = np.full(series.shape[0], -1)
+
+    # adfuller rejects constant input and series too short for its default lag, so those series are
+    # reported as untestable instead of failing the batch
+    valid = np.ptp(series, axis=1) > 0
+    if maxlag is None and default_maxlag(series.shape[1]) < 0:
+        valid[:] = False
+    if valid.any():
+        statistics[valid], pvalues[valid], usedlag[valid] = adf_rows(series[valid], maxlag, autolag)
+    return statistics, pvalues, usedlag
@@ -1,26 +1,31 @@
-from flask import Flask, request, render_template_string, redirect, url_for
+from flask import Flask, Response, request, render_template_string, redirect, url_for
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
 import matplotlib
-import matplotlib.pyplot as plt
-import io
 import base64
+from chart_render import render_chart
+from column_store import dataset_exists, write_dataset, load_dataset, dataset_frame
+from timing import stage, start_request, finish_request
+from metrics import METRICS_CONTENT_TYPE, metrics_text
 
 # Set the matplotlib backend to 'Agg' to avoid GUI issues
 matplotlib.use('Agg')
 
 app = Flask(__name__)
 
-# Example DataFrame
-data = pd.DataFrame({
-    'date': pd.date_range(start='2020-01-01', periods=100, freq='D'),
-    'y': np.random.randn(100),
-    'x1': np.random.randn(100),
-    'x2': np.random.randn(100),
-    'x3': np.random.randn(100)
-})
-data.set_index('date', inplace=True)
+# Example DataFrame, kept in the shared columnar store
+if not dataset_exists('sample'):
+    sample = pd.DataFrame({
+        'date': pd.date_range(start='2020-01-01', periods=100, freq='D'),
+        'y': np.random.randn(100),
+        'x1': np.random.randn(100),
+        'x2': np.random.randn(100),
+        'x3': np.random.randn(100)
+    })
+    sample.set_index('date', inplace=True)
+    write_dataset('sample', sample)
+data = dataset_frame(load_dataset('sample'))
 
 # HTML templates as strings
 index_html = """
@@ -125,6 +130,19 @@ result_html = """
 </html>
 """
 
+@app.before_request
+def start_timing():
+    start_request()
+
+@app.after_request
+def add_server_timing(response):
+    response.headers['Server-Timing'] = finish_request(request.url_rule.rule if request.url_rule else 'unmatched')
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_text(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/')
 def index():
     return render_template_string(index_html)
@@ -145,48 +163,33 @@ def result():
     adf_pstat = request.form.get('adf_pstat')
     
     # Filter data based on selected time period
-    filtered_data = data[start_date:end_date]
+    with stage('slice'):
+        filtered_data = data[start_date:end_date]
 
-    # Prepare data for regression
-    X = filtered_data[ind_vars]
-    y = filtered_data[dep_var]
-    X = sm.add_constant(X)  # Add constant term for intercept
+        # Prepare data for regression
+        X = filtered_data[ind_vars]
+        y = filtered_data[dep_var]
+        X = sm.add_constant(X)  # Add constant term for intercept
 
     # Perform regression analysis
-    model = sm.OLS(y, X).fit()
-    predictions = model.predict(X)
-    residuals = y - predictions
+    with stage('ols'):
+        model = sm.OLS(y, X).fit()
+        predictions = model.predict(X)
+        residuals = y - predictions
 
     # Generate summary statistics
-    summary = model.summary().as_html()
-
-    # Plot errors
-    fig1, ax1 = plt.subplots()
-    ax1.plot(filtered_data.index, residuals)
-    ax1.set_title('Residuals over Time')
-    ax1.set_xlabel('Date')
-    ax1.set_ylabel('Residuals')
-    buf1 = io.BytesIO()
-    plt.savefig(buf1, format='png')
-    buf1.seek(0)
-    residuals_plot_data = base64.b64encode(buf1.getvalue()).decode('utf-8')
-    buf1.close()
+    with stage('summary_html'):
+        summary = model.summary().as_html()
 
-    # Plot predictions vs actual values
-    fig2, ax2 = plt.subplots()
-    ax2.plot(filtered_data.index, y, label='Actual')
-    ax2.plot(filtered_data.index, predictions, label='Predicted')
-    ax2.set_title('Actual vs Predicted')
-    ax2.set_xlabel('Date')
-    ax2.set_ylabel(dep_var)
-    ax2.legend()
-    buf2 = io.BytesIO()
-    plt.savefig(buf2, format='png')
-    buf2.seek(0)
-    predictions_plot_data = base64.b64encode(buf2.getvalue()).decode('utf-8')
-    buf2.close()
+    # Plot errors and predictions vs actual values on pooled canvases
+    residuals_png = render_chart('residuals', filtered_data.index, residuals)
+    predictions_png = render_chart('predictions', filtered_data.index, y, predictions, dep_var)
+    with stage('base64'):
+        residuals_plot_data = base64.b64encode(residuals_png).decode('utf-8')
+        predictions_plot_data = base64.b64encode(predictions_png).decode('utf-8')
     
-    return render_template_string(result_html, summary=summary, residuals_plot_data=residuals_plot_data, predictions_plot_data=predictions_plot_data)
+    with stage('render'):
+        return render_template_string(result_html, summary=summary, residuals_plot_data=residuals_plot_data, predictions_plot_data=predictions_plot_data)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,26 +1,46 @@
-from flask import Flask, request, render_template_string, redirect, url_for
+from flask import Flask, Response, abort, jsonify, request, render_template_string, stream_with_context, redirect, url_for
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
 import matplotlib
-import matplotlib.pyplot as plt
-import io
-import base64
+from chart_render import CHART_CACHE_CONTROL, chart_key, chart_url, model_chart
+from dataset_version import dataset_version
+from result_cache import fit_cache, chart_cache, summary_cache, query_key, cached
+from fit_store import stored
+from single_flight import single_flight
+from grid_jobs import MAX_JOB_MODELS, submit_job, job_status, job_results, cancel_job
+from ols_grid import request_grid, fit_grid, grid_statistics, compact_result, filter_threshold, screen_models
+from column_store import dataset_exists, write_dataset, load_dataset, dataset_frame, active_dataset, set_active, append_rows
+from ingest import ingest_file
+from append_refit import refresh_grids
+from timing import stage, start_request, finish_request
+from metrics import METRICS_CONTENT_TYPE, metrics_text
 
 # Set the matplotlib backend to 'Agg' to avoid GUI issues
 matplotlib.use('Agg')
 
 app = Flask(__name__)
 
-# Example DataFrame
-data = pd.DataFrame({
-    'date': pd.date_range(start='2020-01-01', periods=100, freq='D'),
-    'y': np.random.randn(100),
-    'x1': np.random.randn(100),
-    'x2': np.random.randn(100),
-    'x3': np.random.randn(100)
-})
-data.set_index('date', inplace=True)
+# Dataset slot served by this app; uploads point it at a newly ingested dataset
+DATASET = 'sample'
+
+# Ask reverse proxies to pass streamed chunks straight through
+STREAM_HEADERS = {'X-Accel-Buffering': 'no'}
+
+# Example DataFrame; workers map the stored columns instead of holding private copies
+if not dataset_exists('sample'):
+    sample = pd.DataFrame({
+        'date': pd.date_range(start='2020-01-01', periods=100, freq='D'),
+        'y': np.random.randn(100),
+        'x1': np.random.randn(100),
+        'x2': np.random.randn(100),
+        'x3': np.random.randn(100)
+    })
+    sample.set_index('date', inplace=True)
+    write_dataset('sample', sample)
+data_source = load_dataset(active_dataset(DATASET))
+data = dataset_frame(data_source)
+version = dataset_version(data_source)
 
 # HTML templates as strings
 index_html = """
@@ -50,18 +70,18 @@ index_html = """
             <div class="form-group">
                 <label for="dependent">Dependent Variable:</label>
                 <select id="dependent" name="dependent" class="form-control">
-                    <option value="y">y</option>
-                    <option value="x1">x1</option>
-                    <option value="x2">x2</option>
-                    <option value="x3">x3</option>
+                    <option value="">All columns</option>
+                    {% for column in columns %}
+                        <option value="{{ column }}">{{ column }}</option>
+                    {% endfor %}
                 </select>
             </div>
             <div class="form-group">
                 <label for="independents">Independent Variables:</label>
                 <select id="independents" name="independents[]" class="form-control" multiple>
-                    <option value="x1">x1</option>
-                    <option value="x2">x2</option>
-                    <option value="x3">x3</option>
+                    {% for column in columns[1:] %}
+                        <option value="{{ column }}">{{ column }}</option>
+                    {% endfor %}
                 </select>
             </div>
             <div class="form-group">
@@ -94,15 +114,30 @@ index_html = """
                     <input type="text" id="adf_pstat" name="adf_pstat" class="form-control">
                 </div>
             </div>
+            <div class="form-group form-check">
+                <input type="checkbox" class="form-check-input" id="stream" name="stream" checked>
+                <label class="form-check-label" for="stream">Show Models as They Finish</label>
+            </div>
             <button type="submit" class="btn btn-primary">Run Regression</button>
         </form>
+        <form action="/upload" method="POST" enctype="multipart/form-data" class="mt-5">
+            <div class="form-group">
+                <label for="file">Upload Data (CSV or Parquet):</label>
+                <input type="file" id="file" name="file" class="form-control-file" accept=".csv,.parquet" required>
+            </div>
+            <div class="form-group">
+                <label for="date_column">Date Column:</label>
+                <input type="text" id="date_column" name="date_column" class="form-control" value="date">
+            </div>
+            <button type="submit" class="btn btn-secondary">Upload</button>
+        </form>
     </div>
 </body>
 </html>
 """
 
-# HTML template as string
-result_html = """
+# Result page in three parts, so a streamed response can send each model block as it is ready
+result_head_html = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -113,27 +148,153 @@ result_html = """
 <body>
     <div class="container mt-5">
         <h1 class="mb-4">Regression Results</h1>
-        {% for result in results %}
+"""
+
+model_html = """
             <div class="mb-5">
-                <h2>Model {{ loop.index }}</h2>
-                <div>
-                    {{ result.summary | safe }}
-                </div>
+                <h2>Model {{ index }}</h2>
+                <table class="table table-sm">
+                    <thead>
+                        <tr><th>{{ result.stats.dependent }}</th><th>coef</th><th>std err</th><th>t</th><th>P&gt;|t|</th></tr>
+                    </thead>
+                    <tbody>
+                        {% for name, coef, bse, tvalue, pvalue in result.stats.terms %}
+                            <tr><td>{{ name }}</td><td>{{ '%.4f' | format(coef) }}</td><td>{{ '%.4f' | format(bse) }}</td><td>{{ '%.3f' | format(tvalue) }}</td><td>{{ '%.3f' | format(pvalue) }}</td></tr>
+                        {% endfor %}
+                    </tbody>
+                </table>
+                <p>
+                    No. Observations: {{ result.stats.nobs }} |
+                    R-squared: {{ '%.3f' | format(result.stats.rsquared) }} |
+                    Adj. R-squared: {{ '%.3f' | format(result.stats.rsquared_adj) }} |
+                    F-statistic: {{ '%.3f' | format(result.stats.fvalue) }} (Prob {{ '%.3g' | format(result.stats.f_pvalue) }}) |
+                    Durbin-Watson: {{ '%.3f' | format(result.stats.durbin_watson) }}
+                </p>
+                <a href="{{ result.summary_url }}">Full summary</a>
                 <h3 class="mt-4">Residuals Plot</h3>
-                <img src="data:image/png;base64,{{ result.residuals_plot_data }}" alt="Residuals Plot" class="img-fluid">
+                <a href="{{ result.residuals_full_url }}"><img src="{{ result.residuals_url }}" alt="Residuals Plot" class="img-fluid" loading="lazy"></a>
                 <h3 class="mt-4">Actual vs Predicted</h3>
-                <img src="data:image/png;base64,{{ result.predictions_plot_data }}" alt="Predictions Plot" class="img-fluid">
+                <a href="{{ result.predictions_full_url }}"><img src="{{ result.predictions_url }}" alt="Predictions Plot" class="img-fluid" loading="lazy"></a>
             </div>
-        {% endfor %}
+"""
+
+error_html = """
+            <div class="alert alert-danger">{{ message }}</div>
+"""
+
+result_tail_html = """
         <a href="{{ url_for('index') }}" class="btn btn-primary mt-4">Back to Form</a>
     </div>
 </body>
 </html>
 """
 
+result_html = (result_head_html + "{% for result in results %}{% set index = loop.index %}" + model_html
+               + "{% endfor %}" + result_tail_html)
+
+# Streamed pages render the same blocks many times, so their templates are compiled once
+result_head_template = app.jinja_env.from_string(result_head_html)
+model_template = app.jinja_env.from_string(model_html)
+error_template = app.jinja_env.from_string(error_html)
+result_tail_template = app.jinja_env.from_string(result_tail_html)
+
+summary_html = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Model Summary</title>
+    <link href="https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css" rel="stylesheet">
+</head>
+<body>
+    <div class="container mt-5">
+        <h1 class="mb-4">Model Summary</h1>
+        <div>
+            {{ summary | safe }}
+        </div>
+        <a href="{{ url_for('index') }}" class="btn btn-primary mt-4">Back to Form</a>
+    </div>
+</body>
+</html>
+"""
+
+@app.before_request
+def start_timing():
+    start_request()
+
+@app.after_request
+def add_server_timing(response):
+    # Per-stage durations of this request, readable in the browser's network panel
+    response.headers['Server-Timing'] = finish_request(request.url_rule.rule if request.url_rule else 'unmatched')
+    return response
+
+@app.before_request
+def refresh_data():
+    # Pick up a dataset uploaded through any worker, or rows appended to it
+    global data, data_source, version
+    dataset = load_dataset(active_dataset(DATASET))
+    if dataset is not data_source:
+        data_source = dataset
+        data = dataset_frame(dataset)
+        version = dataset_version(dataset)
+
 @app.route('/')
 def index():
-    return render_template_string(index_html)
+    return render_template_string(index_html, columns=list(data.columns))
+
+@app.route('/upload', methods=['POST'])
+def upload():
+    upload_file = request.files.get('file')
+    if upload_file is None or not upload_file.filename:
+        abort(400)
+
+    # The file is parsed in chunks straight into the columnar store, then every worker switches to it
+    try:
+        name = ingest_file(upload_file.stream, upload_file.filename, DATASET, request.form.get('date_column') or 'date')
+    except ValueError as error:
+        abort(400, str(error))
+    set_active(DATASET, name)
+    return redirect(url_for('index'))
+
+def model_entry(grid, i, version, start_date, end_date):
+    """Statistics and chart links of model i of the grid, as shown in one result block"""
+    dep_var = grid['dependent'][i]
+    ind_var = grid['predictors'][i]
+    # Full statsmodels summary is only built when the user opens this model
+    summary_url = url_for('summary', **{
+        'dependent': dep_var,
+        'independents[]': ind_var,
+        'start_date': start_date,
+        'end_date': end_date
+    })
+
+    return {
+        'stats': compact_result(grid, i),
+        'summary_url': summary_url,
+
+        # Charts are rendered only when the browser requests these URLs
+        'residuals_url': chart_url(version, 'residuals', dep_var, ind_var, start_date, end_date),
+        'predictions_url': chart_url(version, 'predictions', dep_var, ind_var, start_date, end_date),
+
+        # Downsampled charts link to their full-resolution versions
+        'residuals_full_url': chart_url(version, 'residuals', dep_var, ind_var, start_date, end_date, full=True),
+        'predictions_full_url': chart_url(version, 'predictions', dep_var, ind_var, start_date, end_date, full=True)
+    }
+
+@app.route('/append', methods=['POST'])
+def append():
+    payload = request.get_json(silent=True) or {}
+    rows = pd.DataFrame(payload.get('rows') or [])
+    old_data, old_version = data, version
+    try:
+        append_rows(data_source['name'], rows, date_column='date')
+    except (KeyError, ValueError) as error:
+        abort(400, str(error))
+    refresh_data()
+
+    # Saved grids take in only the rows that joined their window and report which models changed
+    grids = refresh_grids(old_data, data, old_version, version)
+    return jsonify({'rows_added': len(rows), 'rows': len(data), 'grids': grids})
 
 @app.route('/result', methods=['POST'])
 def result():
@@ -142,68 +303,199 @@ def result():
     ind_vars = request.form.getlist('independents[]')
     start_date = request.form.get('start_date')
     end_date = request.form.get('end_date')
+    stream = 'stream' in request.form
     
     # Get filter parameters
     add_filters = 'add_filters' in request.form
-    p_stat = request.form.get('p_stat')
-    error_std = request.form.get('error_std')
-    max_error = request.form.get('max_error')
-    adf_pstat = request.form.get('adf_pstat')
+    try:
+        p_stat = filter_threshold(request.form.get('p_stat'))
+        error_std = filter_threshold(request.form.get('error_std'))
+        max_error = filter_threshold(request.form.get('max_error'))
+        adf_pstat = filter_threshold(request.form.get('adf_pstat'))
+    except ValueError as error:
+        abort(400, str(error))
     
     # Filter data based on selected time period
-    filtered_data = data[start_date:end_date]
-
-    results = []
-
-    # Loop through each combination of dependent and independent variables
-    for dep_var in ['y', 'x1', 'x2', 'x3']:
-        for ind_var in [['x1'], ['x2'], ['x3'], ['x1', 'x2'], ['x1', 'x3'], ['x2', 'x3'], ['x1', 'x2', 'x3']]:
-            X = filtered_data[ind_var]
-            y = filtered_data[dep_var]
-            X = sm.add_constant(X)  # Add constant term for intercept
-
-            # Perform regression analysis
-            model = sm.OLS(y, X).fit()
-            predictions = model.predict(X)
-            residuals = y - predictions
-
-            # Generate summary statistics
-            summary = model.summary().as_html()
-
-            # Plot errors
-            fig1, ax1 = plt.subplots()
-            ax1.plot(filtered_data.index, residuals)
-            ax1.set_title('Residuals over Time')
-            ax1.set_xlabel('Date')
-            ax1.set_ylabel('Residuals')
-            buf1 = io.BytesIO()
-            plt.savefig(buf1, format='png')
-            buf1.seek(0)
-            residuals_plot_data = base64.b64encode(buf1.getvalue()).decode('utf-8')
-            buf1.close()
-
-            # Plot predictions vs actual values
-            fig2, ax2 = plt.subplots()
-            ax2.plot(filtered_data.index, y, label='Actual')
-            ax2.plot(filtered_data.index, predictions, label='Predicted')
-            ax2.set_title('Actual vs Predicted')
-            ax2.set_xlabel('Date')
-            ax2.set_ylabel(dep_var)
-            ax2.legend()
-            buf2 = io.BytesIO()
-            plt.savefig(buf2, format='png')
-            buf2.seek(0)
-            predictions_plot_data = base64.b64encode(buf2.getvalue()).decode('utf-8')
-            buf2.close()
-
-            # Append result for this model
-            results.append({
-                'summary': summary,
-                'residuals_plot_data': residuals_plot_data,
-                'predictions_plot_data': predictions_plot_data
-            })
-
-    return render_template_string(result_html, results=results)
+    with stage('slice'):
+        filtered_data = data[start_date:end_date]
+
+    # The selected dependent and predictors span the grid, kept small enough for one page
+    try:
+        dep_vars, ind_combinations = request_grid(data.columns, dep_var, ind_vars)
+    except ValueError as error:
+        abort(400, str(error))
+
+    def fit_statistics():
+        with stage('ols'):
+            grid = fit_grid(filtered_data, dep_vars, ind_combinations)
+        with stage('statistics'):
+            return grid_statistics(filtered_data, grid)
+
+    def fit():
+        # Fit every combination of dependent and independent variables from one shared cross-product matrix
+        # Repeated queries on the same data reuse the fitted grid, from memory or from the store shared by all workers
+        grid_key = query_key('grid', dep_vars, ind_combinations, start_date, end_date)
+        with stage('fit'):
+            return cached(fit_cache, version, grid_key, lambda: stored(version, grid_key, fit_statistics))
+
+    def screened_models():
+        grid = fit()
+
+        # Apply the filters on the cheap statistics so only surviving models are plotted
+        with stage('screen'):
+            if add_filters:
+                survivors = screen_models(filtered_data, grid, p_stat, error_std, max_error, adf_pstat)
+            else:
+                survivors = range(len(grid['dependent']))
+            return grid, list(survivors)
+
+    # Identical concurrent requests, streamed or not, wait on one computation instead of each running their own
+    request_key = query_key('result', version, dep_vars, ind_combinations, start_date, end_date,
+                            add_filters and [p_stat, error_std, max_error, adf_pstat])
+
+    def stream_results():
+        yield result_head_template.render()
+        try:
+            grid, survivors = single_flight(request_key, screened_models)
+        except TimeoutError:
+            # The status line is already sent, so failures are reported in the page
+            yield error_template.render(message='Timed out waiting for an identical request; reload the page to try again.')
+        except Exception:
+            app.logger.exception('result page failed after streaming began')
+            yield error_template.render(message='The models could not be fitted.')
+        else:
+            for index, i in enumerate(survivors, 1):
+                with stage('render'):
+                    block = model_template.render(index=index, result=model_entry(grid, i, version, start_date, end_date))
+                yield block
+        yield result_tail_template.render()
+
+    # The page header is sent at once and each model block as soon as it is ready
+    if stream:
+        return Response(stream_with_context(stream_results()), headers=STREAM_HEADERS)
+
+    try:
+        grid, survivors = single_flight(request_key, screened_models)
+    except TimeoutError:
+        abort(503)
+
+    with stage('render'):
+        results = [model_entry(grid, i, version, start_date, end_date) for i in survivors]
+        return render_template_string(result_html, results=results)
+
+@app.route('/summary')
+def summary():
+    dep_var = request.args.get('dependent')
+    ind_vars = request.args.getlist('independents[]')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    # Fit the single requested model with statsmodels for its full summary
+    def fit_summary():
+        with stage('slice'):
+            filtered_data = data[start_date:end_date]
+        with stage('ols'):
+            X = sm.add_constant(filtered_data[ind_vars])  # Add constant term for intercept
+            model = sm.OLS(filtered_data[dep_var], X).fit()
+        with stage('summary_html'):
+            return model.summary().as_html()
+
+    summary_key = query_key('summary', dep_var, ind_vars, start_date, end_date)
+    try:
+        summary_table = cached(summary_cache, version, summary_key, fit_summary)
+    except ValueError as error:
+        # statsmodels cannot summarise a window too short for its residual tests
+        abort(400, str(error))
+    except TimeoutError:
+        # Another request is still fitting this summary
+        abort(503)
+
+    with stage('render'):
+        return render_template_string(summary_html, summary=summary_table)
+
+@app.route('/chart/<key>.png')
+def chart(key):
+    chart_type = request.args.get('chart')
+    dep_var = request.args.get('dependent')
+    ind_vars = request.args.getlist('independents[]')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    full = request.args.get('full') == '1'
+
+    # The key must match the current data, so a cached URL never shows a stale chart
+    if chart_key(version, chart_type, dep_var, ind_vars, start_date, end_date, full) != key:
+        abort(404)
+    headers = {'ETag': f'"{key}"', 'Cache-Control': CHART_CACHE_CONTROL}
+    if key in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    # Rendered PNGs are kept in memory, so repeat requests without a browser cache skip the fit and the draw
+    with stage('slice'):
+        filtered_data = data[start_date:end_date]
+    try:
+        image = cached(chart_cache, version, key, lambda: model_chart(filtered_data, chart_type, dep_var, ind_vars, full))
+    except TimeoutError:
+        # Another request is still drawing this chart
+        abort(503)
+    return Response(image, mimetype='image/png', headers=headers)
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_text(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/jobs', methods=['POST'])
+def submit():
+    start_date = request.form.get('start_date')
+    end_date = request.form.get('end_date')
+    try:
+        priority = int(request.form.get('priority') or 0)
+        max_predictors = int(request.form.get('max_predictors') or 3)
+    except ValueError:
+        abort(400, 'priority and max_predictors must be integers')
+    filters = None
+    if 'add_filters' in request.form:
+        try:
+            filters = {name: filter_threshold(request.form.get(name)) for name in ('p_stat', 'error_std', 'max_error', 'adf_pstat')}
+        except ValueError as error:
+            abort(400, str(error))
+
+    # The grid is spanned by the form's selection like a result page, with room for many more models
+    try:
+        dep_vars, ind_combinations = request_grid(data.columns, request.form.get('dependent'), request.form.getlist('independents[]'),
+                                                  max_predictors, MAX_JOB_MODELS)
+    except ValueError as error:
+        abort(400, str(error))
+
+    # The grid runs on the job worker pool; the client polls for progress and results instead of waiting
+    job_id = submit_job(data[start_date:end_date], dep_vars, ind_combinations, filters, priority)
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('job', job_id=job_id),
+        'results_url': url_for('partial_results', job_id=job_id),
+        'cancel_url': url_for('cancel', job_id=job_id)
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job(job_id):
+    status = job_status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/results')
+def partial_results(job_id):
+    # Results of finished chunks, from offset on, so clients can page through them while the job runs
+    results = job_results(job_id, request.args.get('offset', 0, type=int))
+    if results is None:
+        abort(404)
+    return jsonify(results)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel(job_id):
+    status = cancel_job(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
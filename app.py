@@ -1,21 +1,46 @@
-from flask import Flask, request, render_template
+from flask import Flask, Response, request, render_template
 import io
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
+from dataset_version import dataset_version
+from result_cache import fit_cache, query_key, cached
+from fit_store import stored
+from column_store import dataset_exists, write_dataset, load_dataset, dataset_frame
+from timing import stage, start_request, finish_request
+from metrics import METRICS_CONTENT_TYPE, metrics_text
 
 app = Flask(__name__)
 
-# Example DataFrame
-data = pd.DataFrame({
-    'date': pd.date_range(start='2020-01-01', periods=100, freq='D'),
-    'y': np.random.randn(100),
-    'x1': np.random.randn(100),
-    'x2': np.random.randn(100),
-    'x3': np.random.randn(100)
-})
-data.set_index('date', inplace=True)
+# Example DataFrame, written once to the columnar store so every worker maps the same files
+if not dataset_exists('sample'):
+    sample = pd.DataFrame({
+        'date': pd.date_range(start='2020-01-01', periods=100, freq='D'),
+        'y': np.random.randn(100),
+        'x1': np.random.randn(100),
+        'x2': np.random.randn(100),
+        'x3': np.random.randn(100)
+    })
+    sample.set_index('date', inplace=True)
+    write_dataset('sample', sample)
+data_source = load_dataset('sample')
+data = dataset_frame(data_source)
+version = dataset_version(data_source)
+
+# Every response reports its stage durations in a Server-Timing header
+@app.before_request
+def start_timing():
+    start_request()
+
+@app.after_request
+def add_server_timing(response):
+    response.headers['Server-Timing'] = finish_request(request.url_rule.rule if request.url_rule else 'unmatched')
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_text(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/')
 def index():
@@ -29,35 +54,48 @@ def process():
     start_date = request.form['start_date']
     end_date = request.form['end_date']
     
-    # Filter data based on selected time period
-    filtered_data = data[start_date:end_date]
+    def analyse():
+        # Filter data based on selected time period
+        with stage('slice'):
+            filtered_data = data[start_date:end_date]
     
-    # Prepare data for regression
-    X = filtered_data[ind_vars]
-    y = filtered_data[dep_var]
-    X = sm.add_constant(X)  # Add constant term for intercept
-
-    # Perform regression analysis
-    model = sm.OLS(y, X).fit()
-    predictions = model.predict(X)
-    residuals = y - predictions
-
-    # Generate summary statistics
-    summary = model.summary().as_text()
-
-    # Plot errors
-    fig, ax = plt.subplots()
-    ax.plot(filtered_data.index, residuals)
-    ax.set_title('Residuals over Time')
-    ax.set_xlabel('Date')
-    ax.set_ylabel('Residuals')
+            # Prepare data for regression
+            X = filtered_data[ind_vars]
+            y = filtered_data[dep_var]
+            X = sm.add_constant(X)  # Add constant term for intercept
+
+        # Perform regression analysis
+        with stage('ols'):
+            model = sm.OLS(y, X).fit()
+            predictions = model.predict(X)
+            residuals = y - predictions
+
+        # Generate summary statistics
+        with stage('summary_text'):
+            summary = model.summary().as_text()
+
+        # Plot errors
+        fig, ax = plt.subplots()
+        ax.plot(filtered_data.index, residuals)
+        ax.set_title('Residuals over Time')
+        ax.set_xlabel('Date')
+        ax.set_ylabel('Residuals')
     
-    # Save figure to a BytesIO object
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
+        # Save figure to a BytesIO object
+        img = io.BytesIO()
+        with stage('savefig'):
+            plt.savefig(img, format='png')
+        img.seek(0)
     
-    return render_template('result.html', summary=summary, img_data=img.getvalue().hex())
+        # The PNG is kept as an array so the store writes it to the compressed array file, not its index
+        return {'summary': summary, 'img': np.frombuffer(img.getvalue(), dtype=np.uint8)}
+
+    # The same query on the same data is answered from memory, or from the store shared by all workers
+    key = query_key('process', dep_var, ind_vars, start_date, end_date)
+    analysis = cached(fit_cache, version, key, lambda: stored(version, key, analyse))
+
+    with stage('render'):
+        return render_template('result.html', summary=analysis['summary'], img_data=analysis['img'].tobytes().hex())
 
 if __name__ == '__main__':
     app.run(debug=True)
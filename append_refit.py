@@ -0,0 +1,68 @@
+import json
+import numpy as np
+from ols_grid import grid_gram, merge_gram, refit_grid, grid_statistics
+from result_cache import fit_cache, cache_entries, seed_cache
+from fit_store import version_queries, load_fit, save_fit
+
+# Relative change of a coefficient below which a refitted model counts as unchanged
+CHANGE_TOLERANCE = 1e-9
+
+
+def extend_grid(grid, window, added):
+    """Grid refitted after the rows of added joined its window, or None if it kept no cross-product matrix"""
+    gram = grid_gram(grid)
+    if gram is None:
+        return None
+    gram = merge_gram(gram, added[gram['columns']].to_numpy(dtype=float))
+
+    # Coefficients come from the updated matrix alone; residual diagnostics still need the window's rows
+    return grid_statistics(window, refit_grid(grid, gram))
+
+
+def changed_models(old, new):
+    """Numbers of the models, counted from 1, whose coefficients moved"""
+    return [i + 1 for i, (before, after) in enumerate(zip(old['params'], new['params']))
+            if np.abs(after - before).max() > CHANGE_TOLERANCE * np.abs(before).max()]
+
+
+def refresh_grids(old_data, new_data, old_version, new_version):
+    """Carry the stored and cached grids of old_version over to new_version, the same data with rows appended
+
+    Grids whose date window ends before the new rows are carried over unchanged; the others are updated
+    with only the rows that joined their window. Other kinds of results are recomputed on demand. Returns
+    one report per grid listing the models whose coefficients changed.
+    """
+    memory = dict(cache_entries(fit_cache, old_version))
+    carried = []
+    report = []
+    for query in sorted(set(memory) | set(version_queries(old_version))):
+        # Grids are cached under query_key('grid', dep_vars, ind_combinations, start_date, end_date)
+        parts = json.loads(query)
+        if parts[0] != 'grid':
+            continue
+        start_date, end_date = parts[3], parts[4]
+        grid = memory[query] if query in memory else load_fit(old_version, query)
+        if grid is None:
+            continue
+
+        old_window = old_data[start_date:end_date]
+        window = new_data[start_date:end_date]
+        changed = []
+        if len(window) > len(old_window):
+            refit = extend_grid(grid, window, window.iloc[len(old_window):])
+            if refit is None:
+                continue
+            changed = changed_models(grid, refit)
+            grid = refit
+
+        save_fit(new_version, query, grid)
+        carried.append((query, grid))
+        report.append({
+            'start_date': start_date,
+            'end_date': end_date,
+            'rows_added': len(window) - len(old_window),
+            'models': len(grid['dependent']),
+            'changed_models': changed
+        })
+    seed_cache(fit_cache, new_version, carried)
+    return report
@@ -0,0 +1,309 @@
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+import numpy as np
+import pandas as pd
+
+# Synthetic data: rows of the series, columns including the dependent 'y', and the largest predictor combination
+ROWS = 2000
+COLUMNS = 4
+GRID_WIDTH = 3
+SEED = 0
+
+# Timed runs per benchmark, after one untimed warm-up run
+REPEAT = 5
+
+# Slowdown of the median, as a fraction of the baseline, above which compare reports a regression
+THRESHOLD = 0.10
+
+
+def synthetic_frame(rows, columns, seed):
+    """Daily series y, x1, ... with y linear in the predictors plus noise, the same for the same arguments"""
+    rng = np.random.default_rng(seed)
+    freq = 'D' if rows <= 100_000 else 'h'
+    dates = pd.date_range('1800-01-01', periods=rows, freq=freq, name='date')
+    predictors = rng.standard_normal((rows, columns - 1)).cumsum(axis=0)
+    y = predictors @ rng.standard_normal(columns - 1) + rng.standard_normal(rows)
+    frame = pd.DataFrame(predictors, index=dates, columns=[f'x{i}' for i in range(1, columns)])
+    frame.insert(0, 'y', y)
+    return frame
+
+
+def prepare_datasets(directory, frame):
+    """Point the column and fit stores at directory and write frame as the datasets every app reads"""
+    # Both stores read their location when first imported, so this runs before any app module is loaded
+    os.environ['DATASET_DIR'] = os.path.join(directory, 'datasets')
+    os.environ['FIT_STORE_DIR'] = os.path.join(directory, 'fit_store')
+    from column_store import write_dataset
+    write_dataset('sample', frame)
+    write_dataset('panel_sample', frame.reset_index(), date_column='date')
+
+
+def reset_caches():
+    """Forget every result held in memory or on disk, so the next run computes from scratch"""
+    import fit_store
+    from result_cache import fit_cache, chart_cache, summary_cache, clear_cache
+    for cache in (fit_cache, chart_cache, summary_cache):
+        clear_cache(cache)
+    shutil.rmtree(fit_store.STORE_DIR, ignore_errors=True)
+
+
+def wsgi_call(app, method, path, form=None):
+    """Status and body of one request sent straight to a WSGI app, for apps without a test client"""
+    path, _, query = path.partition('?')
+    body = urlencode(form or {}, doseq=True).encode()
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http'
+    }
+    status = []
+    chunks = app(environ, lambda line, headers, exc_info=None: status.append(line))
+    return status[0], b''.join(chunks)
+
+
+def expect_ok(status, body):
+    """Body of a successful response; a failed request must not be timed as a fast one"""
+    if not str(status).startswith('200'):
+        raise RuntimeError(f'benchmark request failed with {status}')
+    return body
+
+
+def benchmark_cases(frame, grid_width):
+    """(name, setup, run) triples; setup is untimed and runs before every timed call"""
+    import statsmodels.api as sm
+    from ols_grid import default_grid, fit_grid, grid_statistics
+    from chart_render import model_chart
+
+    predictors = list(frame.columns[1:1 + grid_width])
+    dep_vars, ind_combinations = default_grid(list(frame.columns), grid_width)
+    start_date, end_date = str(frame.index[0].date()), str(frame.index[-1].date())
+    png = model_chart(frame, 'residuals', 'y', predictors)
+
+    def summary():
+        X = sm.add_constant(frame[predictors])
+        return sm.OLS(frame['y'], X).fit().summary().as_html()
+
+    cases = [
+        ('fit_grid', None, lambda: grid_statistics(frame, fit_grid(frame, dep_vars, ind_combinations))),
+        ('summary_html', None, summary),
+        ('plot', None, lambda: model_chart(frame, 'residuals', 'y', predictors)),
+        ('plot_full', None, lambda: model_chart(frame, 'residuals', 'y', predictors, full=True)),
+        ('encode_base64', None, lambda: base64.b64encode(png).decode('utf-8'))
+    ]
+
+    # Full requests through the apps, each run with every cache emptied first
+    import allinone_mres
+    import bottle_app_inone
+    client = allinone_mres.app.test_client()
+    form = {'start_date': start_date, 'end_date': end_date, 'num_models': '10'}
+    filtered = dict(form, add_filters='on', p_stat='0.05', adf_pstat='0.05')
+    bottle_form = dict(form, max_predictors=str(grid_width))
+
+    # The summary and chart routes are benchmarked on the links of a first result page
+    response = client.post('/result', data=form)
+    page = expect_ok(response.status, response.data)
+    chart_url = re.search(rb'src="(/chart/[^"]+)"', page).group(1).decode().replace('&amp;', '&')
+    summary_url = re.search(rb'href="(/summary[^"]+)"', page).group(1).decode().replace('&amp;', '&')
+
+    def flask(method, path, data=None):
+        response = client.open(path, method=method, data=data)
+        return expect_ok(response.status, response.data)
+
+    cases += [
+        ('flask_result', reset_caches, lambda: flask('POST', '/result', form)),
+        ('flask_result_warm', None, lambda: flask('POST', '/result', form)),
+        ('flask_result_filtered', reset_caches, lambda: flask('POST', '/result', filtered)),
+        ('flask_result_stream', reset_caches, lambda: flask('POST', '/result', dict(form, stream='on'))),
+        ('flask_summary', reset_caches, lambda: flask('GET', summary_url)),
+        ('flask_chart', reset_caches, lambda: flask('GET', chart_url)),
+        ('bottle_result', reset_caches, lambda: expect_ok(*wsgi_call(bottle_app_inone.app, 'POST', '/result', bottle_form))),
+        ('bottle_result_subsets', reset_caches,
+         lambda: expect_ok(*wsgi_call(bottle_app_inone.app, 'POST', '/result', dict(bottle_form, best_subset='on'))))
+    ]
+
+    # The Panel callbacks, driven through the widgets the way a click runs them
+    import reg
+    reg.dependent_var.value = 'y'
+    reg.predictors.value = predictors[:reg_width(grid_width)]
+    reg.start_date.value = frame.index[0].date()
+    reg.end_date.value = frame.index[-1].date()
+
+    def panel_update():
+        reg.update(None)
+        if str(reg.output_stats.object).startswith('Error'):
+            raise RuntimeError(f'Panel update failed: {reg.output_stats.object}')
+
+    def panel_update_rolling():
+        reg.regression_mode.value = 'Rolling'
+        try:
+            panel_update()
+        finally:
+            reg.regression_mode.value = 'Full Window'
+
+    cases += [
+        ('panel_regression', reset_caches,
+         lambda: reg.perform_regression('y', reg.predictors.value, reg.start_date.value, reg.end_date.value)),
+        ('panel_update', reset_caches, panel_update),
+        ('panel_update_rolling', reset_caches, panel_update_rolling)
+    ]
+    return cases
+
+
+def reg_width(grid_width):
+    """Predictors used by the Panel benchmarks; the rolling fit grows with every one of them"""
+    return max(1, min(grid_width, 3))
+
+
+def time_case(setup, run, repeat):
+    """Seconds of each of repeat timed calls of run, after one warm-up call"""
+    if setup is not None:
+        setup()
+    run()
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_benchmarks(rows=ROWS, columns=COLUMNS, grid_width=GRID_WIDTH, repeat=REPEAT, seed=SEED, only=None):
+    """Results of every benchmark (or those named in only) on a fresh synthetic dataset, as a JSON-ready dict"""
+    frame = synthetic_frame(rows, columns, seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_datasets(directory, frame)
+        for name, setup, run in benchmark_cases(frame, grid_width):
+            if only and name not in only:
+                continue
+            timings = time_case(setup, run, repeat)
+            results[name] = {
+                'median': statistics.median(timings),
+                'min': min(timings),
+                'mean': statistics.fmean(timings),
+                'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+                'runs': timings
+            }
+            print(f'{name:24} {results[name]["median"] * 1000:10.2f} ms', file=sys.stderr)
+
+    return {
+        'meta': {
+            'rows': rows,
+            'columns': columns,
+            'grid_width': grid_width,
+            'repeat': repeat,
+            'seed': seed,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+
+
+def compare_results(baseline, current, threshold=THRESHOLD):
+    """Per-benchmark comparison of medians: (name, baseline seconds, current seconds, ratio, verdict)
+
+    A benchmark more than threshold slower than the baseline is a 'regression', more than threshold faster
+    an 'improvement'; benchmarks found in only one of the files are 'new' or 'missing'.
+    """
+    rows = []
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        before = baseline['results'].get(name)
+        after = current['results'].get(name)
+        if before is None or after is None:
+            rows.append((name, before and before['median'], after and after['median'], None,
+                         'new' if before is None else 'missing'))
+            continue
+        ratio = after['median'] / before['median'] if before['median'] else float('inf')
+        if ratio > 1 + threshold:
+            verdict = 'regression'
+        elif ratio < 1 - threshold:
+            verdict = 'improvement'
+        else:
+            verdict = 'same'
+        rows.append((name, before['median'], after['median'], ratio, verdict))
+    return rows
+
+
+def mismatched_settings(baseline, current):
+    """Data settings that differ between two result files, which makes their timings incomparable"""
+    keys = ('rows', 'columns', 'grid_width', 'seed')
+    return [key for key in keys if baseline['meta'].get(key) != current['meta'].get(key)]
+
+
+def format_ms(seconds):
+    return '-' if seconds is None else f'{seconds * 1000:.2f}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the regression and rendering paths on synthetic data')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the benchmarks and write their results as JSON')
+    run.add_argument('--rows', type=int, default=ROWS)
+    run.add_argument('--columns', type=int, default=COLUMNS, help='columns including the dependent')
+    run.add_argument('--grid-width', type=int, default=GRID_WIDTH, help='largest predictor combination of the grid')
+    run.add_argument('--repeat', type=int, default=REPEAT)
+    run.add_argument('--seed', type=int, default=SEED)
+    run.add_argument('--only', help='comma-separated benchmark names')
+    run.add_argument('--output', default='benchmark.json')
+
+    compare = commands.add_parser('compare', help='compare results with a baseline; exits 1 on any regression')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=THRESHOLD)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        if args.columns < 2 or args.grid_width < 1:
+            parser.error('at least two columns and a grid width of one are needed')
+        only = set(args.only.split(',')) if args.only else None
+        results = run_benchmarks(args.rows, args.columns, args.grid_width, args.repeat, args.seed, only)
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+        print(f'wrote {args.output}', file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.current) as handle:
+        current = json.load(handle)
+    mismatched = mismatched_settings(baseline, current)
+    if mismatched:
+        print(f'warning: the runs used different {", ".join(mismatched)}', file=sys.stderr)
+
+    rows = compare_results(baseline, current, args.threshold)
+    print(f'{"benchmark":24} {"baseline ms":>12} {"current ms":>12} {"ratio":>7}  verdict')
+    for name, before, after, ratio, verdict in rows:
+        print(f'{name:24} {format_ms(before):>12} {format_ms(after):>12} '
+              f'{"-" if ratio is None else f"{ratio:.2f}":>7}  {verdict}')
+    return 1 if any(verdict == 'regression' for *_, verdict in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
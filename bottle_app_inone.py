@@ -1,26 +1,49 @@
-from bottle import Bottle, run, request, template, static_file
+from bottle import Bottle, HTTPResponse, abort, redirect, run, request, response, template, static_file
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
 import matplotlib
-import matplotlib.pyplot as plt
-import io
-import base64
+import traceback
+from urllib.parse import urlencode
+from chart_render import CHART_CACHE_CONTROL, chart_key, chart_url, model_chart
+from dataset_version import dataset_version
+from result_cache import fit_cache, chart_cache, summary_cache, query_key, cached
+from fit_store import stored
+from single_flight import single_flight
+from grid_jobs import MAX_JOB_MODELS, submit_job, job_status, job_results, cancel_job
+from ols_grid import RANK_CRITERIA, request_grid, fit_grid, grid_statistics, compact_result, filter_threshold, screen_models, top_models
+from subset_search import search_grid, search_request
+from column_store import dataset_exists, write_dataset, load_dataset, dataset_frame, active_dataset, set_active, append_rows
+from ingest import ingest_file
+from append_refit import refresh_grids
+from timing import stage, start_request, finish_request
+from metrics import METRICS_CONTENT_TYPE, metrics_text
 
 # Set the matplotlib backend to 'Agg' to avoid GUI issues
 matplotlib.use('Agg')
 
 app = Bottle()
 
-# Example DataFrame
-data = pd.DataFrame({
-    'date': pd.date_range(start='2020-01-01', periods=100, freq='D'),
-    'y': np.random.randn(100),
-    'x1': np.random.randn(100),
-    'x2': np.random.randn(100),
-    'x3': np.random.randn(100)
-})
-data.set_index('date', inplace=True)
+# Name under which this app's data is stored; an upload makes it point at the new dataset
+DATASET = 'sample'
+
+# Ask reverse proxies to pass streamed chunks straight through
+STREAM_HEADERS = {'X-Accel-Buffering': 'no'}
+
+# Example DataFrame, read through memory-mapped columns
+if not dataset_exists('sample'):
+    sample = pd.DataFrame({
+        'date': pd.date_range(start='2020-01-01', periods=100, freq='D'),
+        'y': np.random.randn(100),
+        'x1': np.random.randn(100),
+        'x2': np.random.randn(100),
+        'x3': np.random.randn(100)
+    })
+    sample.set_index('date', inplace=True)
+    write_dataset('sample', sample)
+data_source = load_dataset(active_dataset(DATASET))
+data = dataset_frame(data_source)
+version = dataset_version(data_source)
 
 # HTML templates as strings
 index_html = """
@@ -50,18 +73,18 @@ index_html = """
             <div class="form-group">
                 <label for="dependent">Dependent Variable:</label>
                 <select id="dependent" name="dependent" class="form-control">
-                    <option value="y">y</option>
-                    <option value="x1">x1</option>
-                    <option value="x2">x2</option>
-                    <option value="x3">x3</option>
+                    <option value="">All columns</option>
+                    % for column in columns:
+                        <option value="{{column}}">{{column}}</option>
+                    % end
                 </select>
             </div>
             <div class="form-group">
                 <label for="independents">Independent Variables:</label>
                 <select id="independents" name="independents[]" class="form-control" multiple>
-                    <option value="x1">x1</option>
-                    <option value="x2">x2</option>
-                    <option value="x3">x3</option>
+                    % for column in columns[1:]:
+                        <option value="{{column}}">{{column}}</option>
+                    % end
                 </select>
             </div>
             <div class="form-group">
@@ -99,14 +122,48 @@ index_html = """
                 <input type="range" id="num_models" name="num_models" class="form-control-range" min="1" max="10" value="5" oninput="this.nextElementSibling.value = this.value">
                 <output>5</output>
             </div>
+            <div class="form-group">
+                <label for="rank_by">Rank Models By:</label>
+                <select id="rank_by" name="rank_by" class="form-control">
+                    <option value="rsquared_adj">Adj. R-squared</option>
+                    <option value="rsquared">R-squared</option>
+                    <option value="aic">AIC</option>
+                    <option value="bic">BIC</option>
+                    <option value="resid_std">Residual Std</option>
+                </select>
+            </div>
+            <div class="form-group form-check">
+                <input type="checkbox" class="form-check-input" id="best_subset" name="best_subset">
+                <label class="form-check-label" for="best_subset">Search Best Subsets</label>
+            </div>
+            <div class="form-group">
+                <label for="max_predictors">Max Predictors per Model:</label>
+                <input type="number" id="max_predictors" name="max_predictors" class="form-control" min="1" value="3">
+            </div>
+            <div class="form-group form-check">
+                <input type="checkbox" class="form-check-input" id="stream" name="stream" checked>
+                <label class="form-check-label" for="stream">Show Models as They Finish</label>
+            </div>
             <button type="submit" class="btn btn-primary">Run Regression</button>
         </form>
+        <form action="/upload" method="POST" enctype="multipart/form-data" class="mt-5">
+            <div class="form-group">
+                <label for="file">Upload Data (CSV or Parquet):</label>
+                <input type="file" id="file" name="file" class="form-control-file" accept=".csv,.parquet" required>
+            </div>
+            <div class="form-group">
+                <label for="date_column">Date Column:</label>
+                <input type="text" id="date_column" name="date_column" class="form-control" value="date">
+            </div>
+            <button type="submit" class="btn btn-secondary">Upload</button>
+        </form>
     </div>
 </body>
 </html>
 """
 
-result_html = """
+# The result page in three parts, so a streamed response can send each model block as it is ready
+result_head_html = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -117,27 +174,145 @@ result_html = """
 <body>
     <div class="container mt-5">
         <h1 class="mb-4">Regression Results</h1>
-        % for index, result in enumerate(results):
+"""
+
+model_html = """
             <div class="mb-5">
                 <h2>Model {{ index + 1 }}</h2>
-                <div>
-                    {{! result['summary'] }}
-                </div>
+                <table class="table table-sm">
+                    <thead>
+                        <tr><th>{{ result['stats']['dependent'] }}</th><th>coef</th><th>std err</th><th>t</th><th>P&gt;|t|</th></tr>
+                    </thead>
+                    <tbody>
+                        % for name, coef, bse, tvalue, pvalue in result['stats']['terms']:
+                            <tr><td>{{ name }}</td><td>{{ '%.4f' % coef }}</td><td>{{ '%.4f' % bse }}</td><td>{{ '%.3f' % tvalue }}</td><td>{{ '%.3f' % pvalue }}</td></tr>
+                        % end
+                    </tbody>
+                </table>
+                <p>
+                    No. Observations: {{ result['stats']['nobs'] }} |
+                    R-squared: {{ '%.3f' % result['stats']['rsquared'] }} |
+                    Adj. R-squared: {{ '%.3f' % result['stats']['rsquared_adj'] }} |
+                    F-statistic: {{ '%.3f' % result['stats']['fvalue'] }} (Prob {{ '%.3g' % result['stats']['f_pvalue'] }}) |
+                    Durbin-Watson: {{ '%.3f' % result['stats']['durbin_watson'] }}
+                </p>
+                <a href="{{ result['summary_url'] }}">Full summary</a>
                 <h3 class="mt-4">Residuals Plot</h3>
-                <img src="data:image/png;base64,{{ result['residuals_plot_data'] }}" alt="Residuals Plot" class="img-fluid">
+                <a href="{{ result['residuals_full_url'] }}"><img src="{{ result['residuals_url'] }}" alt="Residuals Plot" class="img-fluid" loading="lazy"></a>
                 <h3 class="mt-4">Actual vs Predicted</h3>
-                <img src="data:image/png;base64,{{ result['predictions_plot_data'] }}" alt="Predictions Plot" class="img-fluid">
+                <a href="{{ result['predictions_full_url'] }}"><img src="{{ result['predictions_url'] }}" alt="Predictions Plot" class="img-fluid" loading="lazy"></a>
             </div>
-        % end
+"""
+
+error_html = """
+            <div class="alert alert-danger">{{ message }}</div>
+"""
+
+result_tail_html = """
+        <a href="/" class="btn btn-primary mt-4">Back to Form</a>
+    </div>
+</body>
+</html>
+"""
+
+result_html = result_head_html + "% for index, result in enumerate(results):\n" + model_html + "% end\n" + result_tail_html
+
+summary_html = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Model Summary</title>
+    <link href="https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css" rel="stylesheet">
+</head>
+<body>
+    <div class="container mt-5">
+        <h1 class="mb-4">Model Summary</h1>
+        <div>
+            {{! summary }}
+        </div>
         <a href="/" class="btn btn-primary mt-4">Back to Form</a>
     </div>
 </body>
 </html>
 """
 
+@app.hook('before_request')
+def start_timing():
+    start_request()
+
+@app.hook('after_request')
+def add_server_timing():
+    # Durations of the stages this request went through, shown by browser developer tools
+    response.set_header('Server-Timing', finish_request(getattr(request.environ.get('bottle.route'), 'rule', 'unmatched')))
+
+@app.hook('before_request')
+def refresh_data():
+    # Another worker may have switched the slot to an uploaded dataset or appended rows to it
+    global data, data_source, version
+    dataset = load_dataset(active_dataset(DATASET))
+    if dataset is not data_source:
+        data_source = dataset
+        data = dataset_frame(dataset)
+        version = dataset_version(dataset)
+
 @app.route('/')
 def index():
-    return template(index_html)
+    return template(index_html, columns=list(data.columns))
+
+@app.route('/upload', method='POST')
+def upload():
+    upload_file = request.files.get('file')
+    if upload_file is None:
+        abort(400, 'no file uploaded')
+
+    # Parsed chunk by chunk into the columnar store; the slot is switched only once the dataset is complete
+    try:
+        name = ingest_file(upload_file.file, upload_file.filename, DATASET, request.forms.get('date_column') or 'date')
+    except ValueError as error:
+        abort(400, str(error))
+    set_active(DATASET, name)
+    redirect('/')
+
+def model_entry(grid, i, version, start_date, end_date):
+    """Statistics and chart links of model i of the grid, as shown in one result block"""
+    dep_var = grid['dependent'][i]
+    ind_var = grid['predictors'][i]
+    # Full statsmodels summary is only built when the user opens this model
+    summary_url = '/summary?' + urlencode({
+        'dependent': dep_var,
+        'independents[]': ind_var,
+        'start_date': start_date,
+        'end_date': end_date
+    }, doseq=True)
+
+    return {
+        'stats': compact_result(grid, i),
+        'summary_url': summary_url,
+
+        # Charts are rendered only when the browser requests these URLs
+        'residuals_url': chart_url(version, 'residuals', dep_var, ind_var, start_date, end_date),
+        'predictions_url': chart_url(version, 'predictions', dep_var, ind_var, start_date, end_date),
+
+        # Downsampled charts link to their full-resolution versions
+        'residuals_full_url': chart_url(version, 'residuals', dep_var, ind_var, start_date, end_date, full=True),
+        'predictions_full_url': chart_url(version, 'predictions', dep_var, ind_var, start_date, end_date, full=True)
+    }
+
+@app.route('/append', method='POST')
+def append():
+    payload = request.json or {}
+    rows = pd.DataFrame(payload.get('rows') or [])
+    old_data, old_version = data, version
+    try:
+        append_rows(data_source['name'], rows, date_column='date')
+    except (KeyError, ValueError) as error:
+        abort(400, str(error))
+    refresh_data()
+
+    # Each saved grid is updated from the appended rows inside its window instead of being refitted
+    grids = refresh_grids(old_data, data, old_version, version)
+    return {'rows_added': len(rows), 'rows': len(data), 'grids': grids}
 
 @app.route('/result', method='POST')
 def result():
@@ -147,78 +322,220 @@ def result():
     start_date = request.forms.get('start_date')
     end_date = request.forms.get('end_date')
     num_models = int(request.forms.get('num_models'))
+    rank_by = request.forms.get('rank_by') or 'rsquared_adj'
+    if rank_by not in RANK_CRITERIA:
+        abort(400, f'unknown ranking criterion {rank_by!r}')
+    best_subset = 'best_subset' in request.forms
+    max_predictors = int(request.forms.get('max_predictors') or 3)
+    stream = 'stream' in request.forms
     
     # Get filter parameters
     add_filters = 'add_filters' in request.forms
-    p_stat = request.forms.get('p_stat')
-    error_std = request.forms.get('error_std')
-    max_error = request.forms.get('max_error')
-    adf_pstat = request.forms.get('adf_pstat')
+    try:
+        p_stat = filter_threshold(request.forms.get('p_stat'))
+        error_std = filter_threshold(request.forms.get('error_std'))
+        max_error = filter_threshold(request.forms.get('max_error'))
+        adf_pstat = filter_threshold(request.forms.get('adf_pstat'))
+    except ValueError as error:
+        abort(400, str(error))
     
     # Filter data based on selected time period
-    filtered_data = data[start_date:end_date]
+    with stage('slice'):
+        filtered_data = data[start_date:end_date]
 
-    results = []
+    # The selected dependent and predictors span the grid, with at most max_predictors per model; the
+    # best-subset search never enumerates that grid, so only the models it returns are bounded
+    try:
+        if best_subset:
+            dep_vars, candidates = search_request(data.columns, dep_var, ind_vars, max_predictors, num_models)
+            ind_combinations = None
+        else:
+            dep_vars, ind_combinations = request_grid(data.columns, dep_var, ind_vars, max_predictors)
+            candidates = None
+    except ValueError as error:
+        abort(400, str(error))
 
-    # Loop through each combination of dependent and independent variables
-    dep_vars = ['y', 'x1', 'x2', 'x3']
-    ind_combinations = [['x1'], ['x2'], ['x3'], ['x1', 'x2'], ['x1', 'x3'], ['x2', 'x3'], ['x1', 'x2', 'x3']]
-    
-    model_count = 0
-    for dep_var in dep_vars:
-        for ind_var in ind_combinations:
-            if model_count >= num_models:
-                break
-            X = filtered_data[ind_var]
-            y = filtered_data[dep_var]
-            X = sm.add_constant(X)  # Add constant term for intercept
-
-            # Perform regression analysis
-            model = sm.OLS(y, X).fit()
-            predictions = model.predict(X)
-            residuals = y - predictions
-
-            # Generate summary statistics
-            summary = model.summary().as_html()
-
-            # Plot errors
-            fig1, ax1 = plt.subplots()
-            ax1.plot(filtered_data.index, residuals)
-            ax1.set_title('Residuals over Time')
-            ax1.set_xlabel('Date')
-            ax1.set_ylabel('Residuals')
-            buf1 = io.BytesIO()
-            plt.savefig(buf1, format='png')
-            buf1.seek(0)
-            residuals_plot_data = base64.b64encode(buf1.getvalue()).decode('utf-8')
-            buf1.close()
-
-            # Plot predictions vs actual values
-            fig2, ax2 = plt.subplots()
-            ax2.plot(filtered_data.index, y, label='Actual')
-            ax2.plot(filtered_data.index, predictions, label='Predicted')
-            ax2.set_title('Actual vs Predicted')
-            ax2.set_xlabel('Date')
-            ax2.set_ylabel(dep_var)
-            ax2.legend()
-            buf2 = io.BytesIO()
-            plt.savefig(buf2, format='png')
-            buf2.seek(0)
-            predictions_plot_data = base64.b64encode(buf2.getvalue()).decode('utf-8')
-            buf2.close()
-
-            # Append result for this model
-            results.append({
-                'summary': summary,
-                'residuals_plot_data': residuals_plot_data,
-                'predictions_plot_data': predictions_plot_data
-            })
-            
-            model_count += 1
-            if model_count >= num_models:
-                break
-
-    return template(result_html, results=results)
+    def ranked_models():
+        # Fit every combination of dependent and independent variables from one shared cross-product matrix
+        def fit():
+            with stage('ols'):
+                if best_subset:
+                    # Only the best num_models subsets of each size are fitted instead of every combination
+                    grid = search_grid(filtered_data, dep_vars, max_predictors, num_models, candidates)
+                else:
+                    grid = fit_grid(filtered_data, dep_vars, ind_combinations)
+            with stage('statistics'):
+                return grid_statistics(filtered_data, grid)
+
+        # Repeated queries on the same data reuse the fitted grid, from memory or from the store shared by all workers
+        if best_subset:
+            grid_key = query_key('subsets', dep_vars, candidates, max_predictors, num_models, start_date, end_date)
+        else:
+            grid_key = query_key('grid', dep_vars, ind_combinations, start_date, end_date)
+        with stage('fit'):
+            grid = cached(fit_cache, version, grid_key, lambda: stored(version, grid_key, fit))
+
+        # Apply the filters on the cheap statistics so only surviving models are plotted
+        with stage('screen'):
+            if add_filters:
+                survivors = screen_models(filtered_data, grid, p_stat, error_std, max_error, adf_pstat)
+            else:
+                survivors = range(len(grid['dependent']))
+
+            # Keep the best num_models by the chosen criterion before any plotting
+            return grid, top_models(grid, survivors, rank_by, num_models)
+
+    # Identical concurrent requests, streamed or not, wait on one computation instead of each running their own
+    request_key = query_key('result', version, dep_vars, ind_combinations, candidates, start_date, end_date, num_models, rank_by,
+                            best_subset, max_predictors, add_filters and [p_stat, error_std, max_error, adf_pstat])
+
+    def stream_results():
+        # The page header goes out before any fitting; ranking needs every survivor, so models follow together
+        yield template(result_head_html)
+        try:
+            grid, ranked = single_flight(request_key, ranked_models)
+        except TimeoutError:
+            # The status line is already sent, so failures are reported in the page
+            yield template(error_html, message='Timed out waiting for an identical request; reload the page to try again.')
+        except Exception:
+            traceback.print_exc()
+            yield template(error_html, message='The models could not be fitted.')
+        else:
+            for index, i in enumerate(ranked):
+                with stage('render'):
+                    block = template(model_html, index=index, result=model_entry(grid, i, version, start_date, end_date))
+                yield block
+        yield template(result_tail_html)
+
+    if stream:
+        for name, value in STREAM_HEADERS.items():
+            response.set_header(name, value)
+        return stream_results()
+
+    try:
+        grid, ranked = single_flight(request_key, ranked_models)
+    except TimeoutError:
+        abort(503)
+
+    with stage('render'):
+        results = [model_entry(grid, i, version, start_date, end_date) for i in ranked]
+        return template(result_html, results=results)
+
+@app.route('/summary')
+def summary():
+    dep_var = request.query.get('dependent')
+    ind_vars = request.query.getall('independents[]')
+    start_date = request.query.get('start_date')
+    end_date = request.query.get('end_date')
+
+    # Fit the single requested model with statsmodels for its full summary
+    def fit_summary():
+        with stage('slice'):
+            filtered_data = data[start_date:end_date]
+        with stage('ols'):
+            X = sm.add_constant(filtered_data[ind_vars])  # Add constant term for intercept
+            model = sm.OLS(filtered_data[dep_var], X).fit()
+        with stage('summary_html'):
+            return model.summary().as_html()
+
+    summary_key = query_key('summary', dep_var, ind_vars, start_date, end_date)
+    try:
+        summary_table = cached(summary_cache, version, summary_key, fit_summary)
+    except ValueError as error:
+        # statsmodels cannot summarise a window too short for its residual tests
+        abort(400, str(error))
+    except TimeoutError:
+        # Another request is still fitting this summary
+        abort(503)
+
+    with stage('render'):
+        return template(summary_html, summary=summary_table)
+
+@app.route('/chart/<key>.png')
+def chart(key):
+    chart_type = request.query.get('chart')
+    dep_var = request.query.get('dependent')
+    ind_vars = request.query.getall('independents[]')
+    start_date = request.query.get('start_date')
+    end_date = request.query.get('end_date')
+    full = request.query.get('full') == '1'
+
+    # The key must match the current data, so a cached URL never shows a stale chart
+    if chart_key(version, chart_type, dep_var, ind_vars, start_date, end_date, full) != key:
+        abort(404)
+    headers = {'ETag': f'"{key}"', 'Cache-Control': CHART_CACHE_CONTROL}
+    if key in request.headers.get('If-None-Match', ''):
+        return HTTPResponse(status=304, headers=headers)
+
+    # Rendered PNGs are kept in memory, so repeat requests without a browser cache skip the fit and the draw
+    with stage('slice'):
+        filtered_data = data[start_date:end_date]
+    try:
+        image = cached(chart_cache, version, key, lambda: model_chart(filtered_data, chart_type, dep_var, ind_vars, full))
+    except TimeoutError:
+        # Another request is still drawing this chart
+        abort(503)
+    return HTTPResponse(image, status=200, headers=headers, content_type='image/png')
+
+@app.route('/metrics')
+def metrics():
+    response.content_type = METRICS_CONTENT_TYPE
+    return metrics_text()
+
+@app.route('/jobs', method='POST')
+def submit():
+    start_date = request.forms.get('start_date')
+    end_date = request.forms.get('end_date')
+    try:
+        priority = int(request.forms.get('priority') or 0)
+        max_predictors = int(request.forms.get('max_predictors') or 3)
+    except ValueError:
+        abort(400, 'priority and max_predictors must be integers')
+    filters = None
+    if 'add_filters' in request.forms:
+        try:
+            filters = {name: filter_threshold(request.forms.get(name)) for name in ('p_stat', 'error_std', 'max_error', 'adf_pstat')}
+        except ValueError as error:
+            abort(400, str(error))
+
+    # The grid is spanned by the form's selection like a result page, with room for many more models
+    try:
+        dep_vars, ind_combinations = request_grid(data.columns, request.forms.get('dependent'), request.forms.getall('independents[]'),
+                                                  max_predictors, MAX_JOB_MODELS)
+    except ValueError as error:
+        abort(400, str(error))
+
+    # The grid runs on the job worker pool; the client polls for progress and results instead of waiting
+    job_id = submit_job(data[start_date:end_date], dep_vars, ind_combinations, filters, priority)
+    response.status = 202
+    return {
+        'job_id': job_id,
+        'status_url': f'/jobs/{job_id}',
+        'results_url': f'/jobs/{job_id}/results',
+        'cancel_url': f'/jobs/{job_id}/cancel'
+    }
+
+@app.route('/jobs/<job_id>')
+def job(job_id):
+    status = job_status(job_id)
+    if status is None:
+        abort(404)
+    return status
+
+@app.route('/jobs/<job_id>/results')
+def partial_results(job_id):
+    # Results of finished chunks, from offset on, so clients can page through them while the job runs
+    results = job_results(job_id, int(request.query.get('offset') or 0))
+    if results is None:
+        abort(404)
+    return results
+
+@app.route('/jobs/<job_id>/cancel', method='POST')
+def cancel(job_id):
+    status = cancel_job(job_id)
+    if status is None:
+        abort(404)
+    return status
 
 if __name__ == '__main__':
     run(app, host='localhost', port=8080, debug=True)
@@ -0,0 +1,131 @@
+import hashlib
+import io
+import json
+import queue
+import threading
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from urllib.parse import urlencode
+from downsample import downsample_indices
+from timing import stage
+from ols_grid import window_gram, grid_columns, fit_subset, stack_models, fitted_values
+
+# Size of every chart, matching the pyplot defaults the pages used before
+FIGSIZE = (6.4, 4.8)
+DPI = 100
+
+# Series longer than the canvas is wide are reduced to one point per pixel column before drawing
+CHART_POINTS = int(FIGSIZE[0] * DPI)
+
+# Ceiling on the memory held by pooled canvases; each RGBA canvas needs width * height * 4 bytes
+MEMORY_LIMIT = 64 * 1024 * 1024
+POOL_SIZE = max(1, min(4, MEMORY_LIMIT // int(FIGSIZE[0] * DPI * FIGSIZE[1] * DPI * 4)))
+
+# Chart URLs are content-addressed, so browsers and proxies may keep them indefinitely
+CHART_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Idle canvases, and one slot per canvas so no more than POOL_SIZE ever exist
+canvas_pool = queue.LifoQueue()
+pool_slots = threading.BoundedSemaphore(POOL_SIZE)
+
+
+def acquire_figure():
+    """Take an idle figure from the pool, creating one if a slot is free, waiting otherwise"""
+    pool_slots.acquire()
+    try:
+        return canvas_pool.get_nowait()
+    except queue.Empty:
+        figure = Figure(figsize=FIGSIZE, dpi=DPI)
+        FigureCanvasAgg(figure)
+        return figure
+
+
+def release_figure(figure):
+    """Clear a figure's artists and return it to the pool"""
+    figure.clear()
+    canvas_pool.put(figure)
+    pool_slots.release()
+
+
+def draw_residuals(ax, dates, residuals):
+    """Residuals over time"""
+    ax.plot(dates, residuals)
+    ax.set_title('Residuals over Time')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Residuals')
+
+
+def draw_predictions(ax, dates, actual, predicted, dep_var):
+    """Actual and predicted values of the dependent over time"""
+    ax.plot(dates, actual, label='Actual')
+    ax.plot(dates, predicted, label='Predicted')
+    ax.set_title('Actual vs Predicted')
+    ax.set_xlabel('Date')
+    ax.set_ylabel(dep_var)
+    ax.legend()
+
+
+CHART_TYPES = {
+    'residuals': draw_residuals,
+    'predictions': draw_predictions
+}
+
+
+def render_chart(chart_type, *args):
+    """PNG bytes of one chart, drawn on a pooled canvas through the object-oriented API"""
+    figure = acquire_figure()
+    try:
+        with stage('draw'):
+            CHART_TYPES[chart_type](figure.add_subplot(), *args)
+        buf = io.BytesIO()
+        with stage('savefig'):
+            figure.savefig(buf, format='png')
+        return buf.getvalue()
+    finally:
+        release_figure(figure)
+
+
+def chart_key(version, chart_type, dep_var, ind_vars, start_date, end_date, full=False):
+    """Content hash of everything a model chart depends on"""
+    spec = json.dumps([version, chart_type, dep_var, list(ind_vars), start_date, end_date, full])
+    return hashlib.blake2b(spec.encode(), digest_size=16).hexdigest()
+
+
+def chart_url(version, chart_type, dep_var, ind_vars, start_date, end_date, full=False):
+    """URL of a model chart, served and rendered separately from the result page"""
+    key = chart_key(version, chart_type, dep_var, ind_vars, start_date, end_date, full)
+    query = {
+        'chart': chart_type,
+        'dependent': dep_var,
+        'independents[]': list(ind_vars),
+        'start_date': start_date,
+        'end_date': end_date
+    }
+    if full:
+        query['full'] = 1
+    return f'/chart/{key}.png?' + urlencode(query, doseq=True)
+
+
+def model_chart(filtered_data, chart_type, dep_var, ind_vars, full=False):
+    """PNG bytes of one chart of the model dep_var ~ const + ind_vars over filtered_data"""
+    with stage('chart_fit'):
+        gram = window_gram(filtered_data, grid_columns(filtered_data, [dep_var], [ind_vars]))
+        model = stack_models([fit_subset(gram, dep_var, ind_vars)])
+        dates = filtered_data.index
+        y = filtered_data[dep_var].to_numpy(dtype=float)
+        predictions = fitted_values(filtered_data, model, 0)
+
+    # Min/max decimation keeps every residual spike; LTTB keeps the shape of the fitted lines
+    if chart_type == 'residuals':
+        series, method = [y - predictions], 'minmax'
+    else:
+        series, method = [y, predictions], 'lttb'
+    if not full:
+        with stage('downsample'):
+            keep = downsample_indices(dates, series, CHART_POINTS, method)
+            dates = dates[keep]
+            series = [values[keep] for values in series]
+
+    if chart_type == 'residuals':
+        return render_chart('residuals', dates, *series)
+    return render_chart('predictions', dates, *series, dep_var)
@@ -0,0 +1,209 @@
+import fcntl
+import io
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# Root of the on-disk datasets; every worker maps the same files, so the page cache holds one copy
+DATASET_DIR = os.environ.get('DATASET_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datasets'))
+
+# Opened datasets of this process, by name
+datasets = {}
+
+def dataset_path(name):
+    """Directory holding the columns of dataset name"""
+    return os.path.join(DATASET_DIR, name)
+
+
+def dataset_exists(name):
+    """Whether dataset name has been written"""
+    return os.path.exists(os.path.join(dataset_path(name), 'columns.json'))
+
+
+def write_dataset(name, frame, date_column=None):
+    """Write frame as one .npy file per column plus a sorted date index
+
+    The dates come from date_column, or from the index when date_column is None. The files are written
+    to a private directory and moved into place in one rename, so readers never see a partial dataset;
+    if another process wrote the dataset first, its copy is kept.
+    """
+    if date_column is not None:
+        frame = frame.set_index(date_column)
+    frame = frame.sort_index()
+    columns = [str(column) for column in frame.columns]
+
+    temporary = staging_path(name)
+    np.save(os.path.join(temporary, 'dates.npy'), frame.index.to_numpy(dtype='datetime64[ns]'))
+    for i, column in enumerate(frame.columns):
+        np.save(os.path.join(temporary, f'column_{i}.npy'), frame[column].to_numpy(dtype=float))
+    publish_dataset(temporary, name, columns, date_column, frame.index.name)
+
+
+def staging_path(name):
+    """Private directory a dataset is written into before it is published"""
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    temporary = os.path.join(DATASET_DIR, f'.{name}.{uuid.uuid4().hex}')
+    os.makedirs(temporary)
+    return temporary
+
+
+def publish_dataset(temporary, name, columns, date_column, index_name):
+    """Write the manifest and move a staged dataset into place, keeping any copy published first"""
+    with open(os.path.join(temporary, 'columns.json'), 'w') as handle:
+        json.dump({'columns': columns, 'date_column': date_column, 'index_name': index_name}, handle)
+    try:
+        os.rename(temporary, dataset_path(name))
+    except OSError:
+        shutil.rmtree(temporary)
+
+
+@contextmanager
+def dataset_lock(name):
+    """Hold the lock file of dataset name, shared by every thread and process writing to it"""
+    with open(os.path.join(dataset_path(name), '.lock'), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def set_active(slot, name):
+    """Point slot at dataset name for every process using it, e.g. after an upload"""
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    temporary = os.path.join(DATASET_DIR, f'.{slot}.{uuid.uuid4().hex}.active')
+    with open(temporary, 'w') as handle:
+        handle.write(name)
+    os.replace(temporary, os.path.join(DATASET_DIR, f'{slot}.active'))
+
+
+def active_dataset(slot):
+    """Name of the dataset slot points at: the last one set for it, or the dataset called slot itself"""
+    try:
+        with open(os.path.join(DATASET_DIR, f'{slot}.active')) as handle:
+            return handle.read()
+    except FileNotFoundError:
+        return slot
+
+
+def manifest_stamp(name):
+    """Identity of the current manifest of dataset name; every append replaces the manifest"""
+    status = os.stat(os.path.join(dataset_path(name), 'columns.json'))
+    return status.st_ino, status.st_mtime_ns
+
+
+def load_dataset(name):
+    """Opened dataset: its column names and memory-mapped date index, with columns mapped on first use
+
+    A dataset that rows were appended to since it was opened is opened again, so the result is a new dict.
+    """
+    stamp = manifest_stamp(name)
+    if name not in datasets or datasets[name]['stamp'] != stamp:
+        path = dataset_path(name)
+        with open(os.path.join(path, 'columns.json')) as handle:
+            meta = json.load(handle)
+        datasets[name] = {
+            'name': name,
+            'path': path,
+            'stamp': stamp,
+            'columns': meta['columns'],
+            'date_column': meta['date_column'],
+            'index_name': meta['index_name'],
+            'dates': np.load(os.path.join(path, 'dates.npy'), mmap_mode='r'),
+            'mapped': {}
+        }
+    return datasets[name]
+
+
+def append_npy(path, values):
+    """Append values to a one-dimensional .npy file, rewriting only its header when the row count fits in it"""
+    with open(path, 'r+b') as handle:
+        np.lib.format.read_magic(handle)
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(handle)
+        header_size = handle.tell()
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {'descr': dtype.str, 'fortran_order': False, 'shape': (shape[0] + len(values),)})
+
+        if len(header.getvalue()) == header_size:
+            # Rows are written before the header, so a reader never maps rows that are not there yet
+            handle.seek(0, os.SEEK_END)
+            handle.write(np.asarray(values, dtype=dtype).tobytes())
+            handle.flush()
+            handle.seek(0)
+            handle.write(header.getvalue())
+            return
+    existing = np.load(path, mmap_mode='r')
+    combined = np.concatenate([existing, np.asarray(values, dtype=dtype)])
+    del existing
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    np.save(temporary, combined)
+    os.replace(temporary + '.npy', path)
+
+
+def append_rows(name, frame, date_column=None):
+    """Append rows dated after the last stored row to dataset name, in time proportional to the new rows
+
+    The dates come from date_column or the index of frame, and every stored column must be present. Each
+    column keeps its stored dtype. Readers holding the dataset keep their old view; load_dataset returns
+    the extended one.
+    """
+    if date_column is not None:
+        frame = frame.set_index(date_column)
+    frame = frame.sort_index()
+    dates = pd.DatetimeIndex(frame.index).to_numpy(dtype='datetime64[ns]')
+    # Each worker is its own process, so the check, the append and the manifest replace hold a file lock
+    with dataset_lock(name):
+        dataset = load_dataset(name)
+        missing = [column for column in dataset['columns'] if column not in frame.columns]
+        if missing:
+            raise ValueError(f'appended rows lack the columns {missing}')
+        if len(dates) and len(dataset['dates']) and dates[0] <= dataset['dates'][-1]:
+            raise ValueError('appended rows must be dated after the last stored row')
+        if not len(dates):
+            return dataset
+
+        # Columns grow before the dates and the dates before the manifest, so every opened view is consistent
+        for i, column in enumerate(dataset['columns']):
+            append_npy(os.path.join(dataset['path'], f'column_{i}.npy'), frame[column].to_numpy(dtype=float))
+        append_npy(os.path.join(dataset['path'], 'dates.npy'), dates)
+        with open(os.path.join(dataset['path'], 'columns.json')) as handle:
+            meta = json.load(handle)
+        temporary = os.path.join(dataset['path'], f'.columns.{uuid.uuid4().hex}.json')
+        with open(temporary, 'w') as handle:
+            json.dump(meta, handle)
+        os.replace(temporary, os.path.join(dataset['path'], 'columns.json'))
+        return load_dataset(name)
+
+
+def dataset_column(dataset, column):
+    """Read-only memory map of one column, opened the first time it is asked for"""
+    if column not in dataset['mapped']:
+        position = dataset['columns'].index(column)
+        dataset['mapped'][column] = np.load(os.path.join(dataset['path'], f'column_{position}.npy'), mmap_mode='r')
+    return dataset['mapped'][column]
+
+
+def date_bounds(dataset, start_date=None, end_date=None):
+    """Row positions [i, j) of the inclusive date window, found by binary search on the date index"""
+    dates = dataset['dates']
+    i = 0 if start_date is None else dates.searchsorted(pd.Timestamp(start_date).to_datetime64(), 'left')
+    j = len(dates) if end_date is None else dates.searchsorted(pd.Timestamp(end_date).to_datetime64(), 'right')
+    return i, j
+
+
+def dataset_frame(dataset, start_date=None, end_date=None, columns=None):
+    """DataFrame over a date window whose columns are views of the mapped files, not copies
+
+    Dates form the index, or the original date column when the dataset was written from one.
+    """
+    i, j = date_bounds(dataset, start_date, end_date)
+    columns = dataset['columns'] if columns is None else columns
+    values = {column: dataset_column(dataset, column)[i:j] for column in columns}
+    dates = pd.DatetimeIndex(dataset['dates'][i:j], name=dataset['index_name'])
+    if dataset['date_column'] is None:
+        return pd.DataFrame(values, index=dates, copy=False)
+    return pd.DataFrame({dataset['date_column']: dates, **values}, copy=False)
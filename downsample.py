@@ -0,0 +1,65 @@
+import numpy as np
+
+
+def as_float(x):
+    """Numeric view of an x axis, with dates as integer nanoseconds"""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb_indices(x, y, n_out):
+    """Positions kept by Largest-Triangle-Three-Buckets, always including the first and last point"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = as_float(x)
+    y = np.asarray(y, dtype=float)
+
+    # n_out - 2 buckets over the interior points; bucket averages are the right-hand anchors
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    counts = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts, y[-1])
+
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        area = np.abs((x[a] - avg_x[b + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[b + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[b + 1] = a
+    return keep
+
+
+def minmax_indices(y, n_out):
+    """Positions of the minimum and maximum of each of n_out / 2 equal buckets, so every spike survives"""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    size = -(-n // (n_out // 2))
+    buckets = -(-n // size)
+
+    # Pad the last bucket with its final value so all buckets reshape to the same width
+    padded = np.concatenate([np.asarray(y, dtype=float), np.full(buckets * size - n, y[-1])]).reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    keep = np.concatenate([[0, n - 1], offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1)])
+    return np.unique(np.minimum(keep, n - 1))
+
+
+def downsample_indices(x, columns, n_out, method='lttb'):
+    """Positions shared by several series on the same x axis, the union of each series' own selection"""
+    if method == 'minmax':
+        selections = [minmax_indices(y, n_out) for y in columns]
+    else:
+        selections = [lttb_indices(x, y, n_out) for y in columns]
+    return np.unique(np.concatenate(selections))
+
+
+def downsample_series(series, n_out, method='lttb'):
+    """A pandas Series, or a DataFrame whose columns share the kept rows, reduced to about n_out points per column"""
+    columns = [series.to_numpy()] if series.ndim == 1 else [series[column].to_numpy() for column in series.columns]
+    keep = downsample_indices(series.index, columns, n_out, method)
+    return series.iloc[keep]
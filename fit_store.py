@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+import numpy as np
+
+# Directory shared by every worker process; survives restarts and deploys
+STORE_DIR = os.environ.get('FIT_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fit_store'))
+
+# Dataset versions kept on disk; fits of older versions are removed as new ones are stored
+MAX_VERSIONS = 4
+
+
+def connect():
+    """Connection to the store's SQLite index, created on first use"""
+    os.makedirs(STORE_DIR, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(STORE_DIR, 'index.sqlite'), timeout=30)
+
+    # Write-ahead logging lets every worker read while one of them writes
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS fits ('
+        'version TEXT, query TEXT, path TEXT, meta TEXT, created REAL, '
+        'PRIMARY KEY (version, query))'
+    )
+    return connection
+
+
+def pack(value):
+    """Split a result dict into JSON metadata and the arrays written to disk
+
+    Arrays are stored as they are; lists of arrays, like per-model coefficients, are concatenated with their lengths.
+    Binary blobs such as images go in as uint8 arrays, so the index only holds small metadata.
+    """
+    meta = {'json': {}, 'arrays': [], 'ragged': []}
+    arrays = {}
+    for name, item in value.items():
+        if isinstance(item, np.ndarray):
+            meta['arrays'].append(name)
+            arrays[name] = item
+        elif isinstance(item, list) and item and all(isinstance(part, np.ndarray) for part in item):
+            meta['ragged'].append(name)
+            arrays[name] = np.concatenate(item)
+            arrays[name + '.sizes'] = np.array([len(part) for part in item])
+        else:
+            meta['json'][name] = item
+    return meta, arrays
+
+
+def unpack(meta, arrays):
+    """Rebuild the result dict written by pack"""
+    value = dict(meta['json'])
+    for name in meta['arrays']:
+        value[name] = arrays[name]
+    for name in meta['ragged']:
+        value[name] = np.split(arrays[name], np.cumsum(arrays[name + '.sizes'])[:-1])
+    return value
+
+
+def load_fit(version, query):
+    """Stored result of query on dataset version, or None"""
+    with closing(connect()) as connection, connection:
+        row = connection.execute('SELECT path, meta FROM fits WHERE version = ? AND query = ?', (version, query)).fetchone()
+    if row is None:
+        return None
+    try:
+        with np.load(os.path.join(STORE_DIR, row[0]), allow_pickle=False) as arrays:
+            return unpack(json.loads(row[1]), arrays)
+    except (OSError, ValueError):
+        # A file removed by another worker's pruning counts as a miss
+        return None
+
+
+def version_queries(version):
+    """Queries with a stored result on dataset version"""
+    with closing(connect()) as connection, connection:
+        return [query for (query,) in connection.execute('SELECT query FROM fits WHERE version = ?', (version,))]
+
+
+def save_fit(version, query, value):
+    """Write the result of query on dataset version, replacing any earlier copy"""
+    meta, arrays = pack(value)
+    name = hashlib.blake2b(f'{version}\n{query}'.encode(), digest_size=16).hexdigest() + '.npz'
+
+    # Write to a private file first so readers never see a partly written array file
+    temporary = os.path.join(STORE_DIR, f'{name}.{os.getpid()}.tmp')
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with open(temporary, 'wb') as handle:
+        np.savez_compressed(handle, **arrays)
+    os.replace(temporary, os.path.join(STORE_DIR, name))
+
+    with closing(connect()) as connection, connection:
+        connection.execute(
+            'INSERT OR REPLACE INTO fits VALUES (?, ?, ?, ?, ?)',
+            (version, query, name, json.dumps(meta), time.time())
+        )
+    prune_versions()
+
+
+def prune_versions():
+    """Remove the fits of all but the MAX_VERSIONS most recently written dataset versions"""
+    with closing(connect()) as connection, connection:
+        stale = connection.execute(
+            'SELECT path FROM fits WHERE version NOT IN '
+            '(SELECT version FROM fits GROUP BY version ORDER BY MAX(created) DESC LIMIT ?)',
+            (MAX_VERSIONS,)
+        ).fetchall()
+        connection.execute(
+            'DELETE FROM fits WHERE version NOT IN '
+            '(SELECT version FROM fits GROUP BY version ORDER BY MAX(created) DESC LIMIT ?)',
+            (MAX_VERSIONS,)
+        )
+    for (path,) in stale:
+        try:
+            os.remove(os.path.join(STORE_DIR, path))
+        except FileNotFoundError:
+            pass
+
+
+def stored(version, query, compute):
+    """Result of query on dataset version from disk, computed and written on a miss"""
+    value = load_fit(version, query)
+    if value is None:
+        value = compute()
+        save_fit(version, query, value)
+    return value
@@ -0,0 +1,229 @@
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from parallel_grid import share_frame, attach_frame
+from ols_grid import window_gram, grid_columns, fit_subset, stack_models, grid_statistics, compact_result, nontrivial, screen_models
+
+# Worker processes shared by all jobs; one core is left for the web workers
+JOB_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+# Models fitted per pool task, the unit of progress, partial results and cancellation
+JOB_CHUNK = 8
+
+# Largest grid a job queues; jobs take grids too big for one page, but every result is kept in memory
+MAX_JOB_MODELS = 20000
+
+# Finished jobs kept for polling before the oldest are forgotten
+MAX_FINISHED_JOBS = 100
+
+FINISHED = ('done', 'failed', 'cancelled')
+
+# Jobs by id, and a heap of (priority, sequence, job id, chunk) tasks waiting for a worker
+jobs = {}
+pending = []
+sequence = itertools.count()
+jobs_lock = threading.Condition()
+running = 0
+executor = None
+dispatcher = None
+
+
+def fit_chunk(shared, models, filters):
+    """Table statistics of the (number, dependent, predictors) models that pass the filters, run in a worker"""
+    block, filtered_data = attach_frame(shared)
+    try:
+        return chunk_results(filtered_data, models, filters)
+    finally:
+        del filtered_data
+        block.close()
+
+
+def chunk_results(filtered_data, models, filters):
+    """Table statistics of the models of one chunk that pass the filters"""
+    dep_vars = [dep_var for _, dep_var, _ in models]
+    gram = window_gram(filtered_data, grid_columns(filtered_data, dep_vars, [ind_vars for _, _, ind_vars in models]))
+    grid = grid_statistics(filtered_data, stack_models([fit_subset(gram, dep_var, ind_vars) for _, dep_var, ind_vars in models]))
+    # Exact fits, whose dependent is among their predictors, are left out as in screening
+    survivors = screen_models(filtered_data, grid, **filters) if filters is not None else np.flatnonzero(nontrivial(grid))
+    return [{'model': models[i][0], 'stats': json_safe(compact_result(grid, i))} for i in survivors]
+
+
+def json_safe(value):
+    """value with NaN and infinite numbers, e.g. of a window shorter than the model, turned into None
+
+    Results are served as JSON, which has no literal for them.
+    """
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    if isinstance(value, (float, np.floating)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def submit_job(filtered_data, dep_vars, ind_combinations, filters=None, priority=0):
+    """Queue every dependent/predictor pair of a grid and return the job id at once; lower priorities run first"""
+    models = [(n, dep_var, ind_vars) for n, (dep_var, ind_vars) in
+              enumerate(itertools.product(dep_vars, ind_combinations), start=1)]
+    chunks = [models[i:i + JOB_CHUNK] for i in range(0, len(models), JOB_CHUNK)]
+    job_id = uuid.uuid4().hex
+
+    # The window is copied into shared memory once per job instead of being pickled with every chunk
+    block, shared = share_frame(filtered_data)
+    job = {
+        'id': job_id,
+        'status': 'queued',
+        'priority': priority,
+        'submitted': time.time(),
+        'finished': None,
+        'chunks_total': len(chunks),
+        'chunks_done': 0,
+        'models_total': len(models),
+        'models_done': 0,
+        'results': [],
+        'error': None,
+        'block': block,
+        'shared': shared,
+        'filters': filters,
+        'futures': set()
+    }
+    with jobs_lock:
+        jobs[job_id] = job
+        for chunk in chunks:
+            heapq.heappush(pending, (priority, next(sequence), job_id, chunk))
+        if not chunks:
+            finish(job, 'done')
+        start_dispatcher()
+        jobs_lock.notify_all()
+    return job_id
+
+
+def start_dispatcher():
+    """Start the pool and the thread feeding it, once per process; called with jobs_lock held"""
+    global executor, dispatcher
+    if dispatcher is None:
+        executor = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+        dispatcher = threading.Thread(target=dispatch, name='grid-jobs', daemon=True)
+        dispatcher.start()
+
+
+def dispatch():
+    """Hand the highest-priority waiting task to the pool whenever a worker is free"""
+    global running
+    while True:
+        with jobs_lock:
+            while not pending or running >= JOB_WORKERS:
+                jobs_lock.wait()
+            _, _, job_id, chunk = heapq.heappop(pending)
+            job = jobs.get(job_id)
+            if job is None or job['status'] in FINISHED:
+                continue
+            job['status'] = 'running'
+            running += 1
+            future = executor.submit(fit_chunk, job['shared'], chunk, job['filters'])
+            job['futures'].add(future)
+        future.add_done_callback(partial(chunk_done, job_id, len(chunk)))
+
+
+def chunk_done(job_id, size, future):
+    """Record a finished task: append its results, advance progress, or fail the job"""
+    global running
+    with jobs_lock:
+        running -= 1
+        jobs_lock.notify_all()
+        job = jobs.get(job_id)
+        if job is None:
+            return
+        job['futures'].discard(future)
+        if job['status'] in FINISHED or future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            job['error'] = repr(error)
+            finish(job, 'failed')
+            return
+        job['results'].extend(future.result())
+        job['chunks_done'] += 1
+        job['models_done'] += size
+        if job['chunks_done'] == job['chunks_total']:
+            finish(job, 'done')
+
+
+def finish(job, status):
+    """Mark a job finished, release its data and forget the oldest finished jobs; called with jobs_lock held"""
+    job['status'] = status
+    job['finished'] = time.time()
+
+    # Workers still running a chunk keep their own mapping; the name is removed for everyone else
+    job['block'].close()
+    job['block'].unlink()
+    finished = sorted((other['finished'], other['id']) for other in jobs.values() if other['status'] in FINISHED)
+    for _, job_id in finished[:-MAX_FINISHED_JOBS]:
+        del jobs[job_id]
+
+
+def job_status(job_id):
+    """Status and progress of a job, or None for an unknown id"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return None
+        return {
+            'job_id': job_id,
+            'status': job['status'],
+            'priority': job['priority'],
+            'progress': job['models_done'] / job['models_total'] if job['models_total'] else 1.0,
+            'models_done': job['models_done'],
+            'models_total': job['models_total'],
+            'results_available': len(job['results']),
+            'error': job['error'],
+            'elapsed': (job['finished'] or time.time()) - job['submitted']
+        }
+
+
+def job_results(job_id, offset=0):
+    """Results of a job from position offset on, available while it is still running, or None for an unknown id"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return None
+        results = job['results'][offset:]
+        return {
+            'job_id': job_id,
+            'status': job['status'],
+            'offset': offset,
+            'next_offset': offset + len(results),
+            'results': results
+        }
+
+
+def jobs_stats():
+    """Jobs by status, tasks waiting for a worker and tasks running"""
+    with jobs_lock:
+        statuses = {}
+        for job in jobs.values():
+            statuses[job['status']] = statuses.get(job['status'], 0) + 1
+        return {'statuses': statuses, 'pending': len(pending), 'running': running}
+
+
+def cancel_job(job_id):
+    """Stop a job: its waiting tasks are dropped and results of tasks still running are discarded"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return None
+        if job['status'] not in FINISHED:
+            finish(job, 'cancelled')
+            for future in list(job['futures']):
+                future.cancel()
+    return job_status(job_id)
@@ -0,0 +1,140 @@
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+from column_store import staging_path, publish_dataset
+
+# Rows parsed and written per chunk, bounding memory use whatever the file size
+CHUNK_ROWS = 100_000
+
+# Bytes copied per block when the raw column files are turned into .npy files
+COPY_BYTES = 16 * 1024 * 1024
+
+# Significant decimal digits float32 always reproduces
+FLOAT32_DIGITS = 7
+
+
+def float32_safe(values):
+    """Whether every value has at most FLOAT32_DIGITS significant digits, so float32 loses nothing that was written"""
+    values = values[np.isfinite(values) & (values != 0)]
+    if not len(values):
+        return True
+    if np.abs(values).max() > np.finfo(np.float32).max or np.abs(values).min() < np.finfo(np.float32).tiny:
+        return False
+    scale = 10.0 ** (FLOAT32_DIGITS - 1 - np.floor(np.log10(np.abs(values))))
+    rounded = np.round(values * scale) / scale
+    return bool(np.all(np.abs(rounded - values) <= 1e-12 * np.abs(values)))
+
+
+def csv_chunks(source):
+    """DataFrames of CHUNK_ROWS rows parsed from a CSV file object or path"""
+    return pd.read_csv(source, chunksize=CHUNK_ROWS)
+
+
+def parquet_chunks(source):
+    """DataFrames of CHUNK_ROWS rows read batch by batch from a Parquet file object or path"""
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=CHUNK_ROWS):
+        yield batch.to_pandas()
+
+
+def file_chunks(source, filename):
+    """Chunks of an uploaded file, parsed by its extension"""
+    if filename.lower().endswith(('.parquet', '.pq')):
+        return parquet_chunks(source)
+    return csv_chunks(source)
+
+
+def copy_raw(raw_path, npy_path, dtype, rows):
+    """Write a raw float64 column file as a .npy file of dtype, one block at a time"""
+    with open(raw_path, 'rb') as raw, open(npy_path, 'wb') as out:
+        np.lib.format.write_array_header_1_0(out, {'descr': np.dtype(dtype).str, 'fortran_order': False, 'shape': (rows,)})
+        while True:
+            block = raw.read(COPY_BYTES)
+            if not block:
+                break
+            out.write(np.frombuffer(block, dtype=np.float64).astype(dtype).tobytes())
+    os.remove(raw_path)
+
+
+def ingest_chunks(chunks, name, date_column='date', as_column=False):
+    """Write chunked input into the columnar store and return the column names
+
+    The numeric columns of the first chunk are kept; rows with a missing date or value are dropped.
+    Each column is stored as float32 when its values allow it and float64 otherwise. The dates are
+    stored as 'date', either as the index or, with as_column, as a date column.
+    """
+    temporary = staging_path(name)
+    handles = {}
+    try:
+        columns = None
+        rows = 0
+        in_order = True
+        last_date = None
+        for chunk in chunks:
+            if columns is None:
+                if date_column not in chunk.columns:
+                    raise ValueError(f'no {date_column!r} column in the uploaded file')
+                columns = [column for column in chunk.select_dtypes('number').columns if column != date_column]
+                handles = {column: open(os.path.join(temporary, f'column_{i}.raw'), 'wb') for i, column in enumerate(columns)}
+                handles[date_column] = open(os.path.join(temporary, 'dates.raw'), 'wb')
+                compact = dict.fromkeys(columns, True)
+
+            # Later chunks may infer other dtypes, so every kept column is coerced the same way
+            values = chunk[columns].apply(pd.to_numeric, errors='coerce')
+            values.insert(0, date_column, pd.to_datetime(chunk[date_column], errors='coerce'))
+            values = values.dropna()
+
+            dates = values[date_column].to_numpy(dtype='datetime64[ns]')
+            if len(dates):
+                in_order &= bool(np.all(dates[1:] >= dates[:-1])) and (last_date is None or dates[0] >= last_date)
+                last_date = dates[-1]
+            handles[date_column].write(dates.astype(np.int64).tobytes())
+            for column in columns:
+                column_values = values[column].to_numpy(dtype=np.float64)
+                compact[column] = compact[column] and float32_safe(column_values)
+                handles[column].write(column_values.tobytes())
+            rows += len(values)
+
+        if columns is None:
+            raise ValueError('the uploaded file is empty')
+
+        # A regression needs a dependent and a predictor, and rows where both have a date and a value
+        if len(columns) < 2:
+            raise ValueError('the uploaded file needs at least two numeric columns')
+        if not rows:
+            raise ValueError(f'no row of the uploaded file has a valid {date_column!r} and a value in every column')
+        for handle in handles.values():
+            handle.close()
+
+        dates = np.fromfile(os.path.join(temporary, 'dates.raw'), dtype=np.int64).view('datetime64[ns]')
+        os.remove(os.path.join(temporary, 'dates.raw'))
+        order = None if in_order else np.argsort(dates, kind='stable')
+        np.save(os.path.join(temporary, 'dates.npy'), dates if order is None else dates[order])
+
+        for i, column in enumerate(columns):
+            npy_path = os.path.join(temporary, f'column_{i}.npy')
+            copy_raw(os.path.join(temporary, f'column_{i}.raw'), npy_path, np.float32 if compact[column] else np.float64, rows)
+            if order is not None:
+                # Out-of-order files are sorted one column at a time
+                mapped = np.load(npy_path, mmap_mode='r+')
+                mapped[:] = mapped[order]
+                mapped.flush()
+                del mapped
+    except BaseException:
+        for handle in handles.values():
+            handle.close()
+        shutil.rmtree(temporary)
+        raise
+
+    columns = [str(column) for column in columns]
+    publish_dataset(temporary, name, columns, 'date' if as_column else None, 'date')
+    return columns
+
+
+def ingest_file(source, filename, slot, date_column='date', as_column=False):
+    """Ingest an uploaded CSV or Parquet file as a new dataset and return its name"""
+    name = f'{slot}-{uuid.uuid4().hex[:12]}'
+    ingest_chunks(file_chunks(source, filename), name, date_column, as_column)
+    return name
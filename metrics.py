@@ -0,0 +1,82 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timing import histogram_lines
+from result_cache import fit_cache, chart_cache, summary_cache, cache_stats
+from single_flight import flight_stats
+from grid_jobs import jobs_stats
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'regression'
+
+# Content type of the Prometheus text format
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Port of the standalone endpoint used by apps without their own HTTP routes, e.g. the Panel apps; unset disables it
+METRICS_PORT = os.environ.get('METRICS_PORT')
+
+CACHES = {'fit': fit_cache, 'chart': chart_cache, 'summary': summary_cache}
+
+metrics_server = None
+metrics_server_lock = threading.Lock()
+
+
+def gauge_lines(name, kind, samples):
+    """Prometheus text lines of one metric from (labels, value) samples"""
+    name = f'{METRIC_PREFIX}_{name}'
+    lines = [f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{item}"' for key, item in labels.items())
+        lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return lines
+
+
+def metrics_text():
+    """Stage and request histograms of this process plus its cache, coalescing and job counters"""
+    lines = histogram_lines(METRIC_PREFIX)
+
+    stats = {cache: cache_stats(CACHES[cache]) for cache in CACHES}
+    lines += gauge_lines('cache_entries', 'gauge', [({'cache': cache}, stats[cache]['entries']) for cache in stats])
+    lines += gauge_lines('cache_bytes', 'gauge', [({'cache': cache}, stats[cache]['bytes']) for cache in stats])
+    lines += gauge_lines('cache_hits_total', 'counter', [({'cache': cache}, stats[cache]['hits']) for cache in stats])
+    lines += gauge_lines('cache_misses_total', 'counter', [({'cache': cache}, stats[cache]['misses']) for cache in stats])
+
+    flights = flight_stats()
+    lines += gauge_lines('flights_in_progress', 'gauge', [({}, flights['in_flight'])])
+    lines += gauge_lines('flights_coalesced_total', 'counter', [({}, flights['coalesced'])])
+
+    jobs = jobs_stats()
+    lines += gauge_lines('jobs', 'gauge', [({'status': status}, count) for status, count in sorted(jobs['statuses'].items())])
+    lines += gauge_lines('job_tasks_pending', 'gauge', [({}, jobs['pending'])])
+    lines += gauge_lines('job_tasks_running', 'gauge', [({}, jobs['running'])])
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Answers GET /metrics with metrics_text()"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=METRICS_PORT):
+    """Serve /metrics on port from a background thread, once per process; does nothing when port is unset"""
+    global metrics_server
+    if not port:
+        return None
+    with metrics_server_lock:
+        if metrics_server is None:
+            metrics_server = ThreadingHTTPServer(('', int(port)), MetricsHandler)
+            threading.Thread(target=metrics_server.serve_forever, name='metrics', daemon=True).start()
+    return metrics_server
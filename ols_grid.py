@@ -0,0 +1,373 @@
+import heapq
+import itertools
+import math
+import numpy as np
+from scipy import stats
+from parallel_grid import parallel_adf
+
+# Per-model statistics that are stacked into arrays across the whole grid
+GRID_ARRAYS = ['nobs', 'df_resid', 'ssr', 'scale', 'rsquared', 'aic', 'bic']
+
+# Most models a result page fits; wider selections get fewer predictors per model
+MAX_GRID_MODELS = 500
+
+# Memory for the residuals of one block of models while their diagnostics are computed
+RESIDUAL_BLOCK_BYTES = 32 * 1024 * 1024
+
+# Ranking criteria for top-N selection, and whether larger values are better
+RANK_CRITERIA = {
+    'rsquared': True,
+    'rsquared_adj': True,
+    'aic': False,
+    'bic': False,
+    'resid_std': False
+}
+
+
+def window_gram(filtered_data, columns):
+    """Centered cross-product matrix of the selected columns over one window"""
+    values = filtered_data[columns].to_numpy(dtype=float)
+    means = values.mean(axis=0)
+    centered = values - means
+    return {
+        'columns': list(columns),
+        'nobs': values.shape[0],
+        'means': means,
+        'cross': centered.T @ centered
+    }
+
+
+def fit_targets(gram, dep_vars, ind_vars):
+    """OLS of every dep_var on a constant plus ind_vars, sharing one factorization of the predictor block"""
+    position = {column: i for i, column in enumerate(gram['columns'])}
+    d = [position[column] for column in dep_vars]
+    s = [position[column] for column in ind_vars]
+    nobs = gram['nobs']
+    means = gram['means']
+    cross = gram['cross']
+
+    # Centering absorbs the intercept, so only the predictor block is inverted,
+    # once for all targets stacked as columns of the response matrix. Like statsmodels, a rank-deficient
+    # block (collinear predictors, or a window shorter than the model) gets the pseudo-inverse and
+    # degrees of freedom from its rank, so its statistics come out NaN instead of raising
+    block = cross[np.ix_(s, s)]
+    xtx_inv = np.linalg.pinv(block, hermitian=True)
+    xty = cross[np.ix_(s, d)]
+    slopes = xtx_inv @ xty
+    intercepts = means[d] - means[s] @ slopes
+
+    k = np.linalg.matrix_rank(block, hermitian=True) + 1
+    df_resid = nobs - k
+    tss = np.diag(cross)[d]
+    ssr = np.maximum(tss - np.einsum('ij,ij->j', slopes, xty), 0.0)
+    # A window with no residual degrees of freedom leaves the error variance undefined
+    scale = ssr / df_resid if df_resid > 0 else np.full_like(ssr, np.nan)
+
+    slope_var = np.outer(np.diag(xtx_inv), scale)
+    intercept_var = scale * (1.0 / nobs + means[s] @ xtx_inv @ means[s])
+
+    # Gaussian log-likelihood, same definition statsmodels uses for AIC/BIC
+    with np.errstate(divide='ignore', invalid='ignore'):
+        llf = -nobs / 2.0 * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+        rsquared = 1 - ssr / tss
+
+    return [{
+        'dependent': dep_var,
+        'predictors': list(ind_vars),
+        'params': np.concatenate([[intercepts[j]], slopes[:, j]]),
+        'bse': np.sqrt(np.concatenate([[intercept_var[j]], slope_var[:, j]])),
+        'nobs': nobs,
+        'df_resid': df_resid,
+        'ssr': ssr[j],
+        'scale': scale[j],
+        'rsquared': rsquared[j],
+        'aic': -2 * llf[j] + 2 * k,
+        'bic': -2 * llf[j] + np.log(nobs) * k
+    } for j, dep_var in enumerate(dep_vars)]
+
+
+def fit_subset(gram, dep_var, ind_vars):
+    """OLS of a single dep_var on a constant plus ind_vars"""
+    return fit_targets(gram, [dep_var], ind_vars)[0]
+
+
+def stack_models(models):
+    """Turn a list of per-model dicts into one column-oriented grid"""
+    grid = {key: [model[key] for model in models] for key in ('dependent', 'predictors', 'params', 'bse')}
+    for key in GRID_ARRAYS:
+        grid[key] = np.array([model[key] for model in models])
+    return grid
+
+
+def grid_columns(filtered_data, dep_vars, ind_combinations):
+    """Every column used by the grid, in the order of the data"""
+    used = set(dep_vars).union(*ind_combinations)
+    return [column for column in filtered_data.columns if column in used]
+
+
+def predictor_combinations(candidates, max_size):
+    """Every combination of 1 to max_size of the candidates, smallest first"""
+    return [list(combination) for size in range(1, max_size + 1) for combination in itertools.combinations(candidates, size)]
+
+
+def default_grid(columns, max_size=3):
+    """Every column as a dependent against every combination of up to max_size of the columns after the first"""
+    return list(columns), predictor_combinations(columns[1:], max_size)
+
+
+def request_grid(columns, dep_var=None, ind_vars=None, max_size=3, max_models=MAX_GRID_MODELS):
+    """Grid of a result request, at most max_models models
+
+    The selected dependent, or every column, is regressed on combinations of the selected predictors, or
+    of the columns after the first. Combinations get smaller until the grid fits; if single predictors
+    still do not fit, ValueError asks for a narrower selection.
+    """
+    columns = list(columns)
+    dep_vars = [dep_var] if dep_var in columns else columns
+    candidates = [column for column in ind_vars or [] if column in columns] or columns[1:]
+    for size in range(min(max_size, len(candidates)), 0, -1):
+        # Counted before any combination is built, so a wide upload costs nothing to reject
+        if len(dep_vars) * sum(math.comb(len(candidates), n) for n in range(1, size + 1)) <= max_models:
+            return dep_vars, predictor_combinations(candidates, size)
+    raise ValueError(f'the selection spans more than {max_models} models; choose a dependent variable or fewer predictors')
+
+
+def fit_grid(filtered_data, dep_vars, ind_combinations):
+    """Fit every dependent/predictor pair from one shared cross-product matrix"""
+    gram = window_gram(filtered_data, grid_columns(filtered_data, dep_vars, ind_combinations))
+    by_subset = [fit_targets(gram, dep_vars, ind_vars) for ind_vars in ind_combinations]
+
+    # Keep the dependent-major order of the original nested loops
+    models = [by_subset[j][i] for i in range(len(dep_vars)) for j in range(len(ind_combinations))]
+    return attach_gram(stack_models(models), gram)
+
+
+def attach_gram(grid, gram):
+    """Keep the cross-product matrix a grid was fitted from, so appended rows can update it later"""
+    grid['gram_columns'] = gram['columns']
+    grid['gram_nobs'] = gram['nobs']
+    grid['gram_means'] = gram['means']
+    grid['gram_cross'] = gram['cross']
+    return grid
+
+
+def grid_gram(grid):
+    """Cross-product matrix kept by attach_gram, or None for a grid fitted without one"""
+    if 'gram_cross' not in grid:
+        return None
+    return {'columns': grid['gram_columns'], 'nobs': grid['gram_nobs'], 'means': grid['gram_means'], 'cross': grid['gram_cross']}
+
+
+def merge_gram(gram, values):
+    """Cross-product matrix of a window extended by the rows of values, without revisiting the window
+
+    The new rows add their own centered cross-products and one rank-one term for the shift of the means.
+    """
+    n, k = gram['nobs'], len(values)
+    if not k:
+        return gram
+    batch_means = values.mean(axis=0)
+    centered = values - batch_means
+    delta = batch_means - gram['means']
+    return {
+        'columns': gram['columns'],
+        'nobs': n + k,
+        'means': gram['means'] + delta * k / (n + k),
+        'cross': gram['cross'] + centered.T @ centered + np.outer(delta, delta) * n * k / (n + k)
+    }
+
+
+def refit_grid(grid, gram):
+    """Fit the models of an existing grid again from gram, in the same order"""
+    members = {}
+    for i, ind_vars in enumerate(grid['predictors']):
+        members.setdefault(tuple(ind_vars), []).append(i)
+    models = [None] * len(grid['dependent'])
+    for ind_vars, positions in members.items():
+        refits = fit_targets(gram, [grid['dependent'][i] for i in positions], list(ind_vars))
+        for i, model in zip(positions, refits):
+            models[i] = model
+    return attach_gram(stack_models(models), gram)
+
+
+def fitted_values(filtered_data, grid, i):
+    """In-sample predictions of model i of the grid"""
+    params = grid['params'][i]
+    return params[0] + filtered_data[grid['predictors'][i]].to_numpy(dtype=float) @ params[1:]
+
+
+def grid_residuals(filtered_data, grid, models=None):
+    """Residuals of the given models, or of every model, as the columns of one matrix from a single matrix product"""
+    if models is None:
+        models = range(len(grid['dependent']))
+    dep_vars = [grid['dependent'][i] for i in models]
+    predictors = [grid['predictors'][i] for i in models]
+    columns = grid_columns(filtered_data, dep_vars, predictors)
+    position = {column: i for i, column in enumerate(columns)}
+    values = filtered_data[columns].to_numpy(dtype=float)
+
+    # Column j of weights picks the dependent and subtracts the fitted slopes of the j-th model
+    weights = np.zeros((len(columns), len(dep_vars)))
+    for j, i in enumerate(models):
+        weights[[position[column] for column in predictors[j]], j] -= grid['params'][i][1:]
+        weights[position[dep_vars[j]], j] += 1
+    intercepts = np.array([grid['params'][i][0] for i in models])
+    return values @ weights - intercepts
+
+
+def grid_statistics(filtered_data, grid):
+    """Add t-stats, p-values, adjusted R², F-stat, Durbin-Watson and the largest absolute residual to the grid
+
+    The residual matrix itself, rows by models, is not kept; grid_residuals rebuilds the columns a caller needs.
+    """
+    # Models whose dependent is also a predictor fit exactly and have zero standard errors
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grid['tvalues'] = [params / bse for params, bse in zip(grid['params'], grid['bse'])]
+
+    # One survival-function call over the t-stats of every model, split back per model
+    sizes = [len(tvalues) for tvalues in grid['tvalues']]
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    pvalues = 2 * stats.t.sf(np.abs(np.concatenate(grid['tvalues'])), np.repeat(grid['df_resid'], sizes))
+    grid['pvalues'] = np.split(pvalues, starts[1:])
+
+    # Largest predictor p-value of each model, ignoring the constant in the first slot
+    predictor_pvalues = pvalues.copy()
+    predictor_pvalues[starts] = 0
+    grid['max_pvalue'] = np.maximum.reduceat(predictor_pvalues, starts)
+
+    nobs = grid['nobs']
+    df_resid = grid['df_resid']
+    df_model = nobs - df_resid - 1
+    rsquared = grid['rsquared']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grid['rsquared_adj'] = 1 - (nobs - 1) / df_resid * (1 - rsquared)
+        grid['fvalue'] = rsquared / df_model / ((1 - rsquared) / df_resid)
+    grid['f_pvalue'] = stats.f.sf(grid['fvalue'], df_model, df_resid)
+
+    grid['durbin_watson'], grid['max_abs_resid'] = residual_statistics(filtered_data, grid)
+    return grid
+
+
+def residual_statistics(filtered_data, grid):
+    """Durbin-Watson and largest absolute residual of every model
+
+    Residuals are built for a block of models at a time, so memory stays near RESIDUAL_BLOCK_BYTES however
+    long the window and however many models the grid holds.
+    """
+    count = len(grid['dependent'])
+    durbin_watson = np.full(count, np.nan)
+    max_abs_resid = np.full(count, np.nan)
+    if not len(filtered_data):
+        return durbin_watson, max_abs_resid
+
+    step = max(1, RESIDUAL_BLOCK_BYTES // (8 * len(filtered_data)))
+    for start in range(0, count, step):
+        block = slice(start, min(start + step, count))
+        resid = grid_residuals(filtered_data, grid, range(block.start, block.stop))
+        with np.errstate(invalid='ignore'):
+            durbin_watson[block] = np.sum(np.diff(resid, axis=0) ** 2, axis=0) / np.sum(resid ** 2, axis=0)
+        max_abs_resid[block] = np.abs(resid).max(axis=0)
+    return durbin_watson, max_abs_resid
+
+
+def compact_result(grid, i):
+    """Table-ready statistics of model i"""
+    terms = ['const'] + grid['predictors'][i]
+    return {
+        'dependent': grid['dependent'][i],
+        'predictors': grid['predictors'][i],
+        'terms': list(zip(terms, grid['params'][i], grid['bse'][i], grid['tvalues'][i], grid['pvalues'][i])),
+        'nobs': int(grid['nobs'][i]),
+        'rsquared': grid['rsquared'][i],
+        'rsquared_adj': grid['rsquared_adj'][i],
+        'fvalue': grid['fvalue'][i],
+        'f_pvalue': grid['f_pvalue'][i],
+        'durbin_watson': grid['durbin_watson'][i]
+    }
+
+
+def filter_threshold(value):
+    """Parse an optional numeric filter field, treating blanks as no filter; other text raises ValueError"""
+    if value is None or not value.strip():
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'filter value {value.strip()!r} is not a number') from None
+
+
+def nontrivial(grid):
+    """Mask of the models whose dependent is not one of their own predictors"""
+    return np.array([dep_var not in ind_vars for dep_var, ind_vars in zip(grid['dependent'], grid['predictors'])], dtype=bool)
+
+
+def screen_mask(grid, p_stat=None, error_std=None, max_error=None):
+    """Mask of the models passing every filter but the ADF test, in one pass over the grid"""
+    # Models whose dependent is also a predictor fit exactly and would pass every error filter
+    keep = nontrivial(grid)
+    if p_stat is not None:
+        keep &= grid['max_pvalue'] <= p_stat
+    if error_std is not None:
+        keep &= np.sqrt(grid['scale']) <= error_std
+    if max_error is not None:
+        keep &= grid['max_abs_resid'] <= max_error
+    return keep
+
+
+def screen_models(filtered_data, grid, p_stat=None, error_std=None, max_error=None, adf_pstat=None):
+    """Indices of the models passing the filters, with the ADF test run only on cheap-check survivors
+
+    Residuals for the ADF test are rebuilt from the window rows for the survivors alone.
+    """
+    survivors = np.flatnonzero(screen_mask(grid, p_stat, error_std, max_error))
+
+    if adf_pstat is not None and len(survivors):
+        _, adf_pvalues, _ = parallel_adf(grid_residuals(filtered_data, grid, survivors))
+        survivors = survivors[adf_pvalues <= adf_pstat]
+    return survivors
+
+
+def rank_values(grid, criterion):
+    """Per-model values of a ranking criterion"""
+    if criterion == 'resid_std':
+        return np.sqrt(grid['scale'])
+    return grid[criterion]
+
+
+def top_models(grid, candidates, criterion, k):
+    """Indices of the k best candidates by criterion, keeping only a bounded heap while scanning"""
+    sign = 1 if RANK_CRITERIA[criterion] else -1
+    values = sign * rank_values(grid, criterion)
+
+    # Exact fits would always rank first, so they are left out like in screening
+    usable = nontrivial(grid) & ~np.isnan(values)
+
+    # Min-heap of (score, -index) so ties keep the earlier grid position
+    heap = []
+    for i in candidates:
+        if not usable[i]:
+            continue
+        entry = (values[i], -i)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return [-i for _, i in sorted(heap, reverse=True)]
+
+
+def compact_html(stats):
+    """Compact statistics table of one model, the same layout as the grid result pages"""
+    rows = ''.join(
+        '<tr><td>%s</td><td>%.4f</td><td>%.4f</td><td>%.3f</td><td>%.3f</td></tr>' % term
+        for term in stats['terms']
+    )
+    return (
+        '<table class="table table-sm">'
+        '<thead><tr><th>%s</th><th>coef</th><th>std err</th><th>t</th><th>P&gt;|t|</th></tr></thead>'
+        '<tbody>%s</tbody></table>'
+        '<p>No. Observations: %d | R-squared: %.3f | Adj. R-squared: %.3f | '
+        'F-statistic: %.3f (Prob %.3g) | Durbin-Watson: %.3f</p>'
+    ) % (
+        stats['dependent'], rows, stats['nobs'], stats['rsquared'], stats['rsquared_adj'],
+        stats['fvalue'], stats['f_pvalue'], stats['durbin_watson']
+    )
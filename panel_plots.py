@@ -0,0 +1,61 @@
+import numpy as np
+import holoviews as hv
+import hvplot.pandas
+from downsample import as_float, downsample_series
+
+# Points sent to the browser per plot, about one per pixel column of a wide plot
+PLOT_POINTS = 1000
+
+# Pixel size of server-side rasters; the browser receives this many values however long the series is
+RASTER_WIDTH = 800
+RASTER_HEIGHT = 300
+
+
+def zoomable_plot(series, method='minmax', **options):
+    """hvplot line of a Series or DataFrame, re-downsampled from the full-resolution data whenever the visible x-range changes"""
+    def view(x_range):
+        visible = series if x_range is None else series.loc[x_range[0]:x_range[1]]
+        return downsample_series(visible, PLOT_POINTS, method).hvplot(**options)
+    return hv.DynamicMap(view, streams=[hv.streams.RangeX()])
+
+
+def rasterize_series(series, x_range=None, y_range=None, width=RASTER_WIDTH, height=RASTER_HEIGHT):
+    """Line density of series aggregated onto a width x height pixel grid over the requested ranges"""
+    if x_range is not None:
+        series = series.loc[x_range[0]:x_range[1]]
+    x = as_float(series.index)
+    y = series.to_numpy(dtype=float)
+    x0, x1 = (x.min(), x.max()) if x_range is None else as_float(list(x_range))
+    y0, y1 = (y.min(), y.max()) if y_range is None else y_range
+    x1 = x1 if x1 > x0 else x0 + 1
+    y1 = y1 if y1 > y0 else y0 + 1
+
+    col = np.clip(((x - x0) / (x1 - x0) * width).astype(int), 0, width - 1)
+    row = np.clip(((y - y0) / (y1 - y0) * height).astype(int), 0, height - 1)
+    counts = np.bincount(row * width + col, minlength=width * height).reshape(height, width).astype(float)
+
+    # Fill the rows each segment crosses in its starting column so the line stays continuous
+    lo = np.full(width, height)
+    hi = np.full(width, -1)
+    np.minimum.at(lo, col[:-1], np.minimum(row[:-1], row[1:]))
+    np.maximum.at(hi, col[:-1], np.maximum(row[:-1], row[1:]))
+    rows = np.arange(height)[:, None]
+    image = np.where((rows >= lo) & (rows <= hi), np.maximum(counts, 1), counts)
+    image[image == 0] = np.nan
+
+    # Pixel centres; dates go back to datetime64 so the axis keeps its date ticks
+    xs = x0 + (np.arange(width) + 0.5) * (x1 - x0) / width
+    ys = y0 + (np.arange(height) + 0.5) * (y1 - y0) / height
+    if np.issubdtype(series.index.dtype, np.datetime64):
+        xs = xs.astype(np.int64).astype('datetime64[ns]')
+    return hv.Image((xs, ys, image), kdims=[series.index.name or 'index', series.name or 'value'])
+
+
+def rasterized_plot(series, title=None, ylabel=None):
+    """Server-side raster of series, re-aggregated at full resolution on every zoom and pan"""
+    def view(x_range, y_range):
+        return rasterize_series(series, x_range, y_range)
+    return hv.DynamicMap(view, streams=[hv.streams.RangeXY()]).opts(
+        cmap='Blues', cnorm='eq_hist', clipping_colors={'NaN': 'transparent'},
+        title=title or '', ylabel=ylabel, width=RASTER_WIDTH, height=RASTER_HEIGHT
+    )
@@ -0,0 +1,85 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from adf_batch import adf_batch
+
+# Worker processes for the per-model work of large grids
+PARALLEL_WORKERS = min(32, os.cpu_count() or 1)
+
+# Below this many models the pool costs more than it saves
+PARALLEL_THRESHOLD = 64
+
+pool = None
+pool_lock = threading.Lock()
+
+
+def worker_pool():
+    """Process pool shared by every request, started on first use"""
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS)
+    return pool
+
+
+def share_array(array):
+    """Copy array into a new shared-memory block; returns the block and the descriptor workers attach with"""
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach_array(descriptor):
+    """Block and zero-copy array view of a shared array; drop the view before closing the block"""
+    name, shape, dtype = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype, buffer=block.buf)
+
+
+def share_frame(frame):
+    """Numeric values of frame in shared memory, with the column names needed to rebuild it"""
+    block, descriptor = share_array(frame.to_numpy(dtype=float))
+    return block, (descriptor, list(frame.columns))
+
+
+def attach_frame(shared):
+    """Block and DataFrame view of a shared frame; the date index is not carried over"""
+    descriptor, columns = shared
+    block, values = attach_array(descriptor)
+    return block, pd.DataFrame(values, columns=columns, copy=False)
+
+
+def adf_columns(descriptor, start, stop, maxlag, autolag):
+    """ADF results of columns [start, stop) of a shared matrix, run in a worker"""
+    block, series = attach_array(descriptor)
+    try:
+        return adf_batch(series[:, start:stop], maxlag, autolag)
+    finally:
+        del series
+        block.close()
+
+
+def parallel_adf(series, maxlag=None, autolag='AIC'):
+    """adf_batch over the columns of series, split into contiguous chunks across the worker pool
+
+    Every column is tested independently, so the chunks concatenated in order match the serial result exactly.
+    """
+    count = series.shape[1]
+    if count < PARALLEL_THRESHOLD or PARALLEL_WORKERS < 2:
+        return adf_batch(series, maxlag, autolag)
+
+    # The matrix is copied into shared memory once; tasks only carry its name and their column range
+    block, descriptor = share_array(np.asarray(series, dtype=float))
+    try:
+        bounds = np.linspace(0, count, min(count, 4 * PARALLEL_WORKERS) + 1).astype(int)
+        futures = [worker_pool().submit(adf_columns, descriptor, start, stop, maxlag, autolag)
+                   for start, stop in zip(bounds[:-1], bounds[1:])]
+        parts = [future.result() for future in futures]
+    finally:
+        block.close()
+        block.unlink()
+    return tuple(np.concatenate(results) for results in zip(*parts))
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# Query indexes shared by every session of the process, least recently used first
+MAX_INDEXES = 32
+indexes = {}
+
+
+def index_rows(index, frame):
+    """Constant plus shifted values of the indexed columns, the rows the cross-products are built from"""
+    values = frame[index['columns']].to_numpy(dtype=float) - index['shift']
+    return np.column_stack([np.ones(len(values)), values])
+
+
+def cumulative_cross(rows, start):
+    """Running sums of the outer products of rows, continuing from the cross-product matrix start"""
+    return start + np.cumsum(np.einsum('ti,tj->tij', rows, rows), axis=0)
+
+
+def build_index(frame, date_column='date'):
+    """Prefix sums of the cross-products of [1, columns] along the date axis of frame"""
+    columns = [column for column in frame.columns if column != date_column]
+
+    # Shifting by the column means keeps the prefix sums small, so window differences stay accurate
+    index = {
+        'columns': columns,
+        'date_column': date_column,
+        'shift': frame[columns].to_numpy(dtype=float).mean(axis=0),
+        'dates': frame[date_column].to_numpy(dtype='datetime64[ns]')
+    }
+    size = len(columns) + 1
+    index['cum'] = np.concatenate([np.zeros((1, size, size)), cumulative_cross(index_rows(index, frame), 0.0)])
+    return index
+
+
+def sync_index(index, frame):
+    """Bring the index up to date with frame, extending it in place when rows were only appended"""
+    dates = frame[index['date_column']].to_numpy(dtype='datetime64[ns]')
+    n = len(index['dates'])
+    if len(dates) >= n > 0 and dates[n - 1] == index['dates'][-1]:
+        if len(dates) > n:
+            new_rows = index_rows(index, frame.iloc[n:])
+            index['cum'] = np.concatenate([index['cum'], cumulative_cross(new_rows, index['cum'][-1])])
+            index['dates'] = dates
+    else:
+        # Anything but an append invalidates the prefix sums
+        index.update(build_index(frame, index['date_column']))
+    return index
+
+
+def window_bounds(index, start_date, end_date):
+    """Row positions [i, j) of the inclusive date window, like .loc[start_date:end_date]"""
+    i = 0 if start_date is None else index['dates'].searchsorted(pd.Timestamp(start_date).to_datetime64(), 'left')
+    j = len(index['dates']) if end_date is None else index['dates'].searchsorted(pd.Timestamp(end_date).to_datetime64(), 'right')
+    return i, j
+
+
+def index_gram(index, i, j):
+    """Centered cross-product matrix of rows [i, j) from two prefix-sum lookups"""
+    cross = index['cum'][j] - index['cum'][i]
+    nobs = cross[0, 0]
+    shifted_means = cross[0, 1:] / nobs
+    return {
+        'columns': index['columns'],
+        'nobs': int(round(nobs)),
+        'means': shifted_means + index['shift'],
+        'cross': cross[1:, 1:] - nobs * np.outer(shifted_means, shifted_means)
+    }
+
+
+def get_index(frame, name, version, columns, date_column='date'):
+    """Rows of frame with every given column known, and their prefix-sum index, shared per column set
+
+    Only the columns of one query are indexed, so the index stays (rows + 1) x (columns + 2)² however wide
+    the dataset is. Cached by dataset name and column set; when version moves on, sync_index extends the
+    index with appended rows instead of rebuilding it.
+    """
+    columns = list(dict.fromkeys(columns))
+    key = (name, tuple(columns))
+    entry = indexes.pop(key, None)
+    if entry is None or entry['version'] != version:
+        rows = frame[[date_column] + columns].dropna().reset_index(drop=True)
+        index = build_index(rows, date_column) if entry is None else sync_index(entry['index'], rows)
+        entry = {'version': version, 'rows': rows, 'index': index}
+    indexes[key] = entry
+    while len(indexes) > MAX_INDEXES:
+        indexes.pop(next(iter(indexes)))
+    return entry['rows'], entry['index']
@@ -1,80 +1,210 @@
-import datetime
+import io
 import numpy as np
 import pandas as pd
 import hvplot.pandas
 import statsmodels.api as sm
 import panel as pn
+from ols_grid import fit_subset, grid_residuals, stack_models, grid_statistics, compact_result, compact_html
+from range_index import get_index, window_bounds, index_gram
+from rolling_ols import rolling_ols
+from panel_plots import zoomable_plot, rasterized_plot
+from dataset_version import dataset_version
+from result_cache import fit_cache, summary_cache, query_key, cached
+from column_store import dataset_exists, write_dataset, load_dataset, dataset_frame, active_dataset, set_active
+from ingest import ingest_file
+from timing import stage, start_request, finish_request
+from metrics import serve_metrics
 
 pn.extension()
 
-# Create a sample time series dataset
-np.random.seed(0)
-dates = pd.date_range('2020-01-01', periods=100, freq='D')
-data = pd.DataFrame({
-   'date': dates,
-   'y': np.random.randn(100).cumsum(),
-   'x1': np.random.randn(100).cumsum(),
-   'x2': np.random.randn(100).cumsum()
-})
+# Stage histograms of the Panel sessions on their own /metrics endpoint, when METRICS_PORT is set
+serve_metrics()
 
-# Function to perform regression and plot errors
-def perform_regression(dependent_var, predictors, start_date, end_date):
-   df = data.set_index('date')
-   df = df.loc[start_date:end_date]
+# Stored dataset this app reads; an upload points it at the ingested file
+DATASET = 'panel_sample'
+
+# Create a sample time series dataset on first run; later runs map the stored columns
+if not dataset_exists('panel_sample'):
+   np.random.seed(0)
+   dates = pd.date_range('2020-01-01', periods=100, freq='D')
+   sample = pd.DataFrame({
+      'date': dates,
+      'y': np.random.randn(100).cumsum(),
+      'x1': np.random.randn(100).cumsum(),
+      'x2': np.random.randn(100).cumsum()
+   })
+   write_dataset('panel_sample', sample, date_column='date')
+data_source = load_dataset(active_dataset(DATASET))
+data = dataset_frame(data_source)
+version = dataset_version(data_source)
 
-   y = df[dependent_var]
-   X = df[predictors]
-   X = sm.add_constant(X)
+# Window of one query and the prefix sums of the columns it uses, shared by every session, so any
+# date window is fitted without rescanning its rows
+def query_window(dependent_var, predictors, start_date, end_date):
+   rows, index = get_index(data, data_source['name'], version, [dependent_var] + list(predictors))
+   df_start, df_stop = window_bounds(index, start_date, end_date)
+   return index, df_start, df_stop, rows.iloc[df_start:df_stop].set_index('date')
 
-   model = sm.OLS(y, X).fit()
-   predictions = model.predict(X)
+# Function to fit the regression of one query
+def fit_regression(dependent_var, predictors, start_date, end_date):
+   # Window cross-products come from two lookups into the prefix-sum index
+   index, df_start, df_stop, df = query_window(dependent_var, predictors, start_date, end_date)
+   gram = index_gram(index, df_start, df_stop)
+   grid = stack_models([fit_subset(gram, dependent_var, predictors)])
 
-   residuals = y - predictions
+   # Residuals still need the rows of the window
+   grid = grid_statistics(df, grid)
+   terms = ['const'] + list(predictors)
+   residuals = pd.Series(grid_residuals(df, grid)[:, 0], index=df.index)
 
    # Prepare results
    results = {
-       'R-squared': model.rsquared,
-       'Coefficients': model.params,
-       'P-values': model.pvalues,
+       'R-squared': grid['rsquared'][0],
+       'Coefficients': pd.Series(grid['params'][0], index=terms),
+       'P-values': pd.Series(grid['pvalues'][0], index=terms),
        'Residuals': residuals,
-       'Summary': model.summary().as_html()
+       'Summary': compact_html(compact_result(grid, 0))
    }
 
-   # Plot errors
-   error_plot = residuals.hvplot(title="Residuals Plot", ylabel="Residuals")
+   return results
+
+# Function to perform regression and plot errors
+def perform_regression(dependent_var, predictors, start_date, end_date, rasterize=False):
+   # Repeated queries on the same data reuse the fit; the plot is rebuilt so every session gets its own streams
+   key = query_key('regression', dependent_var, predictors, start_date, end_date)
+   results = cached(fit_cache, version, key, lambda: fit_regression(dependent_var, predictors, start_date, end_date))
+   residuals = results['Residuals']
+
+   # Plot errors, downsampled or rasterized on the server so long series stay light in the browser
+   with stage('plot'):
+      if rasterize:
+         error_plot = rasterized_plot(residuals, title="Residuals Plot", ylabel="Residuals")
+      else:
+         error_plot = zoomable_plot(residuals, title="Residuals Plot", ylabel="Residuals")
 
    return results, error_plot
 
+# Full statsmodels summary of one query, fitted only on request since it costs far more than the compact table
+def full_summary(dependent_var, predictors, start_date, end_date):
+   def fit_summary():
+      df = query_window(dependent_var, predictors, start_date, end_date)[3]
+      model = sm.OLS(df[dependent_var], sm.add_constant(df[list(predictors)])).fit()
+      return model.summary().as_html()
+
+   key = query_key('full_summary', dependent_var, predictors, start_date, end_date)
+   return cached(summary_cache, version, key, fit_summary)
+
+# Function to track coefficients, t-stats and R-squared over rolling or expanding windows
+def perform_rolling_regression(dependent_var, predictors, start_date, end_date, window):
+   def fit_rolling():
+      df = query_window(dependent_var, predictors, start_date, end_date)[3]
+
+      # Each window is reached from the previous one by adding and removing single rows
+      return rolling_ols(df, dependent_var, predictors, window=window)
+
+   key = query_key('rolling', dependent_var, predictors, start_date, end_date, window)
+   rolling = cached(fit_cache, version, key, fit_rolling)
+
+   # One row per window, so long ranges are downsampled like the residuals before reaching the browser
+   return (
+       zoomable_plot(rolling['params'], title="Rolling Coefficients", ylabel="Coefficient")
+       + zoomable_plot(rolling['tvalues'], title="Rolling t-stats", ylabel="t-stat")
+       + zoomable_plot(rolling['rsquared'], title="Rolling R-squared", ylabel="R-squared")
+   ).cols(1)
+
 # Widgets for user inputs
-dependent_var = pn.widgets.Select(name='Dependent Variable', options=['y'], sizing_mode='stretch_width')
-predictors = pn.widgets.MultiChoice(name='Predictors', options=['x1', 'x2'], sizing_mode='stretch_width')
-start_date = pn.widgets.DatePicker(name='Start Date', value=datetime.date(2020, 1, 1), sizing_mode='stretch_width')
-end_date = pn.widgets.DatePicker(name='End Date', value=datetime.date(2020, 4, 9), sizing_mode='stretch_width')
+columns = [column for column in data.columns if column != 'date']
+upload = pn.widgets.FileInput(accept='.csv,.parquet', sizing_mode='stretch_width')
+dependent_var = pn.widgets.Select(name='Dependent Variable', options=columns, sizing_mode='stretch_width')
+predictors = pn.widgets.MultiChoice(name='Predictors', options=columns[1:], sizing_mode='stretch_width')
+start_date = pn.widgets.DatePicker(name='Start Date', value=data['date'].iloc[0].date(), sizing_mode='stretch_width')
+end_date = pn.widgets.DatePicker(name='End Date', value=data['date'].iloc[-1].date(), sizing_mode='stretch_width')
+regression_mode = pn.widgets.Select(name='Mode', options=['Full Window', 'Rolling', 'Expanding'], sizing_mode='stretch_width')
+rolling_window = pn.widgets.IntInput(name='Rolling Window (rows)', value=20, start=5, sizing_mode='stretch_width')
+rasterize_plots = pn.widgets.Checkbox(name='Rasterize Plots on Server')
+show_full_summary = pn.widgets.Checkbox(name='Full statsmodels Summary')
 
 # Output widgets
 output_stats = pn.pane.HTML(sizing_mode='stretch_width')
 output_figure = pn.pane.HoloViews(sizing_mode='stretch_both')
 
 def update(event):
+   start_request()
    try:
-       results, plot = perform_regression(dependent_var.value, predictors.value, start_date.value, end_date.value)
-       output_stats.object = results['Summary']
+       with stage('refresh'):
+           refresh_data()
+       with stage('regression'):
+           results, plot = perform_regression(dependent_var.value, predictors.value, start_date.value, end_date.value, rasterize_plots.value)
+       if show_full_summary.value:
+           with stage('summary_html'):
+               output_stats.object = full_summary(dependent_var.value, predictors.value, start_date.value, end_date.value)
+       else:
+           output_stats.object = results['Summary']
+
+       # Add the coefficient paths below the residuals in the rolling and expanding modes
+       if regression_mode.value != 'Full Window':
+           window = rolling_window.value if regression_mode.value == 'Rolling' else None
+           with stage('rolling'):
+               plot = (plot + perform_rolling_regression(dependent_var.value, predictors.value, start_date.value, end_date.value, window)).cols(1)
        output_figure.object = plot
    except Exception as e:
        output_stats.object = f"Error: {str(e)}"
        output_figure.object = None
+   finish_request('reg')
 
 # Button to trigger regression analysis
 button = pn.widgets.Button(name='Run Regression', button_type='primary', sizing_mode='stretch_width')
 button.on_click(update)
 
+# Load an uploaded file in place of the sample: it is ingested in chunks, then the selectors follow its columns
+def use_dataset(dataset):
+   global data, data_source, version
+   data_source = dataset
+   data = dataset_frame(dataset)
+   version = dataset_version(dataset)
+
+   columns = [column for column in data.columns if column != 'date']
+   predictors.value = []
+   dependent_var.options = columns
+   predictors.options = columns[1:]
+   start_date.value = data['date'].iloc[0].date()
+   end_date.value = data['date'].iloc[-1].date()
+
+def load_upload(event):
+   try:
+       name = ingest_file(io.BytesIO(upload.value), upload.filename, DATASET, as_column=True)
+   except ValueError as e:
+       output_stats.object = f"Error: {str(e)}"
+       return
+   set_active(DATASET, name)
+   use_dataset(load_dataset(name))
+
+# Rows appended to the stored dataset are picked up before each run; sync_index then extends
+# the prefix sums with just those rows, while a dataset uploaded elsewhere is loaded in full
+def refresh_data():
+   global data, data_source, version
+   dataset = load_dataset(active_dataset(DATASET))
+   if dataset['name'] != data_source['name']:
+       use_dataset(dataset)
+   elif dataset is not data_source:
+       data_source = dataset
+       data = dataset_frame(dataset)
+       version = dataset_version(dataset)
+
+upload.param.watch(load_upload, 'value')
+
 # Layout
 header = pn.pane.Markdown("## Time Series Regression Analysis", sizing_mode='stretch_width')
 inputs = pn.Column(
+   upload,
    dependent_var,
    predictors,
    start_date,
    end_date,
+   regression_mode,
+   rolling_window,
+   rasterize_plots,
+   show_full_summary,
    button,
    sizing_mode='fixed',
    width=300
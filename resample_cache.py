@@ -0,0 +1,44 @@
+import pandas as pd
+
+# Resampling rules of the coarser pyramid levels
+RESAMPLE_RULES = {
+    'weekly': 'W',
+    'monthly': 'ME'
+}
+
+# Pyramids of the most recent dataset versions, oldest first
+MAX_VERSIONS = 2
+pyramids = {}
+
+
+def frequency_column(column, frequency):
+    """Name of a column's aggregate at a pyramid level"""
+    return column if frequency == 'daily' else f'{column}@{frequency}'
+
+
+def build_pyramid(frame, date_column='date'):
+    """Weekly and monthly aggregates of every column, as-of joined onto the daily dates next to the daily values"""
+    daily = frame.sort_values(date_column).reset_index(drop=True)
+    columns = [column for column in daily.columns if column != date_column]
+    levels = {'daily': daily}
+    for frequency, rule in RESAMPLE_RULES.items():
+        # A period's last value is labelled with the period end, so the join never looks ahead
+        resampled = daily.set_index(date_column)[columns].resample(rule).last().dropna(how='all')
+        resampled.columns = [frequency_column(column, frequency) for column in columns]
+        aligned = pd.merge_asof(daily, resampled.reset_index(), on=date_column, direction='backward')
+
+        # Days before the first complete period have no known aggregate yet; they are kept here and
+        # dropped per query, only when a column that query uses is missing
+        levels[frequency] = aligned
+
+    # Prefix sums are built per query over the columns it uses (range_index.get_index), not per level
+    return {'levels': levels}
+
+
+def get_pyramid(frame, version, date_column='date'):
+    """Cached pyramid of frame, built once per dataset version"""
+    if version not in pyramids:
+        pyramids[version] = build_pyramid(frame, date_column)
+        while len(pyramids) > MAX_VERSIONS:
+            pyramids.pop(next(iter(pyramids)))
+    return pyramids[version]
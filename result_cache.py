@@ -0,0 +1,130 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from single_flight import single_flight
+
+
+def new_cache(max_entries, max_bytes):
+    """Empty LRU cache bounded by entry count and by the estimated bytes of its values"""
+    return {
+        'entries': OrderedDict(),
+        'sizes': {},
+        'bytes': 0,
+        'max_entries': max_entries,
+        'max_bytes': max_bytes,
+        'hits': 0,
+        'misses': 0,
+        'lock': threading.Lock()
+    }
+
+
+# Fitted grids and Panel results, rendered chart PNGs, and statsmodels summaries, each under its own budget
+fit_cache = new_cache(256, 256 * 1024 * 1024)
+chart_cache = new_cache(4096, 64 * 1024 * 1024)
+summary_cache = new_cache(1024, 16 * 1024 * 1024)
+
+
+def query_key(*parts):
+    """Hashable key of a query; lists, dates and numbers are serialised the same way every time"""
+    return json.dumps(parts, default=str)
+
+
+def value_bytes(value):
+    """Rough memory footprint of a cached value"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.Series, pd.DataFrame, pd.Index)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, dict):
+        return sum(value_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_bytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def evict(cache):
+    """Drop least recently used entries until the cache is within both of its bounds"""
+    entries = cache['entries']
+    while entries and (len(entries) > cache['max_entries'] or cache['bytes'] > cache['max_bytes']):
+        key, _ = entries.popitem(last=False)
+        cache['bytes'] -= cache['sizes'].pop(key)
+
+
+def clear_cache(cache):
+    """Remove every entry, keeping the hit/miss counters"""
+    with cache['lock']:
+        cache['entries'].clear()
+        cache['sizes'].clear()
+        cache['bytes'] = 0
+
+
+def store(cache, entry, value):
+    """Insert or replace one entry and evict down to the bounds; called with the cache's lock held"""
+    size = value_bytes(value)
+    if size > cache['max_bytes']:
+        return
+    if entry in cache['entries']:
+        cache['bytes'] -= cache['sizes'][entry]
+    cache['entries'][entry] = value
+    cache['sizes'][entry] = size
+    cache['bytes'] += size
+    evict(cache)
+
+
+def cached(cache, version, key, compute):
+    """Value of key under dataset version, computed and stored on a miss
+
+    Entries are held per (version, key), so apps on different datasets share a cache without clearing
+    each other's results; entries of versions no longer asked for age out through the LRU order.
+    """
+    entry = (version, key)
+    with cache['lock']:
+        if entry in cache['entries']:
+            cache['hits'] += 1
+            cache['entries'].move_to_end(entry)
+            return cache['entries'][entry]
+        cache['misses'] += 1
+
+    def compute_and_store():
+        value = compute()
+        with cache['lock']:
+            store(cache, entry, value)
+        return value
+
+    # Computed outside the lock so one slow fit does not block lookups of other keys,
+    # and once for all concurrent misses of the same key
+    return single_flight((id(cache), version, key), compute_and_store)
+
+
+def cache_entries(cache, version):
+    """Snapshot of the (key, value) entries held for dataset version"""
+    with cache['lock']:
+        return [(key, value) for (entry_version, key), value in cache['entries'].items() if entry_version == version]
+
+
+def seed_cache(cache, version, entries):
+    """Add entries already known for dataset version, e.g. results carried over an append"""
+    with cache['lock']:
+        for key, value in entries:
+            if (version, key) not in cache['entries']:
+                store(cache, (version, key), value)
+
+
+def cache_stats(cache):
+    """Entry count, bytes held and hit/miss counters of a cache"""
+    with cache['lock']:
+        lookups = cache['hits'] + cache['misses']
+        return {
+            'entries': len(cache['entries']),
+            'bytes': cache['bytes'],
+            'hits': cache['hits'],
+            'misses': cache['misses'],
+            'hit_rate': cache['hits'] / lookups if lookups else 0.0
+        }
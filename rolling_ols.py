@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+
+# Sherman-Morrison denominators below this mean removing the row leaves the window (nearly) singular
+SINGULAR_TOLERANCE = 1e-10
+
+
+def rank_one(xtx_inv, x, sign):
+    """Sherman-Morrison update of (X'X)^-1 after adding (sign=1) or removing (sign=-1) the row x
+
+    Returns None when the removal leaves a window without an inverse.
+    """
+    px = xtx_inv @ x
+    denominator = 1 + sign * (x @ px)
+    if denominator < SINGULAR_TOLERANCE:
+        return None
+    return xtx_inv - sign * np.outer(px, px) / denominator
+
+
+def window_inverse(rows):
+    """(X'X)^-1 of a window's regressor rows, or None when they are collinear and the fit is undefined
+
+    Coarse-frequency predictors, for instance, are constant inside short windows.
+    """
+    if np.linalg.matrix_rank(rows) < rows.shape[1]:
+        return None
+    return np.linalg.inv(rows.T @ rows)
+
+
+def rolling_ols(frame, dependent_var, predictors, window=None, min_nobs=None, refresh=250):
+    """Rolling OLS over window rows, or expanding when window is None, updated one row at a time
+
+    Returns the coefficients, t-stats and R-squared of every window, indexed by the window's last date;
+    windows whose regressors are collinear get NaN rows. The inverse is recomputed from the window rows
+    every refresh steps to stop rounding drift, and after every singular window.
+    """
+    y = frame[dependent_var].to_numpy(dtype=float)
+    X = np.column_stack([np.ones(len(frame)), frame[predictors].to_numpy(dtype=float)])
+    n, k = X.shape
+    first = window if window is not None else (min_nobs or k + 1)
+    if first > n:
+        raise ValueError('window is longer than the selected data')
+
+    params = np.empty((n - first + 1, k))
+    bse = np.empty((n - first + 1, k))
+    rsquared = np.empty(n - first + 1)
+
+    # Sufficient statistics of the current window
+    xty = X[:first].T @ y[:first]
+    yty = y[:first] @ y[:first]
+    y_sum = y[:first].sum()
+    xtx_inv = window_inverse(X[:first])
+
+    for step, end in enumerate(range(first, n + 1)):
+        if step:
+            x_new, y_new = X[end - 1], y[end - 1]
+            xty += x_new * y_new
+            yty += y_new ** 2
+            y_sum += y_new
+            if xtx_inv is not None:
+                xtx_inv = rank_one(xtx_inv, x_new, 1)
+            if window is not None:
+                x_old, y_old = X[end - 1 - window], y[end - 1 - window]
+                xty -= x_old * y_old
+                yty -= y_old ** 2
+                y_sum -= y_old
+                if xtx_inv is not None:
+                    xtx_inv = rank_one(xtx_inv, x_old, -1)
+            if xtx_inv is None or step % refresh == 0:
+                start = 0 if window is None else end - window
+                xtx_inv = window_inverse(X[start:end])
+
+        if xtx_inv is None:
+            params[step] = bse[step] = rsquared[step] = np.nan
+            continue
+        nobs = end if window is None else window
+        beta = xtx_inv @ xty
+        ssr = max(yty - beta @ xty, 0.0)
+        params[step] = beta
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bse[step] = np.sqrt(ssr / (nobs - k) * np.diag(xtx_inv))
+            rsquared[step] = 1 - ssr / (yty - y_sum ** 2 / nobs)
+
+    index = frame.index[first - 1:]
+    columns = ['const'] + list(predictors)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tvalues = params / bse
+    return {
+        'params': pd.DataFrame(params, index=index, columns=columns),
+        'tvalues': pd.DataFrame(tvalues, index=index, columns=columns),
+        'rsquared': pd.Series(rsquared, index=index, name='R-squared')
+    }
@@ -0,0 +1,57 @@
+import threading
+
+# Seconds a request waits on someone else's computation before giving up
+FLIGHT_TIMEOUT = 60
+
+# Computations currently running, by key, and how many callers were served by another caller's run
+flights = {}
+flights_lock = threading.Lock()
+coalesced = 0
+
+
+def single_flight(key, compute, timeout=FLIGHT_TIMEOUT):
+    """Result of compute(), shared by every concurrent caller with the same key
+
+    The first caller runs compute; the others wait for it, up to timeout seconds, and then raise TimeoutError.
+    An exception raised by compute is raised to every waiter. If the running caller is cancelled instead,
+    for example by an interrupt, one of the waiters takes over the computation.
+    """
+    global coalesced
+    while True:
+        with flights_lock:
+            flight = flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = flights[key] = {'done': threading.Event(), 'value': None, 'error': None, 'cancelled': False}
+
+        if leader:
+            try:
+                flight['value'] = compute()
+            except Exception as error:
+                flight['error'] = error
+            except BaseException:
+                flight['cancelled'] = True
+                raise
+            finally:
+                with flights_lock:
+                    if flights.get(key) is flight:
+                        del flights[key]
+                flight['done'].set()
+        elif not flight['done'].wait(timeout):
+            # Leaving does not stop the computation; it still finishes for the others and for the caches
+            raise TimeoutError(f'timed out after {timeout}s waiting for an identical request')
+        elif flight['cancelled']:
+            continue
+        else:
+            with flights_lock:
+                coalesced += 1
+
+        if flight['error'] is not None:
+            raise flight['error']
+        return flight['value']
+
+
+def flight_stats():
+    """Computations in progress and callers served by another caller's computation"""
+    with flights_lock:
+        return {'in_flight': len(flights), 'coalesced': coalesced}
@@ -0,0 +1,120 @@
+import heapq
+import numpy as np
+from ols_grid import window_gram, fit_subset, stack_models
+
+# Largest grid a best-subset request returns: dependents x subset sizes x models kept per size
+MAX_SEARCH_MODELS = 1000
+
+# A candidate whose residual variance, after sweeping out the chosen predictors, falls below this share
+# of its own variance is collinear with them and adds nothing to the fit
+COLLINEAR_TOLERANCE = 1e-10
+
+
+def sweep(matrix, j):
+    """Cross-products of the other rows' residuals on row j, with row and column j removed"""
+    keep = np.arange(len(matrix)) != j
+    pivot = matrix[keep, j]
+    return matrix[np.ix_(keep, keep)] - np.outer(pivot, pivot) / matrix[j, j]
+
+
+def reverse_sweeps(matrix, floor):
+    """RSS of the last row regressed on rows j onwards, for every j, from one pass of sweeps from the end"""
+    rss = np.empty(len(matrix) - 1)
+    for j in range(len(matrix) - 2, -1, -1):
+        if matrix[j, j] > floor[j]:
+            matrix = sweep(matrix, j)
+        else:
+            matrix = np.delete(np.delete(matrix, j, axis=0), j, axis=1)
+        rss[j] = max(matrix[-1, -1], 0.0)
+    return rss
+
+
+def best_subsets(gram, dep_var, candidates, max_size, k):
+    """Best k predictor subsets of every size up to max_size, found by leaps-and-bounds pruning
+
+    Each node holds the cross-products of the dependent and the remaining candidates with its chosen
+    predictors swept out, so a child's RSS is one division. The bounds of all children of a node, the RSS
+    on the chosen predictors plus every candidate left to that child, come from one pass of sweeps. A
+    branch is followed only for the subset sizes its bound can still improve.
+    """
+    position = {column: i for i, column in enumerate(gram['columns'])}
+    cross = gram['cross']
+    d = position[dep_var]
+
+    # Strongest predictors first: later branches then only hold weak predictors and prune early
+    # (a constant column has no variance to explain with and sorts as NaN)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        order = sorted((position[column] for column in candidates), key=lambda j: -cross[j, d] ** 2 / cross[j, j])
+
+    # Per size, a max-heap (by RSS) of the k best subsets seen so far
+    best = {size: [] for size in range(1, max_size + 1)}
+
+    def kth_rss(size):
+        return -best[size][0][0] if len(best[size]) == k else np.inf
+
+    def visit(chosen, free, matrix, floor, sizes):
+        # matrix is over free then the dependent, floor the collinearity threshold of each free candidate
+        size = len(chosen) + 1
+        deeper = any(s > size for s in sizes)
+        bounds = reverse_sweeps(matrix, floor) if deeper else None
+        for j, column in enumerate(free):
+            subset = chosen + [column]
+            usable = matrix[j, j] > floor[j]
+            rss = max(matrix[-1, -1] - matrix[j, -1] ** 2 / matrix[j, j], 0.0) if usable else matrix[-1, -1]
+
+            heap = best[size]
+            if len(heap) < k:
+                heapq.heappush(heap, (-rss, subset))
+            elif rss < -heap[0][0]:
+                heapq.heapreplace(heap, (-rss, subset))
+
+            if not deeper:
+                continue
+
+            # No subset in this branch can beat the RSS of the branch's full variable set
+            rest = len(free) - j - 1
+            live = [s for s in sizes if size < s <= size + rest and bounds[j] < kth_rss(s)]
+            if not live:
+                continue
+            child = sweep(matrix, j) if usable else np.delete(np.delete(matrix, j, axis=0), j, axis=1)
+            visit(subset, free[j + 1:], child[j:, j:], floor[j + 1:], live)
+
+    floor = COLLINEAR_TOLERANCE * np.diag(cross)[order]
+    visit([], order, cross[np.ix_(order + [d], order + [d])], floor, list(range(2, max_size + 1)))
+    columns = gram['columns']
+    return {
+        size: [(-neg_rss, [columns[j] for j in subset]) for neg_rss, subset in sorted(heap, reverse=True)]
+        for size, heap in best.items()
+    }
+
+
+def search_request(columns, dep_var=None, ind_vars=None, max_size=3, k=5, max_models=MAX_SEARCH_MODELS):
+    """Dependents and candidate predictors of a best-subset request
+
+    The selected dependent, or every column, is searched over the selected predictors, or over every
+    column. The search never enumerates the grid, so only the models it returns are bounded: ValueError
+    asks for a narrower selection when dependents x sizes x k exceeds max_models.
+    """
+    columns = list(columns)
+    dep_vars = [dep_var] if dep_var in columns else columns
+    candidates = [column for column in ind_vars or [] if column in columns] or columns
+    if len(dep_vars) * max_size * k > max_models:
+        raise ValueError(f'the search returns more than {max_models} models; choose a dependent variable, fewer sizes or fewer models')
+    return dep_vars, candidates
+
+
+def search_grid(filtered_data, dep_vars, max_size, k, candidates=None):
+    """Grid of the best k models of each size for every dependent
+
+    Predictors are drawn from candidates, by default all columns, leaving out the dependent itself.
+    """
+    if candidates is None:
+        candidates = list(filtered_data.columns)
+    used = set(dep_vars) | set(candidates)
+    gram = window_gram(filtered_data, [column for column in filtered_data.columns if column in used])
+    models = []
+    for dep_var in dep_vars:
+        predictors = [column for column in candidates if column != dep_var]
+        for subsets in best_subsets(gram, dep_var, predictors, max_size, k).values():
+            models += [fit_subset(gram, dep_var, subset) for _, subset in subsets]
+    return stack_models(models)
@@ -0,0 +1,110 @@
+import io
+import json
+import os
+import sys
+import tempfile
+from urllib.parse import urlencode
+from wsgiref.headers import Headers
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules under test live flat at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sample datasets the apps write when imported go to a scratch directory, not the repository
+os.environ.setdefault('DATASET_DIR', os.path.join(tempfile.mkdtemp(), 'datasets'))
+os.environ.setdefault('FIT_STORE_DIR', os.path.join(tempfile.mkdtemp(), 'fit_store'))
+
+
+@pytest.fixture
+def frame():
+    """Daily random walks with a date index, the shape of the data the apps regress"""
+    rng = np.random.default_rng(0)
+    values = rng.standard_normal((200, 5)).cumsum(axis=0)
+    return pd.DataFrame(values, columns=['y', 'x1', 'x2', 'x3', 'x4'],
+                        index=pd.date_range('2020-01-01', periods=200, freq='D', name='date'))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Empty dataset and fit stores for one test"""
+    import column_store
+    import fit_store
+    monkeypatch.setattr(column_store, 'DATASET_DIR', str(tmp_path / 'datasets'))
+    monkeypatch.setattr(fit_store, 'STORE_DIR', str(tmp_path / 'fit_store'))
+    return tmp_path
+
+
+@pytest.fixture
+def sample(store, frame):
+    """frame written as the 'sample' dataset both result apps serve"""
+    from column_store import write_dataset
+    write_dataset('sample', frame)
+    return frame
+
+
+@pytest.fixture
+def flask_client(sample):
+    import allinone_mres
+    return allinone_mres.app.test_client()
+
+
+class WSGIResponse:
+    def __init__(self, status, headers, body):
+        self.status_code = int(status.split()[0])
+        # Header names are matched case-insensitively, as by the Flask test client
+        self.headers = Headers(list(headers))
+        self.data = body
+
+
+class WSGIClient:
+    """Just enough of a test client to send form posts, JSON posts and queries to the Bottle app"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def open(self, method, path, data=None, query_string=None, headers=None, json_body=None):
+        if json_body is None:
+            body, content_type = urlencode(data or {}, doseq=True).encode(), 'application/x-www-form-urlencoded'
+        else:
+            body, content_type = json.dumps(json_body).encode(), 'application/json'
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': urlencode(query_string or {}, doseq=True),
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr
+        }
+        for name, value in (headers or {}).items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        started = []
+        chunks = self.app(environ, lambda status, headers, exc_info=None: started.append((status, headers)))
+        body = b''.join(chunks)
+        return WSGIResponse(*started[0], body)
+
+    def get(self, path, query_string=None, headers=None):
+        return self.open('GET', path, query_string=query_string, headers=headers)
+
+    def post(self, path, data=None, json=None):
+        return self.open('POST', path, data=data, json_body=json)
+
+
+@pytest.fixture
+def bottle_client(sample):
+    import bottle_app_inone
+    return WSGIClient(bottle_app_inone.app)
+
+
+@pytest.fixture
+def new_rows(frame):
+    """Ten more days of the random walks after frame, as the JSON rows /append takes"""
+    rng = np.random.default_rng(5)
+    steps = frame.iloc[-1].to_numpy() + rng.standard_normal((10, frame.shape[1])).cumsum(axis=0)
+    dates = pd.date_range(frame.index[-1] + pd.Timedelta(days=1), periods=10, freq='D')
+    return [{'date': str(date.date()), **dict(zip(frame.columns, row))} for date, row in zip(dates, steps)]
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from statsmodels.tsa.stattools import adfuller
+from adf_batch import adf_batch
+
+
+@pytest.mark.parametrize('autolag', ['AIC', 'BIC', None])
+def test_matches_adfuller(autolag):
+    rng = np.random.default_rng(1)
+    noise = rng.standard_normal((300, 4))
+    series = np.column_stack([noise[:, 0], noise[:, 1].cumsum(), noise[:, 2] + 0.5 * np.roll(noise[:, 2], 1), noise[:, 3].cumsum() * 0.1])
+    statistics, pvalues, usedlag = adf_batch(series, autolag=autolag)
+    for j in range(series.shape[1]):
+        statistic, pvalue, lag = adfuller(series[:, j], autolag=autolag)[:3]
+        np.testing.assert_allclose(statistics[j], statistic, rtol=1e-8)
+        np.testing.assert_allclose(pvalues[j], pvalue, rtol=1e-8)
+        assert usedlag[j] == lag
+
+
+def test_untestable_series_are_nan():
+    rng = np.random.default_rng(2)
+    series = np.column_stack([rng.standard_normal(100), np.full(100, 3.0)])
+    statistics, pvalues, usedlag = adf_batch(series)
+    assert np.isfinite(statistics[0]) and np.isnan(statistics[1]) and np.isnan(pvalues[1]) and usedlag[1] == -1
+
+
+@pytest.mark.parametrize('length', [1, 2, 3])
+def test_series_too_short_for_default_lag(length):
+    statistics, pvalues, _ = adf_batch(np.arange(2.0 * length).reshape(length, 2) ** 2)
+    assert np.isnan(statistics).all() and np.isnan(pvalues).all()
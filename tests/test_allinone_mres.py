@@ -0,0 +1,97 @@
+import html
+import re
+
+
+RESULT_FORM = {'dependent': 'y', 'independents[]': ['x1', 'x2'], 'start_date': '2020-01-01', 'end_date': '2020-06-30'}
+
+
+def test_result_page(flask_client):
+    response = flask_client.post('/result', data=RESULT_FORM)
+    assert response.status_code == 200
+    assert response.data.count(b'<h2>Model') == 3
+
+
+def test_invalid_filter_is_rejected(flask_client):
+    response = flask_client.post('/result', data=dict(RESULT_FORM, add_filters='on', p_stat='abc'))
+    assert response.status_code == 400
+    assert b'abc' in response.data
+
+
+def test_streamed_page_is_coalesced_with_the_plain_one(flask_client, monkeypatch):
+    import allinone_mres
+    keys = []
+
+    def recording_flight(key, compute):
+        keys.append(key)
+        return compute()
+
+    monkeypatch.setattr(allinone_mres, 'single_flight', recording_flight)
+    streamed = flask_client.post('/result', data=dict(RESULT_FORM, stream='on'))
+    plain = flask_client.post('/result', data=RESULT_FORM)
+    assert streamed.data.count(b'<h2>Model') == plain.data.count(b'<h2>Model') == 3
+    assert len(keys) == 2 and keys[0] == keys[1]
+
+
+def test_streamed_timeout_ends_the_page_with_an_error(flask_client, monkeypatch):
+    import allinone_mres
+
+    def busy_flight(key, compute):
+        raise TimeoutError('busy')
+
+    monkeypatch.setattr(allinone_mres, 'single_flight', busy_flight)
+    response = flask_client.post('/result', data=dict(RESULT_FORM, stream='on'))
+    assert response.status_code == 200
+    assert b'alert-danger' in response.data and response.data.rstrip().endswith(b'</html>')
+
+
+def test_job_fits_the_selected_grid(flask_client):
+    from test_grid_jobs import wait_for
+    response = flask_client.post('/jobs', data=RESULT_FORM)
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert wait_for(job_id)['models_total'] == 3
+    results = flask_client.get(response.get_json()['results_url']).get_json()
+    assert len(results['results']) == 3
+
+
+def test_invalid_job_is_rejected(flask_client, monkeypatch):
+    import allinone_mres
+    assert flask_client.post('/jobs', data=dict(RESULT_FORM, priority='high')).status_code == 400
+    monkeypatch.setattr(allinone_mres, 'MAX_JOB_MODELS', 2)
+    assert flask_client.post('/jobs', data=dict(RESULT_FORM, dependent='')).status_code == 400
+
+
+def test_append_refits_saved_grids(flask_client, new_rows):
+    form = dict(RESULT_FORM, end_date='2020-12-31')
+    flask_client.post('/result', data=form)
+    response = flask_client.post('/append', json={'rows': new_rows})
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['rows_added'] == 10 and report['rows'] == 210
+    assert any(grid['rows_added'] == 10 and grid['changed_models'] for grid in report['grids'])
+    assert flask_client.post('/append', json={'rows': new_rows}).status_code == 400
+
+
+def chart_links(page):
+    return [html.unescape(link) for link in re.findall(r'<img src="([^"]+)"', page.decode())]
+
+
+def test_chart_is_revalidated_by_etag(flask_client):
+    link = chart_links(flask_client.post('/result', data=RESULT_FORM).data)[0]
+    response = flask_client.get(link)
+    assert response.status_code == 200 and response.mimetype == 'image/png'
+    assert response.data.startswith(b'\x89PNG') and 'immutable' in response.headers['Cache-Control']
+
+    revalidated = flask_client.get(link, headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304 and not revalidated.data
+    assert flask_client.get(link.replace('/chart/', '/chart/0')).status_code == 404
+
+
+def test_metrics_count_timed_requests(flask_client):
+    page = flask_client.post('/result', data=RESULT_FORM)
+    assert 'fit;dur=' in page.headers['Server-Timing']
+    response = flask_client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    text = response.data.decode()
+    assert 'regression_request_seconds_count{route="/result"}' in text
+    assert 'regression_cache_entries{cache="fit"}' in text and 'regression_flights_coalesced_total' in text
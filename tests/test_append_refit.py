@@ -0,0 +1,25 @@
+import numpy as np
+from append_refit import refresh_grids
+from ols_grid import fit_grid, grid_statistics
+from result_cache import fit_cache, query_key, cache_entries, seed_cache
+
+
+def test_grids_take_in_appended_rows(store, frame):
+    old_data = frame.iloc[:150]
+    grown = query_key('grid', ['y'], [['x1'], ['x1', 'x2']], '2020-01-01', '2020-12-31')
+    closed = query_key('grid', ['y'], [['x3']], '2020-01-01', '2020-03-01')
+    seed_cache(fit_cache, 'old', [
+        (grown, grid_statistics(old_data, fit_grid(old_data, ['y'], [['x1'], ['x1', 'x2']]))),
+        (closed, grid_statistics(old_data[:'2020-03-01'], fit_grid(old_data[:'2020-03-01'], ['y'], [['x3']])))
+    ])
+
+    report = refresh_grids(old_data, frame, 'old', 'new')
+    changes = {entry['end_date']: (entry['rows_added'], entry['changed_models']) for entry in report}
+    assert changes == {'2020-03-01': (0, []), '2020-12-31': (50, [1, 2])}
+
+    carried = dict(cache_entries(fit_cache, 'new'))
+    expected = grid_statistics(frame, fit_grid(frame, ['y'], [['x1'], ['x1', 'x2']]))
+    for name in ('params', 'bse'):
+        for refit, fitted in zip(carried[grown][name], expected[name]):
+            np.testing.assert_allclose(refit, fitted, rtol=1e-8)
+    np.testing.assert_allclose(carried[grown]['durbin_watson'], expected['durbin_watson'], rtol=1e-8)
@@ -0,0 +1,125 @@
+import html
+import re
+from urllib.parse import parse_qs
+
+
+RESULT_FORM = {'dependent': 'y', 'independents[]': ['x1', 'x2'], 'start_date': '2020-01-01', 'end_date': '2020-06-30',
+               'num_models': '5'}
+
+
+def test_result_page(bottle_client):
+    response = bottle_client.post('/result', data=RESULT_FORM)
+    assert response.status_code == 200
+    assert response.data.count(b'<h2>Model') == 3
+
+
+def test_invalid_filter_is_rejected(bottle_client):
+    response = bottle_client.post('/result', data=dict(RESULT_FORM, add_filters='on', max_error='1e'))
+    assert response.status_code == 400
+
+
+def test_ranking(bottle_client):
+    response = bottle_client.post('/result', data=dict(RESULT_FORM, rank_by='aic', num_models='2'))
+    assert response.status_code == 200
+    assert response.data.count(b'<h2>Model') == 2
+
+
+def test_unknown_ranking_is_rejected(bottle_client):
+    response = bottle_client.post('/result', data=dict(RESULT_FORM, rank_by='nonsense'))
+    assert response.status_code == 400
+
+
+def test_best_subsets_of_every_dependent(bottle_client):
+    form = dict(RESULT_FORM, dependent='', best_subset='on', max_predictors='3', num_models='4')
+    del form['independents[]']
+    response = bottle_client.post('/result', data=form)
+    assert response.status_code == 200
+    assert response.data.count(b'<h2>Model') == 4
+
+
+def test_oversized_best_subset_search_is_rejected(bottle_client):
+    form = dict(RESULT_FORM, dependent='', best_subset='on', max_predictors='4', num_models='100')
+    assert bottle_client.post('/result', data=form).status_code == 400
+
+
+def test_streamed_page_is_coalesced_with_the_plain_one(bottle_client, monkeypatch):
+    import bottle_app_inone
+    keys = []
+
+    def recording_flight(key, compute):
+        keys.append(key)
+        return compute()
+
+    monkeypatch.setattr(bottle_app_inone, 'single_flight', recording_flight)
+    streamed = bottle_client.post('/result', data=dict(RESULT_FORM, stream='on'))
+    plain = bottle_client.post('/result', data=RESULT_FORM)
+    assert streamed.data.count(b'<h2>Model') == plain.data.count(b'<h2>Model') == 3
+    assert len(keys) == 2 and keys[0] == keys[1]
+
+
+def test_streamed_failure_ends_the_page_with_an_error(bottle_client, monkeypatch):
+    import bottle_app_inone
+
+    def failing_flight(key, compute):
+        raise RuntimeError('fit failed')
+
+    monkeypatch.setattr(bottle_app_inone, 'single_flight', failing_flight)
+    response = bottle_client.post('/result', data=dict(RESULT_FORM, stream='on'))
+    assert response.status_code == 200
+    assert b'alert-danger' in response.data and response.data.rstrip().endswith(b'</html>')
+
+
+def test_job_fits_the_selected_grid(bottle_client):
+    import json
+    from test_grid_jobs import wait_for
+    response = bottle_client.post('/jobs', data=RESULT_FORM)
+    assert response.status_code == 202
+    job = json.loads(response.data)
+    assert wait_for(job['job_id'])['models_total'] == 3
+    results = json.loads(bottle_client.get(job['results_url']).data)
+    assert len(results['results']) == 3
+
+
+def test_invalid_job_is_rejected(bottle_client, monkeypatch):
+    import bottle_app_inone
+    assert bottle_client.post('/jobs', data=dict(RESULT_FORM, priority='1.5')).status_code == 400
+    monkeypatch.setattr(bottle_app_inone, 'MAX_JOB_MODELS', 2)
+    assert bottle_client.post('/jobs', data=dict(RESULT_FORM, dependent='')).status_code == 400
+
+
+def test_append_refits_saved_grids(bottle_client, new_rows):
+    import json
+    form = dict(RESULT_FORM, end_date='2020-12-31')
+    bottle_client.post('/result', data=form)
+    response = bottle_client.post('/append', json={'rows': new_rows})
+    assert response.status_code == 200
+    report = json.loads(response.data)
+    assert report['rows_added'] == 10 and report['rows'] == 210
+    assert any(grid['rows_added'] == 10 and grid['changed_models'] for grid in report['grids'])
+    assert bottle_client.post('/append', json={'rows': new_rows}).status_code == 400
+
+
+def chart_links(page):
+    return [html.unescape(link) for link in re.findall(r'<img src="([^"]+)"', page.decode())]
+
+
+def test_chart_is_revalidated_by_etag(bottle_client):
+    path, query = chart_links(bottle_client.post('/result', data=RESULT_FORM).data)[0].split('?')
+    query = parse_qs(query)
+    response = bottle_client.get(path, query_string=query)
+    assert response.status_code == 200 and response.headers['Content-Type'] == 'image/png'
+    assert response.data.startswith(b'\x89PNG') and 'immutable' in response.headers['Cache-Control']
+
+    revalidated = bottle_client.get(path, query_string=query, headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304 and not revalidated.data
+    assert bottle_client.get(path.replace('/chart/', '/chart/0'), query_string=query).status_code == 404
+
+
+def test_metrics_count_timed_requests(bottle_client):
+    page = bottle_client.post('/result', data=RESULT_FORM)
+    assert 'fit;dur=' in page.headers['Server-Timing']
+    response = bottle_client.get('/metrics')
+    assert response.status_code == 200 and response.headers['Content-Type'].startswith('text/plain')
+    text = response.data.decode()
+    assert 'regression_request_seconds_count{route="/result"}' in text
+    assert 'regression_cache_entries{cache="fit"}' in text and 'regression_flights_coalesced_total' in text
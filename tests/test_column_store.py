@@ -0,0 +1,72 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pytest
+from column_store import (write_dataset, dataset_exists, load_dataset, dataset_frame, dataset_column, set_active, active_dataset,
+                          append_rows, dataset_lock)
+
+
+def test_windows_are_views_of_the_stored_columns(store, frame):
+    write_dataset('walks', frame)
+    dataset = load_dataset('walks')
+    assert dataset_exists('walks') and not dataset_exists('other')
+    window = dataset_frame(dataset, '2020-02-01', '2020-02-29', ['y', 'x2'])
+    pd.testing.assert_frame_equal(window, frame.loc['2020-02-01':'2020-02-29', ['y', 'x2']], check_freq=False, check_index_type=False)
+    assert np.shares_memory(window['y'].to_numpy(), dataset_column(dataset, 'y'))
+    assert load_dataset('walks') is dataset
+
+
+def test_date_columns_and_order_are_restored(store, frame):
+    shuffled = frame.reset_index().sample(frac=1, random_state=0)
+    write_dataset('walks', shuffled, date_column='date')
+    restored = dataset_frame(load_dataset('walks'))
+    assert list(restored.columns) == ['date', 'y', 'x1', 'x2', 'x3', 'x4']
+    np.testing.assert_array_equal(restored['y'].to_numpy(), frame['y'].to_numpy())
+
+
+def test_first_copy_of_a_dataset_wins(store, frame):
+    write_dataset('walks', frame)
+    write_dataset('walks', frame * 2)
+    np.testing.assert_array_equal(dataset_column(load_dataset('walks'), 'y'), frame['y'].to_numpy())
+
+
+def test_active_dataset_of_a_slot(store):
+    assert active_dataset('sample') == 'sample'
+    set_active('sample', 'upload-1')
+    assert active_dataset('sample') == 'upload-1'
+
+
+def test_appended_rows_extend_the_dataset(store, frame):
+    write_dataset('walks', frame.iloc[:150])
+    before = load_dataset('walks')
+    after = append_rows('walks', frame.iloc[150:])
+    assert after is not before and len(before['dates']) == 150
+    pd.testing.assert_frame_equal(dataset_frame(after), frame, check_freq=False, check_index_type=False)
+
+
+def test_appends_are_checked(store, frame):
+    write_dataset('walks', frame.iloc[:150])
+    with pytest.raises(ValueError):
+        append_rows('walks', frame.iloc[100:160])
+    with pytest.raises(ValueError):
+        append_rows('walks', frame.iloc[150:, :3])
+    assert len(load_dataset('walks')['dates']) == 150
+
+
+def append_in_child(directory, rows):
+    import column_store
+    column_store.DATASET_DIR = directory
+    append_rows('walks', rows)
+
+
+def test_appends_wait_for_other_processes(store, frame):
+    import column_store
+    write_dataset('walks', frame.iloc[:150])
+    child = multiprocessing.get_context('fork').Process(target=append_in_child, args=(column_store.DATASET_DIR, frame.iloc[150:]))
+    with dataset_lock('walks'):
+        child.start()
+        child.join(0.5)
+        assert child.is_alive() and len(load_dataset('walks')['dates']) == 150
+    child.join(30)
+    assert child.exitcode == 0
+    np.testing.assert_array_equal(load_dataset('walks')['dates'], frame.index.to_numpy(dtype='datetime64[ns]'))
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from downsample import lttb_indices, minmax_indices, downsample_indices, downsample_series
+
+
+def reference_lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets written point by point, as in the original description"""
+    n = len(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = [0]
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        if b + 1 < n_out - 2:
+            next_x, next_y = x[edges[b + 1]:edges[b + 2]].mean(), y[edges[b + 1]:edges[b + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        a = keep[-1]
+        areas = [abs((x[a] - next_x) * (y[i] - y[a]) - (x[a] - x[i]) * (next_y - y[a])) for i in range(lo, hi)]
+        keep.append(lo + int(np.argmax(areas)))
+    return np.array(keep + [n - 1])
+
+
+def test_lttb_matches_reference():
+    rng = np.random.default_rng(6)
+    y = rng.standard_normal(1000).cumsum()
+    x = np.arange(1000.0)
+    np.testing.assert_array_equal(lttb_indices(x, y, 100), reference_lttb(x, y, 100))
+
+
+@pytest.mark.parametrize('n_out', [2, 1000, 5000])
+def test_short_series_are_kept_whole(n_out):
+    y = np.arange(1000.0)
+    np.testing.assert_array_equal(lttb_indices(y, y, n_out), np.arange(1000))
+    np.testing.assert_array_equal(minmax_indices(y, n_out), np.arange(1000))
+
+
+def test_minmax_keeps_every_spike():
+    rng = np.random.default_rng(7)
+    y = rng.standard_normal(10000)
+    spikes = [123, 4567, 9998]
+    y[spikes] = [50.0, -50.0, 60.0]
+    keep = minmax_indices(y, 200)
+    assert len(keep) <= 202 and set(spikes) <= set(keep) and keep[0] == 0 and keep[-1] == 9999
+
+
+def test_series_share_the_kept_rows():
+    rng = np.random.default_rng(8)
+    dates = pd.date_range('2000-01-01', periods=5000, freq='D')
+    frame = pd.DataFrame(rng.standard_normal((5000, 2)).cumsum(axis=0), index=dates, columns=['a', 'b'])
+    reduced = downsample_series(frame, 300)
+    keep = downsample_indices(dates, [frame['a'].to_numpy(), frame['b'].to_numpy()], 300)
+    pd.testing.assert_frame_equal(reduced, frame.iloc[keep])
+    assert len(reduced) <= 600 and reduced.index.is_monotonic_increasing
+    assert len(downsample_series(frame['a'], 300)) == 300
@@ -0,0 +1,42 @@
+import numpy as np
+import fit_store
+from fit_store import load_fit, save_fit, stored, version_queries
+from ols_grid import fit_grid, grid_statistics, predictor_combinations
+
+
+def test_grids_round_trip(store, frame):
+    grid = grid_statistics(frame, fit_grid(frame, ['y', 'x1'], predictor_combinations(['x2', 'x3'], 2)))
+    save_fit('v1', 'query', grid)
+    loaded = load_fit('v1', 'query')
+    assert loaded.keys() == grid.keys()
+    for name, value in grid.items():
+        if isinstance(value, list) and value and isinstance(value[0], np.ndarray):
+            assert len(loaded[name]) == len(value)
+            for part, original in zip(loaded[name], value):
+                np.testing.assert_array_equal(part, original)
+        elif isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(loaded[name], value)
+        else:
+            assert loaded[name] == value
+    assert load_fit('v1', 'other') is None and load_fit('v2', 'query') is None
+
+
+def test_stored_computes_once(store):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'values': np.arange(3.0), 'label': 'fit'}
+
+    for _ in range(2):
+        value = stored('v1', 'query', compute)
+    assert calls == [1] and value['label'] == 'fit'
+    assert version_queries('v1') == ['query']
+
+
+def test_old_versions_are_pruned(store, monkeypatch):
+    monkeypatch.setattr(fit_store, 'MAX_VERSIONS', 2)
+    for version in ['v1', 'v2', 'v3']:
+        save_fit(version, 'query', {'values': np.arange(3.0)})
+    assert load_fit('v1', 'query') is None and load_fit('v3', 'query') is not None
+    assert len([name for name in (store / 'fit_store').iterdir() if name.suffix == '.npz']) == 2
@@ -0,0 +1,41 @@
+import time
+import numpy as np
+from ols_grid import fit_grid, grid_statistics
+from grid_jobs import chunk_results, json_safe, submit_job, job_status, job_results, cancel_job
+
+
+def wait_for(job_id, timeout=60):
+    deadline = time.time() + timeout
+    while job_status(job_id)['status'] not in ('done', 'failed', 'cancelled'):
+        assert time.time() < deadline
+        time.sleep(0.05)
+    return job_status(job_id)
+
+
+def test_chunk_matches_grid(frame):
+    models = [(1, 'y', ['x1']), (2, 'y', ['x1', 'x2']), (3, 'x3', ['x4'])]
+    results = chunk_results(frame, models, None)
+    assert [result['model'] for result in results] == [1, 2, 3]
+    grid = grid_statistics(frame, fit_grid(frame, ['y'], [['x1', 'x2']]))
+    np.testing.assert_allclose(results[1]['stats']['rsquared'], grid['rsquared'][0])
+
+
+def test_json_safe():
+    assert json_safe({'a': [np.float64('nan'), np.int64(2)], 'b': (np.inf, 1.5)}) == {'a': [None, 2], 'b': [None, 1.5]}
+
+
+def test_job_runs_to_completion(frame):
+    job_id = submit_job(frame, ['y', 'x1'], [['x2'], ['x3'], ['x2', 'x3']])
+    status = wait_for(job_id)
+    assert status['status'] == 'done' and status['models_done'] == status['models_total'] == 6
+
+    results = job_results(job_id)
+    assert len(results['results']) == 6 and results['next_offset'] == 6
+    assert job_results(job_id, offset=4)['results'] == results['results'][4:]
+    assert job_status('unknown') is None and job_results('unknown') is None
+
+
+def test_cancelled_job_keeps_its_status(frame):
+    job_id = submit_job(frame, ['y'], [['x1']] * 64, priority=5)
+    assert cancel_job(job_id)['status'] == 'cancelled'
+    assert wait_for(job_id)['status'] == 'cancelled'
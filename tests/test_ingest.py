@@ -0,0 +1,45 @@
+import io
+import numpy as np
+import pytest
+import ingest
+from column_store import load_dataset, dataset_frame, dataset_column
+from ingest import float32_safe, ingest_file
+
+
+def csv_file(frame):
+    return io.StringIO(frame.reset_index().to_csv(index=False))
+
+
+def test_chunked_csv_is_stored_sorted(store, frame, monkeypatch):
+    monkeypatch.setattr(ingest, 'CHUNK_ROWS', 30)
+    shuffled = frame.round(3).sample(frac=1, random_state=1)
+    name = ingest_file(csv_file(shuffled), 'walks.csv', 'sample')
+    assert name.startswith('sample-')
+    stored = dataset_frame(load_dataset(name))
+    np.testing.assert_allclose(stored.to_numpy(), frame.round(3).to_numpy(), rtol=1e-6)
+    assert stored.index.is_monotonic_increasing and stored.index.name == 'date'
+
+
+def test_rows_with_gaps_are_dropped_and_text_columns_ignored(store, frame):
+    frame = frame.round(3).assign(label='a')
+    frame.iloc[5, 0] = np.nan
+    text = csv_file(frame).getvalue().replace('2020-01-10', 'not a date')
+    name = ingest_file(io.StringIO(text), 'walks.csv', 'sample', as_column=True)
+    dataset = load_dataset(name)
+    assert dataset['columns'] == ['y', 'x1', 'x2', 'x3', 'x4'] and len(dataset['dates']) == 198
+    assert list(dataset_frame(dataset).columns)[0] == 'date'
+
+
+def test_columns_are_compacted_only_when_lossless(store, frame):
+    frame = frame.assign(x1=frame['x1'].round(2))
+    name = ingest_file(csv_file(frame), 'walks.csv', 'sample')
+    dataset = load_dataset(name)
+    assert dataset_column(dataset, 'x1').dtype == np.float32 and dataset_column(dataset, 'y').dtype == np.float64
+    assert float32_safe(np.array([0.0, 1.5, -2.25, np.nan])) and not float32_safe(np.array([0.1234567891]))
+
+
+@pytest.mark.parametrize('text', ['', 'day,y,x\n2020-01-01,1,2\n', 'date,y\n2020-01-01,1\n', 'date,y,x\nbad,1,2\n'])
+def test_unusable_files_are_rejected(store, text):
+    with pytest.raises(ValueError):
+        ingest_file(io.StringIO(text), 'upload.csv', 'sample')
+    assert not list((store / 'datasets').glob('*'))
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import statsmodels.api as sm
+import ols_grid
+from statsmodels.stats.stattools import durbin_watson
+from ols_grid import (window_gram, fit_grid, fit_subset, stack_models, grid_statistics, grid_residuals, predictor_combinations,
+                      request_grid, merge_gram, screen_models, filter_threshold)
+
+
+def statsmodels_fit(frame, dep_var, ind_vars):
+    return sm.OLS(frame[dep_var], sm.add_constant(frame[ind_vars], has_constant='add')).fit()
+
+
+def test_grid_matches_statsmodels(frame):
+    dep_vars = ['y', 'x4']
+    combinations = predictor_combinations(['x1', 'x2', 'x3'], 3)
+    grid = grid_statistics(frame, fit_grid(frame, dep_vars, combinations))
+
+    i = 0
+    for dep_var in dep_vars:
+        for ind_vars in combinations:
+            reference = statsmodels_fit(frame, dep_var, ind_vars)
+            assert grid['dependent'][i] == dep_var and grid['predictors'][i] == ind_vars
+            np.testing.assert_allclose(grid['params'][i], reference.params, rtol=1e-8)
+            np.testing.assert_allclose(grid['bse'][i], reference.bse, rtol=1e-8)
+            np.testing.assert_allclose(grid['pvalues'][i], reference.pvalues, rtol=1e-6, atol=1e-12)
+            for name in ['ssr', 'rsquared', 'rsquared_adj', 'aic', 'bic', 'fvalue', 'df_resid']:
+                np.testing.assert_allclose(grid[name][i], getattr(reference, name), rtol=1e-8, err_msg=name)
+            np.testing.assert_allclose(grid['durbin_watson'][i], durbin_watson(reference.resid), rtol=1e-8)
+            np.testing.assert_allclose(grid['max_abs_resid'][i], np.abs(reference.resid).max(), rtol=1e-8)
+            i += 1
+
+
+def test_grid_residuals_of_selected_models(frame):
+    grid = fit_grid(frame, ['y'], predictor_combinations(['x1', 'x2', 'x3'], 2))
+    every = grid_residuals(frame, grid)
+    np.testing.assert_allclose(grid_residuals(frame, grid, [4, 1]), every[:, [4, 1]])
+    reference = statsmodels_fit(frame, 'y', grid['predictors'][1])
+    np.testing.assert_allclose(every[:, 1], reference.resid, atol=1e-8)
+
+
+def test_collinear_predictors_follow_statsmodels(frame):
+    frame = frame.assign(x5=frame['x1'] + frame['x2'])
+    model = stack_models([fit_subset(window_gram(frame, list(frame.columns)), 'y', ['x1', 'x2', 'x5'])])
+    reference = statsmodels_fit(frame, 'y', ['x1', 'x2', 'x5'])
+
+    # The pseudo-inverse gives the same fit and rank-based degrees of freedom instead of raising
+    assert model['df_resid'][0] == reference.df_resid
+    np.testing.assert_allclose(model['ssr'][0], reference.ssr, rtol=1e-8)
+    np.testing.assert_allclose(model['params'][0], reference.params, rtol=1e-6, atol=1e-8)
+
+
+@pytest.mark.parametrize('rows', [1, 2, 3])
+def test_window_shorter_than_model(frame, rows):
+    window = frame.iloc[:rows]
+    grid = grid_statistics(window, fit_grid(window, ['y'], [['x1', 'x2']]))
+    assert grid['df_resid'][0] <= 0 and np.isnan(grid['scale'][0])
+    assert len(screen_models(window, grid, p_stat=0.5, adf_pstat=0.5)) == 0
+
+
+def test_merge_gram_matches_full_window(frame):
+    columns = list(frame.columns)
+    head, tail = frame.iloc[:150], frame.iloc[150:]
+    merged = merge_gram(window_gram(head, columns), tail[columns].to_numpy(dtype=float))
+    full = window_gram(frame, columns)
+    assert merged['nobs'] == full['nobs']
+    np.testing.assert_allclose(merged['means'], full['means'], rtol=1e-10)
+    np.testing.assert_allclose(merged['cross'], full['cross'], rtol=1e-10)
+
+
+def test_residual_statistics_in_blocks(frame, monkeypatch):
+    grid = fit_grid(frame, ['y', 'x4'], predictor_combinations(['x1', 'x2', 'x3'], 3))
+    resid = grid_residuals(frame, grid)
+
+    # Blocks of three models at a time give the same diagnostics as the whole residual matrix
+    monkeypatch.setattr(ols_grid, 'RESIDUAL_BLOCK_BYTES', 3 * 8 * len(frame))
+    grid = grid_statistics(frame, grid)
+    np.testing.assert_allclose(grid['durbin_watson'], np.sum(np.diff(resid, axis=0) ** 2, axis=0) / np.sum(resid ** 2, axis=0))
+    np.testing.assert_allclose(grid['max_abs_resid'], np.abs(resid).max(axis=0))
+
+
+def test_filter_threshold():
+    assert filter_threshold(None) is None and filter_threshold('  ') is None
+    assert filter_threshold(' 0.05 ') == 0.05
+    with pytest.raises(ValueError):
+        filter_threshold('abc')
+
+
+def test_request_grid_stays_within_cap():
+    columns = [f'c{i}' for i in range(20)]
+    dep_vars, combinations = request_grid(columns, max_size=3, max_models=500)
+    assert dep_vars == columns
+    assert len(dep_vars) * len(combinations) <= 500
+    assert max(len(combination) for combination in combinations) == 1
+
+    dep_vars, combinations = request_grid(columns, 'c0', ['c1', 'c2', 'c3'])
+    assert dep_vars == ['c0'] and len(combinations) == 7
+
+    with pytest.raises(ValueError):
+        request_grid([f'c{i}' for i in range(40)], max_models=500)
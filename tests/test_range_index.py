@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from range_index import build_index, sync_index, window_bounds, index_gram, get_index
+from ols_grid import window_gram
+
+
+def test_prefix_sums_match_window_gram(frame):
+    data = frame.reset_index()
+    index = build_index(data)
+    for start, end in [('2020-01-01', '2020-07-18'), ('2020-02-10', '2020-02-20'), ('2020-03-05', '2020-03-05')]:
+        i, j = window_bounds(index, start, end)
+        gram = index_gram(index, i, j)
+        window = frame.loc[start:end]
+        reference = window_gram(window, list(frame.columns))
+        assert (i, j) == (data['date'].searchsorted(pd.Timestamp(start)), i + len(window))
+        assert gram['nobs'] == reference['nobs']
+        np.testing.assert_allclose(gram['means'], reference['means'], rtol=1e-10)
+        np.testing.assert_allclose(gram['cross'], reference['cross'], rtol=1e-8, atol=1e-8)
+
+
+def test_sync_extends_appended_rows(frame):
+    data = frame.reset_index()
+    index = build_index(data.iloc[:120])
+    sync_index(index, data)
+    rebuilt = build_index(data)
+
+    # The extended index keeps its original shift, so only the window sums are compared
+    assert len(index['dates']) == len(data)
+    for i, j in [(0, 200), (100, 180), (130, 131)]:
+        np.testing.assert_allclose(index_gram(index, i, j)['cross'], index_gram(rebuilt, i, j)['cross'], rtol=1e-8, atol=1e-8)
+
+
+def test_get_index_shares_and_extends_query_indexes(frame):
+    data = frame.reset_index()
+    rows, index = get_index(data.iloc[:150], 'shared', 'v1', ['y', 'x1'])
+
+    # Only the query's columns are indexed, and the same query reuses the index
+    assert index['columns'] == ['y', 'x1'] and index['cum'].shape == (151, 3, 3)
+    assert get_index(data.iloc[:150], 'shared', 'v1', ['y', 'x1', 'y'])[1] is index
+
+    # Appended rows extend the cached index of the next version
+    rows, extended = get_index(data, 'shared', 'v2', ['y', 'x1'])
+    assert extended is index and len(rows) == 200
+    reference = window_gram(frame.iloc[120:200], ['y', 'x1'])
+    np.testing.assert_allclose(index_gram(extended, 120, 200)['cross'], reference['cross'], rtol=1e-8, atol=1e-8)
+
+
+def test_get_index_drops_rows_missing_a_query_column(frame):
+    data = frame.reset_index()
+    data.loc[:9, 'x2'] = np.nan
+    rows, index = get_index(data, 'gaps', 'v1', ['y', 'x2'])
+    assert len(rows) == 190 and rows['date'].iloc[0] == data['date'].iloc[10]
+    assert len(get_index(data, 'gaps', 'v1', ['y', 'x1'])[0]) == 200
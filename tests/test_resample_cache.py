@@ -0,0 +1,24 @@
+import numpy as np
+from range_index import get_index
+from resample_cache import build_pyramid
+
+
+def test_levels_never_look_ahead(frame):
+    level = build_pyramid(frame.reset_index())['levels']['weekly']
+    weekly = frame['x1'].resample('W').last()
+    # Days before the first week end have no aggregate yet
+    expected = weekly.reindex(frame.index, method='ffill')
+    np.testing.assert_allclose(level['x1@weekly'].to_numpy(), expected.to_numpy())
+
+
+def test_missing_rows_are_dropped_per_query(frame):
+    frame = frame.reset_index()
+    frame.loc[:59, 'x4'] = np.nan
+    level = build_pyramid(frame)['levels']['monthly']
+
+    # A gap in a column the query does not use costs it no rows
+    rows, _ = get_index(level, 'pyramid-test@monthly', 0, ['y', 'x1@monthly'])
+    assert len(rows) == level['x1@monthly'].notna().sum() and rows['date'].min() < frame['date'][60]
+
+    rows, _ = get_index(level, 'pyramid-test@monthly', 0, ['y', 'x4@monthly'])
+    assert rows['x4@monthly'].notna().all() and len(rows) < level['x1@monthly'].notna().sum()
@@ -0,0 +1,50 @@
+import datetime
+import numpy as np
+from result_cache import new_cache, query_key, cached, cache_entries, seed_cache, clear_cache, cache_stats
+
+
+def test_hits_are_kept_per_version():
+    cache = new_cache(8, 1024)
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value
+
+    assert cached(cache, 'v1', 'key', lambda: compute(1)) == 1
+    assert cached(cache, 'v1', 'key', lambda: compute(2)) == 1
+    assert cached(cache, 'v2', 'key', lambda: compute(3)) == 3
+    assert calls == [1, 3]
+    assert cache_stats(cache)['hits'] == 1 and cache_stats(cache)['misses'] == 2
+    assert cache_entries(cache, 'v1') == [('key', 1)]
+
+
+def test_least_recently_used_entries_are_evicted_by_count_and_bytes():
+    cache = new_cache(2, 1000)
+    for key in 'abc':
+        cached(cache, 'v', key, lambda: key)
+        cached(cache, 'v', 'a', lambda: 'missed')
+    assert [key for key, _ in cache_entries(cache, 'v')] == ['c', 'a']
+
+    cached(cache, 'v', 'big', lambda: np.zeros(100))
+    cached(cache, 'v', 'bigger', lambda: np.zeros(100))
+    assert [key for key, _ in cache_entries(cache, 'v')] == ['bigger']
+    assert cache_stats(cache)['bytes'] == 800
+
+    # A value over the whole budget is returned but never stored
+    assert len(cached(cache, 'v', 'huge', lambda: np.zeros(200))) == 200
+    assert [key for key, _ in cache_entries(cache, 'v')] == ['bigger']
+
+
+def test_seeded_entries_do_not_replace_computed_ones():
+    cache = new_cache(8, 1024)
+    cached(cache, 'v', 'a', lambda: 'computed')
+    seed_cache(cache, 'v', [('a', 'seeded'), ('b', 'seeded')])
+    assert dict(cache_entries(cache, 'v')) == {'a': 'computed', 'b': 'seeded'}
+    clear_cache(cache)
+    assert cache_stats(cache)['entries'] == 0 and cache_stats(cache)['bytes'] == 0
+
+
+def test_query_key_is_stable():
+    assert query_key('grid', ['y'], [['x1']], datetime.date(2020, 1, 1)) == query_key('grid', ['y'], [['x1']], '2020-01-01')
+    assert query_key('grid', ['y'], [['x1']]) != query_key('grid', ['y'], [['x2']])
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import statsmodels.api as sm
+from statsmodels.regression.rolling import RollingOLS
+from rolling_ols import rolling_ols
+
+
+def reference_fit(frame, predictors, window, expanding=False):
+    model = RollingOLS(frame['y'], sm.add_constant(frame[predictors]), window=window, expanding=expanding)
+    return model.fit()
+
+
+@pytest.mark.parametrize('window', [10, 50])
+def test_rolling_matches_statsmodels(frame, window):
+    result = rolling_ols(frame, 'y', ['x1', 'x2'], window=window, refresh=7)
+    reference = reference_fit(frame, ['x1', 'x2'], window)
+    np.testing.assert_allclose(result['params'].to_numpy(), reference.params.to_numpy()[window - 1:], rtol=1e-7)
+    np.testing.assert_allclose(result['tvalues'].to_numpy(), reference.tvalues.to_numpy()[window - 1:], rtol=1e-6)
+    np.testing.assert_allclose(result['rsquared'].to_numpy(), reference.rsquared.to_numpy()[window - 1:], rtol=1e-7)
+    assert result['params'].index[0] == frame.index[window - 1]
+
+
+def test_expanding_matches_statsmodels(frame):
+    result = rolling_ols(frame, 'y', ['x1', 'x2', 'x3'], min_nobs=10)
+    reference = RollingOLS(frame['y'], sm.add_constant(frame[['x1', 'x2', 'x3']]), window=len(frame), min_nobs=10, expanding=True).fit()
+    np.testing.assert_allclose(result['params'].to_numpy(), reference.params.to_numpy()[9:], rtol=1e-7)
+    np.testing.assert_allclose(result['rsquared'].to_numpy(), reference.rsquared.to_numpy()[9:], rtol=1e-7)
+
+
+def test_collinear_windows_are_nan(frame):
+    # A weekly predictor is constant inside windows shorter than a week, like a coarse pyramid level
+    frame = frame.assign(weekly=frame['x1'].resample('W').last().reindex(frame.index, method='bfill'))
+    window = 5
+    result = rolling_ols(frame, 'y', ['x2', 'weekly'], window=window)
+    reference = reference_fit(frame, ['x2', 'weekly'], window)
+
+    weekly = frame['weekly'].to_numpy()
+    constant = np.array([np.ptp(weekly[end - window:end]) == 0 for end in range(window, len(frame) + 1)])
+    assert constant.any() and not constant.all()
+    assert result['params'].to_numpy()[constant].size and np.isnan(result['params'].to_numpy()[constant]).all()
+    assert np.isnan(result['rsquared'].to_numpy()[constant]).all()
+
+    # Windows after a singular one start again from a fresh inverse
+    np.testing.assert_allclose(result['params'].to_numpy()[~constant], reference.params.to_numpy()[window - 1:][~constant], rtol=1e-6)
+
+
+def test_window_longer_than_data(frame):
+    with pytest.raises(ValueError):
+        rolling_ols(frame.iloc[:5], 'y', ['x1'], window=10)
@@ -0,0 +1,78 @@
+import threading
+import time
+import pytest
+from single_flight import single_flight, flight_stats
+
+
+def run_together(count, key, compute, timeout=10):
+    """Outcome of count threads calling single_flight(key, compute) at once"""
+    outcomes = [None] * count
+
+    def call(i):
+        try:
+            outcomes[i] = single_flight(key, compute, timeout)
+        except Exception as error:
+            outcomes[i] = error
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_concurrent_callers_share_one_computation():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(10)
+        return 'value'
+
+    before = flight_stats()['coalesced']
+    threads, outcomes = run_together(4, 'shared', compute)
+    started.wait(10)
+    # Give the other callers time to find the running computation
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert outcomes == ['value'] * 4 and calls == [1]
+    assert flight_stats() == {'in_flight': 0, 'coalesced': before + 3}
+
+
+def test_errors_reach_every_waiter():
+    started, release = threading.Event(), threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(10)
+        raise ValueError('bad fit')
+
+    threads, outcomes = run_together(3, 'failing', compute)
+    started.wait(10)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+    # The failed flight is forgotten, so the next caller computes again
+    assert single_flight('failing', lambda: 'retried') == 'retried'
+
+
+def test_waiters_time_out():
+    started, release = threading.Event(), threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(10)
+        return 'late'
+
+    leader, outcomes = run_together(1, 'slow', compute)
+    started.wait(10)
+    with pytest.raises(TimeoutError):
+        single_flight('slow', compute, timeout=0.05)
+    release.set()
+    leader[0].join(10)
+    assert outcomes == ['late']
@@ -0,0 +1,77 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from ols_grid import window_gram
+from subset_search import best_subsets, search_grid, search_request
+
+
+def subset_rss(cross, d, s):
+    """RSS of column d regressed on columns s, solved directly from the centered cross-products"""
+    xty = cross[s, d]
+    coef = np.linalg.lstsq(cross[np.ix_(s, s)], xty, rcond=None)[0]
+    return max(cross[d, d] - coef @ xty, 0.0)
+
+
+def brute_force(gram, dep_var, candidates, max_size, k):
+    """RSS of the best k subsets of every size, from every subset"""
+    position = {column: i for i, column in enumerate(gram['columns'])}
+    d = position[dep_var]
+    best = {}
+    for size in range(1, max_size + 1):
+        scores = sorted(subset_rss(gram['cross'], d, [position[column] for column in subset])
+                        for subset in itertools.combinations(candidates, size))
+        best[size] = scores[:k]
+    return best
+
+
+def test_matches_exhaustive_search(frame):
+    rng = np.random.default_rng(3)
+    frame = frame.assign(**{f'z{i}': rng.standard_normal(len(frame)).cumsum() for i in range(5)})
+    gram = window_gram(frame, list(frame.columns))
+    candidates = [column for column in frame.columns if column != 'y']
+    found = best_subsets(gram, 'y', candidates, 4, 3)
+    expected = brute_force(gram, 'y', candidates, 4, 3)
+    for size in expected:
+        np.testing.assert_allclose([rss for rss, _ in found[size]], expected[size], rtol=1e-9)
+        assert all(len(subset) == size for _, subset in found[size])
+
+
+def test_constant_and_collinear_candidates(frame):
+    frame = frame.assign(flat=1.0, x5=frame['x1'] - frame['x2'])
+    gram = window_gram(frame, list(frame.columns))
+    candidates = [column for column in frame.columns if column != 'y']
+    found = best_subsets(gram, 'y', candidates, 3, 2)
+    expected = brute_force(gram, 'y', candidates, 3, 2)
+    for size in expected:
+        np.testing.assert_allclose([rss for rss, _ in found[size]], expected[size], rtol=1e-8, atol=1e-8)
+
+
+def test_search_grid_stays_within_candidates(frame):
+    grid = search_grid(frame, ['y'], 2, 2, candidates=['x1', 'x2', 'x3'])
+    assert set(grid['dependent']) == {'y'}
+    assert all(set(predictors) <= {'x1', 'x2', 'x3'} for predictors in grid['predictors'])
+    assert len(grid['dependent']) == 4
+
+
+def test_correlated_random_walks_match_exhaustive_search():
+    rng = np.random.default_rng(4)
+    frame = pd.DataFrame(rng.standard_normal((500, 16)).cumsum(axis=0), columns=[f'c{i}' for i in range(16)])
+    gram = window_gram(frame, list(frame.columns))
+    candidates = list(frame.columns[1:])
+    found = best_subsets(gram, 'c0', candidates, 3, 4)
+    expected = brute_force(gram, 'c0', candidates, 3, 4)
+    for size in expected:
+        np.testing.assert_allclose([rss for rss, _ in found[size]], expected[size], rtol=1e-9)
+
+
+def test_search_request_bounds_the_returned_models():
+    columns = [f'c{i}' for i in range(35)]
+    dep_vars, candidates = search_request(columns, max_size=3, k=5)
+    assert dep_vars == columns and candidates == columns
+
+    dep_vars, candidates = search_request(columns, 'c0', ['c1', 'c2'])
+    assert dep_vars == ['c0'] and candidates == ['c1', 'c2']
+
+    with pytest.raises(ValueError):
+        search_request(columns, max_size=4, k=10)
@@ -0,0 +1,94 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Histograms of this process by (metric, label name, label value); counts only grow, as Prometheus expects
+histograms = {}
+histograms_lock = threading.Lock()
+
+# Stages timed so far in the request handled by this thread
+current = threading.local()
+
+
+def new_histogram():
+    """Empty histogram over BUCKETS plus the +Inf bucket"""
+    return {'counts': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+
+
+def record(metric, label, value, seconds):
+    """Add one duration to a histogram"""
+    position = bisect.bisect_left(BUCKETS, seconds)
+    with histograms_lock:
+        histogram = histograms.get((metric, label, value))
+        if histogram is None:
+            histogram = histograms[(metric, label, value)] = new_histogram()
+        histogram['counts'][position] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+
+def observe(name, seconds):
+    """Record one run of stage name, in the stage histogram and in the current request's timings"""
+    record('stage_seconds', 'stage', name, seconds)
+    stages = getattr(current, 'stages', None)
+    if stages is not None:
+        total, count = stages.get(name, (0.0, 0))
+        stages[name] = (total + seconds, count + 1)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as one run of stage name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def start_request():
+    """Begin collecting the stages of the request handled by this thread"""
+    current.stages = {}
+    current.started = time.perf_counter()
+
+
+def finish_request(route):
+    """Record the request's duration so far under route and return its Server-Timing header value
+
+    Streamed responses send their headers before the body is produced, so their header covers the time to
+    the first byte; stages run while streaming still reach the histograms.
+    """
+    stages = getattr(current, 'stages', None)
+    if stages is None:
+        return ''
+    elapsed = time.perf_counter() - current.started
+    current.stages = None
+    record('request_seconds', 'route', route, elapsed)
+
+    # Durations in milliseconds; a stage run more than once in the request gives its count as the description
+    entries = [f'{name};dur={total * 1000:.2f}' + (f';desc="{count}x"' if count > 1 else '')
+               for name, (total, count) in stages.items()]
+    entries.append(f'total;dur={elapsed * 1000:.2f}')
+    return ', '.join(entries)
+
+
+def histogram_lines(prefix):
+    """Prometheus text lines of every histogram"""
+    with histograms_lock:
+        snapshot = sorted((key, dict(histogram, counts=list(histogram['counts']))) for key, histogram in histograms.items())
+    lines = []
+    for metric in sorted({metric for (metric, _, _), _ in snapshot}):
+        name = f'{prefix}_{metric}'
+        lines.append(f'# TYPE {name} histogram')
+        for (_, label, value), histogram in (item for item in snapshot if item[0][0] == metric):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{label}="{value}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{name}_count{{{label}="{value}"}} {histogram["count"]}')
+    return lines